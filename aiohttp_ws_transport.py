@@ -2,6 +2,7 @@
 import asyncio
 import logging
 from aiohttp import web,WSMsgType,ClientWebSocketResponse
+from protocol import HANDSHAKE_HEADER
 
 logger=logging.getLogger(__name__)
 
@@ -12,7 +13,7 @@ class AiohttpClientWebSocket:
         self._closed=False
         self.close_code=None
     async def send(self,data):
-        if isinstance(data,bytes):
+        if isinstance(data,(bytes,bytearray,memoryview)):
             await self._ws.send_bytes(data)
         else:
             await self._ws.send_str(data)
@@ -24,7 +25,7 @@ class AiohttpClientWebSocket:
             return msg.data
         elif msg.type in (WSMsgType.CLOSE,WSMsgType.CLOSED,WSMsgType.CLOSING):
             self._closed=True
-            self.close_code=1000
+            self.close_code=self._ws.close_code or 1000
             raise ConnectionError("WebSocket closed")
         elif msg.type==WSMsgType.ERROR:
             raise ConnectionError(f"WebSocket error: {self._ws.exception()}")
@@ -32,9 +33,10 @@ class AiohttpClientWebSocket:
     async def close(self):
         if not self._closed:
             await self._ws.close()
-            await self._session.close()
             self._closed=True
             self.close_code=1000
+        if not self._session.closed:
+            await self._session.close()
     def __aiter__(self):
         return self
     async def __anext__(self):
@@ -49,6 +51,7 @@ class AiohttpWebSocketAdapter:
         self._request=request
         self._closed=False
         self.close_code=None
+        self.early_handshake=request.headers.get(HANDSHAKE_HEADER)
     @property
     def remote_address(self):
         peername=self._request.transport.get_extra_info('peername')
@@ -56,7 +59,7 @@ class AiohttpWebSocketAdapter:
             return (peername[0],peername[1])
         return ('unknown',0)
     async def send(self,data):
-        if isinstance(data,bytes):
+        if isinstance(data,(bytes,bytearray,memoryview)):
             await self._ws.send_bytes(data)
         else:
             await self._ws.send_str(data)
@@ -73,11 +76,11 @@ class AiohttpWebSocketAdapter:
         elif msg.type==WSMsgType.ERROR:
             raise ConnectionError(f"WebSocket error: {self._ws.exception()}")
         return b""
-    async def close(self):
+    async def close(self,code=1000):
         if not self._closed:
-            await self._ws.close()
+            await self._ws.close(code=code)
             self._closed=True
-            self.close_code=1000
+            self.close_code=code
     def __aiter__(self):
         return self
     async def __anext__(self):
@@ -103,7 +106,7 @@ async def start_aiohttp_ws_server(ghost_server):
     app.router.add_get(ghost_server.config.websocket_path,websocket_handler)
     runner=web.AppRunner(app)
     await runner.setup()
-    site=web.TCPSite(runner,ghost_server.config.listen_host,ghost_server.config.listen_port)
+    site=web.TCPSite(runner,ghost_server.config.listen_host,ghost_server.config.listen_port,reuse_port=True if ghost_server.shard else None)
     await site.start()
     logger.info(f"aiohttp WebSocket server listening on {ghost_server.config.listen_host}:{ghost_server.config.listen_port}")
     await ghost_server.shutdown_event.wait()
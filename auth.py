@@ -5,6 +5,11 @@ from nanoid import generate
 def generate_token():
     return generate(size=20)
 
+def expected_token_key(expected_token,auth_salt):
+    return hashlib.pbkdf2_hmac("sha256",expected_token.encode(),auth_salt,100000,32)
+
+def validate_token_key(token_bytes,expected_key):
+    return secrets.compare_digest(token_bytes,expected_key)
+
 def validate_token(token_bytes,expected_token,auth_salt):
-    expected=hashlib.pbkdf2_hmac("sha256",expected_token.encode(),auth_salt,100000,32)
-    return secrets.compare_digest(token_bytes,expected)
+    return validate_token_key(token_bytes,expected_token_key(expected_token,auth_salt))
@@ -6,18 +6,26 @@ import sys
 import time
 import struct
 import argparse
+import os
 import random
 import ssl
 import base64
+import multiprocessing
 import aiohttp
 from urllib.parse import urlparse,unquote
 from nanoid import generate
 from protocol import *
+from outbound import OutboundQueue,BatchPolicy
+from memory import governor,recv_pool,BudgetedQueue,BudgetedBuffers
+from flowcontrol import ConnWindows
+from tcp_protocol import TunnelProtocol
 from config import ClientConfig
 from tunnel import TunnelManager
+from eventloop import new_event_loop
 from updater import Updater
 from aiohttp_ws_transport import AiohttpClientWebSocket
 from udp_transport import UDPClientTransport,UDPWriterAdapter,_UDPDataProtocol as UDPDataProtocol
+from compression import PayloadCompressor,supported_features,pick_codec,codec_name,get_compression_stats
 
 logging.basicConfig(level=logging.INFO,format="%(asctime)s [%(levelname)s] %(message)s")
 logger=logging.getLogger(__name__)
@@ -41,6 +49,13 @@ class GhostWireClient:
         self.udp_transport=None
         self.direct_listeners=[]
         self.key=None
+        self.main_nonces=(None,None)
+        self.implicit_nonces=False
+        self.compression_codec=None
+        self.cipher=CIPHER_AESGCM
+        self.resume_ticket=None
+        self.server_features=set()
+        self.pinned_server_key=None
         self.running=False
         self.reconnect_delay=config.initial_delay
         self.send_queue=None
@@ -53,30 +68,25 @@ class GhostWireClient:
         self.last_rx_time=0
         self.ping_interval=config.ping_interval
         self.ping_timeout=config.ping_timeout
-        self.conn_write_queues={}
-        self.conn_write_tasks={}
         self.connect_tasks=set()
         self.connect_semaphore=asyncio.Semaphore(1024)
-        self.preconnect_buffers={}
+        self.preconnect_buffers=BudgetedBuffers("preconnect",16)
+        self.conn_windows=ConnWindows()
         self.connected_server_url=""
-        self.child_channels={}
-        self.conn_channel_map={}
+        self.child_channels=self.tunnel_manager.channels
         self.channel_recv_tasks={}
         self.channel_sender_tasks={}
         self.channel_stop_events={}
         self.child_worker_tasks={}
         self.desired_child_count=0
-        self.data_rr_index=0
-        self.conn_data_tx_seq={}
-        self.conn_data_seq_enabled=set()
-        self.conn_data_rx_expected={}
-        self.conn_data_rx_pending={}
-        self.conn_data_rx_wait_start={}
-        self.conn_data_close_seq={}
         self.seq_timeout=30
-        self.io_chunk_size=262144
+        self.io_chunk_size=IO_CHUNK_SIZE
+        self.read_view=memoryview(bytearray(self.io_chunk_size))
         self.writer_batch_bytes=262144
         self.ws_send_batch_bytes=config.ws_send_batch_bytes
+        governor.configure(config.memory_budget_mb*1048576)
+        self.recv_pool=recv_pool
+        self.recv_pool.configure(config.recv_pool_mb*1048576)
         self.ws_write_limit=4194304
         self.ws_max_queue=2048
         self.updater=Updater("client",check_interval=config.update_check_interval,check_on_startup=config.update_check_on_startup,http_proxy=config.update_http_proxy,https_proxy=config.update_https_proxy,service_name=config.service_name)
@@ -142,11 +152,8 @@ class GhostWireClient:
         return reader,writer
 
     def clear_conn_writers(self):
-        for conn_id,task in list(self.conn_write_tasks.items()):
-            if not task.done():
-                task.cancel()
-        self.conn_write_tasks.clear()
-        self.conn_write_queues.clear()
+        self.tunnel_manager.clear_writers()
+        self.conn_windows.reset()
         for task in list(self.connect_tasks):
             if not task.done():
                 task.cancel()
@@ -167,12 +174,7 @@ class GhostWireClient:
         self.child_worker_tasks.clear()
         self.desired_child_count=0
         self.child_channels.clear()
-        self.conn_channel_map.clear()
-        self.conn_data_tx_seq.clear()
-        self.conn_data_seq_enabled.clear()
-        self.conn_data_rx_expected.clear()
-        self.conn_data_rx_pending.clear()
-        self.conn_data_close_seq.clear()
+        self.tunnel_manager.clear_channels()
 
     def spawn_connect_task(self,conn_id,remote_ip,remote_port):
         task=asyncio.create_task(self.handle_connect(conn_id,remote_ip,remote_port))
@@ -204,8 +206,9 @@ class GhostWireClient:
             self.clear_conn_data_state(conn_id)
             error_msg=await pack_error(conn_id,str(e),self.key)
             try:
-                if self.control_queue:
-                    self.control_queue.put_nowait(error_msg)
+                control_queue=self.conn_control_queue(conn_id)
+                if control_queue:
+                    control_queue.put_nowait(error_msg)
             except (asyncio.QueueFull,AttributeError):
                 pass
 
@@ -223,7 +226,7 @@ class GhostWireClient:
                 send_queue=channel.get("send_queue") if channel else None
                 if not send_queue:
                     break
-                message=await pack_data(conn_id,data,self.key)
+                message=data_frame(conn_id,data)
                 try:
                     send_queue.put_nowait(message)
                 except asyncio.QueueFull:
@@ -232,23 +235,23 @@ class GhostWireClient:
             logger.debug(f"UDP response forward error for {conn_id}: {e}")
         finally:
             try:
-                channel_id=self.conn_channel_map.get(conn_id,"main")
+                channel_id=self.tunnel_manager.get_channel(conn_id,"main")
                 channel=self.get_channel(channel_id)
                 control_queue=channel.get("control_queue") if channel else None
                 if control_queue:
-                    control_queue.put_nowait(await pack_close(conn_id,0,self.key))
+                    control_queue.put_nowait(close_frame(conn_id,0))
             except:
                 pass
-            self.conn_channel_map.pop(conn_id,None)
+            self.tunnel_manager.pop_channel(conn_id)
             self.clear_conn_data_state(conn_id)
             self.tunnel_manager.remove_connection(conn_id)
 
     async def close_conn_writer(self,conn_id,flush=False):
-        queue=self.conn_write_queues.get(conn_id)
-        task=self.conn_write_tasks.get(conn_id)
+        state=self.tunnel_manager.conns.get(conn_id)
+        queue=state.write_queue if state else None
+        task=state.write_task if state else None
         if not queue or not task:
-            self.conn_write_queues.pop(conn_id,None)
-            self.conn_write_tasks.pop(conn_id,None)
+            self.tunnel_manager.pop_writer(conn_id)
             return
         if flush:
             try:
@@ -263,8 +266,7 @@ class GhostWireClient:
             await asyncio.wait_for(task,timeout=2)
         except:
             task.cancel()
-        self.conn_write_queues.pop(conn_id,None)
-        self.conn_write_tasks.pop(conn_id,None)
+        self.tunnel_manager.pop_writer(conn_id)
 
     async def conn_writer_loop(self,conn_id,writer,queue):
         try:
@@ -289,6 +291,7 @@ class GhostWireClient:
                     written+=len(p)
                     queue.task_done()
                 await asyncio.wait_for(writer.drain(),timeout=15)
+                self.grant_window(conn_id,written)
         except asyncio.CancelledError:
             logger.debug(f"Writer task canceled for {conn_id}")
         except asyncio.TimeoutError:
@@ -296,220 +299,214 @@ class GhostWireClient:
         except Exception as e:
             logger.debug(f"Writer loop error for {conn_id}: {e}")
         finally:
-            self.conn_write_queues.pop(conn_id,None)
-            self.conn_write_tasks.pop(conn_id,None)
+            self.conn_windows.finish(conn_id)
             self.clear_conn_data_state(conn_id)
             self.tunnel_manager.remove_connection(conn_id)
 
-    async def sender_task(self,websocket,send_queue,control_queue,stop_event):
+    async def sender_task(self,websocket,outbound,tx=None):
+        policy=BatchPolicy(self.ws_send_batch_bytes,self.config.batch_latency_ms/1000)
+        pool=BatchBufferPool()
         try:
-            while not stop_event.is_set() or not send_queue.empty() or not control_queue.empty():
-                batch=bytearray()
-                queue_depth=send_queue.qsize()+control_queue.qsize()
-                if queue_depth<10:
-                    adaptive_batch_size=16384
-                elif queue_depth<50:
-                    adaptive_batch_size=self.ws_send_batch_bytes
-                else:
-                    adaptive_batch_size=min(self.ws_send_batch_bytes*2,131072)
-                for _ in range(64):
-                    try:
-                        batch.extend(control_queue.get_nowait())
-                    except asyncio.QueueEmpty:
-                        break
-                while len(batch)<adaptive_batch_size:
-                    try:
-                        batch.extend(send_queue.get_nowait())
-                    except asyncio.QueueEmpty:
-                        break
-                if not batch:
-                    control_get=asyncio.create_task(control_queue.get())
-                    data_get=asyncio.create_task(send_queue.get())
-                    stop_get=asyncio.create_task(stop_event.wait())
-                    done,pending=await asyncio.wait({control_get,data_get,stop_get},return_when=asyncio.FIRST_COMPLETED)
-                    for task in pending:
-                        task.cancel()
-                    if pending:
-                        await asyncio.gather(*pending,return_exceptions=True)
-                    if stop_get in done and control_get not in done and data_get not in done:
-                        break
-                    if control_get in done:
-                        batch.extend(control_get.result())
-                    if data_get in done:
-                        batch.extend(data_get.result())
-                    while len(batch)<adaptive_batch_size:
-                        try:
-                            batch.extend(control_queue.get_nowait())
-                        except asyncio.QueueEmpty:
-                            break
-                    while len(batch)<adaptive_batch_size:
-                        try:
-                            batch.extend(send_queue.get_nowait())
-                        except asyncio.QueueEmpty:
-                            break
+            while not outbound.stop_event.is_set() or not outbound.empty():
+                if outbound.empty():
+                    await outbound.wait()
+                    continue
+                batch=await policy.collect(outbound)
                 if batch:
-                    await websocket.send(bytes(batch))
+                    if tx is not None:
+                        tx.cipher=self.cipher
+                    buffer,view=await pack_messages_into(batch,self.key,pool,tx if self.implicit_nonces else None)
+                    try:
+                        await websocket.send(view)
+                    finally:
+                        del view
+                        pool.release(buffer)
         except Exception as e:
             logger.debug(f"Sender task error: {e}")
         finally:
             logger.debug("Sender task stopped")
 
-    async def http2_sender_task(self,transport,send_queue,control_queue,stop_event):
+    async def http2_sender_task(self,transport,outbound):
+        send_queue=outbound.data
+        control_queue=outbound.control
         try:
-            while not stop_event.is_set() or not send_queue.empty() or not control_queue.empty():
+            while not outbound.stop_event.is_set() or not outbound.empty():
+                if outbound.empty():
+                    await outbound.wait()
+                    continue
                 batch=[]
                 for _ in range(64):
                     try:
                         batch.append(control_queue.get_nowait())
                     except asyncio.QueueEmpty:
                         break
-                for msg in batch:
-                    await transport.send(msg)
-                batch.clear()
                 try:
-                    msg=send_queue.get_nowait()
-                    await transport.send(msg)
+                    batch.append(send_queue.get_nowait())
                 except asyncio.QueueEmpty:
-                    control_get=asyncio.create_task(control_queue.get())
-                    data_get=asyncio.create_task(send_queue.get())
-                    stop_get=asyncio.create_task(stop_event.wait())
-                    done,pending=await asyncio.wait({control_get,data_get,stop_get},return_when=asyncio.FIRST_COMPLETED)
-                    for task in pending:
-                        task.cancel()
-                    if pending:
-                        await asyncio.gather(*pending,return_exceptions=True)
-                    if stop_get in done and control_get not in done and data_get not in done:
-                        break
-                    if control_get in done:
-                        await transport.send(control_get.result())
-                    if data_get in done:
-                        await transport.send(data_get.result())
+                    pass
+                for msg in await pack_messages(batch,self.key):
+                    await transport.send(msg)
         except Exception as e:
             logger.debug(f"HTTP/2 sender task error: {e}")
         finally:
             logger.debug("HTTP/2 sender task stopped")
 
     def clear_conn_data_state(self,conn_id):
-        self.conn_data_tx_seq.pop(conn_id,None)
-        self.conn_data_seq_enabled.discard(conn_id)
-        self.conn_data_rx_expected.pop(conn_id,None)
-        self.conn_data_rx_pending.pop(conn_id,None)
-        self.conn_data_rx_wait_start.pop(conn_id,None)
-        self.conn_data_close_seq.pop(conn_id,None)
+        self.conn_windows.discard(conn_id)
+        self.tunnel_manager.clear_data(conn_id)
 
     def get_available_child_ids(self):
-        return [child_id for child_id,channel in self.child_channels.items() if channel.get("ws") and getattr(channel.get("ws"),"close_code",None) is None]
+        return self.child_channels.available_ids()
 
     def should_stripe_data(self):
-        return self.config.ws_pool_stripe and self.config.protocol in ("websocket","aiohttp-ws") and self.desired_child_count>1 and len(self.get_available_child_ids())>1
-
-    def next_data_seq(self,conn_id):
-        seq=self.conn_data_tx_seq.get(conn_id,0)
-        self.conn_data_tx_seq[conn_id]=seq+1
-        return seq
+        return self.config.ws_pool_stripe and self.config.protocol in ("websocket","aiohttp-ws") and FEATURE_SHARDED not in self.server_features and self.desired_child_count>1 and self.child_channels.available_count()>1
 
     def pick_data_channel(self,conn_id):
         if self.should_stripe_data():
-            child_ids=self.get_available_child_ids()
-            if child_ids:
-                return min(child_ids,key=lambda cid: self.child_channels[cid]["send_queue"].qsize() if self.child_channels.get(cid) and self.child_channels[cid].get("send_queue") else float("inf"))
-        return self.conn_channel_map.get(conn_id,"main")
+            child_id=self.child_channels.least_queued("send_queue")
+            if child_id:
+                return child_id
+        return self.tunnel_manager.get_channel(conn_id,"main")
 
     def pick_control_channel(self):
         if self.config.ws_pool_enabled and self.config.protocol in ("websocket","aiohttp-ws"):
-            child_ids=self.get_available_child_ids()
-            if child_ids:
-                return min(child_ids,key=lambda cid:self.child_channels[cid]["control_queue"].qsize() if self.child_channels.get(cid) and self.child_channels[cid].get("control_queue") else float("inf"))
+            child_id=self.child_channels.least_queued("control_queue")
+            if child_id:
+                return child_id
         return "main"
 
     async def maybe_finalize_close_seq(self,conn_id):
-        close_state=self.conn_data_close_seq.get(conn_id)
-        if not close_state:
+        state=self.tunnel_manager.conns.get(conn_id)
+        if not state or not state.close_seq:
             return
-        close_seq,_=close_state
-        expected=self.conn_data_rx_expected.get(conn_id,0)
-        pending=self.conn_data_rx_pending.get(conn_id,{})
-        if expected>=close_seq and not pending:
-            self.conn_data_close_seq.pop(conn_id,None)
+        close_seq,_=state.close_seq
+        if state.rx_expected>=close_seq and not state.rx_pending:
+            state.close_seq=None
             await self.handle_remote_close(conn_id)
 
     async def handle_data_seq(self,conn_id,seq,payload):
-        expected=self.conn_data_rx_expected.get(conn_id,0)
+        state=self.tunnel_manager.state(conn_id)
+        expected=state.rx_expected
         if seq<expected:
             return
         if seq==expected:
-            self.conn_data_rx_wait_start.pop(conn_id,None)
+            state.rx_wait_start=None
             await self.handle_data(conn_id,payload)
             expected+=1
-            pending=self.conn_data_rx_pending.get(conn_id)
+            pending=state.rx_pending
             while pending and expected in pending:
                 next_payload=pending.pop(expected)
                 await self.handle_data(conn_id,next_payload)
                 expected+=1
             if pending is not None and not pending:
-                self.conn_data_rx_pending.pop(conn_id,None)
-                self.conn_data_rx_wait_start.pop(conn_id,None)
-            else:
-                if conn_id not in self.conn_data_rx_wait_start:
-                    self.conn_data_rx_wait_start[conn_id]=time.time()
-            self.conn_data_rx_expected[conn_id]=expected
+                state.rx_pending=None
+                state.rx_wait_start=None
+            elif state.rx_wait_start is None:
+                state.rx_wait_start=time.time()
+            state.rx_expected=expected
             await self.maybe_finalize_close_seq(conn_id)
             return
-        pending=self.conn_data_rx_pending.setdefault(conn_id,{})
-        if seq not in pending:
-            pending[seq]=payload
-            if conn_id not in self.conn_data_rx_wait_start:
-                self.conn_data_rx_wait_start[conn_id]=time.time()
+        if state.rx_pending is None:
+            state.rx_pending={}
+        if seq not in state.rx_pending:
+            state.rx_pending[seq]=payload
+            if state.rx_wait_start is None:
+                state.rx_wait_start=time.time()
 
     async def sequence_timeout_monitor(self):
         while self.running and not self.shutdown_event.is_set():
             await asyncio.sleep(2)
             now=time.time()
-            timed_out=[]
-            for conn_id,start_time in list(self.conn_data_rx_wait_start.items()):
-                if now-start_time>self.seq_timeout:
-                    timed_out.append(conn_id)
-            for conn_id in timed_out:
-                expected=self.conn_data_rx_expected.get(conn_id,0)
-                logger.warning(f"Connection {conn_id} sequence {expected} missing, skipping (VPN/TCP will retransmit)")
-                self.conn_data_rx_expected[conn_id]=expected+1
-                pending=self.conn_data_rx_pending.get(conn_id,{})
-                while pending and self.conn_data_rx_expected[conn_id] in pending:
-                    next_seq=self.conn_data_rx_expected[conn_id]
-                    next_payload=pending.pop(next_seq)
+            timed_out=[(conn_id,state) for conn_id,state in list(self.tunnel_manager.conns.items()) if state.rx_wait_start is not None and now-state.rx_wait_start>self.seq_timeout]
+            for conn_id,state in timed_out:
+                logger.warning(f"Connection {conn_id} sequence {state.rx_expected} missing, skipping (VPN/TCP will retransmit)")
+                state.rx_expected+=1
+                pending=state.rx_pending or {}
+                while pending and state.rx_expected in pending:
+                    next_payload=pending.pop(state.rx_expected)
                     await self.handle_data(conn_id,next_payload)
-                    self.conn_data_rx_expected[conn_id]+=1
-                if pending and self.conn_data_rx_expected[conn_id] not in pending:
-                    self.conn_data_rx_wait_start[conn_id]=time.time()
+                    state.rx_expected+=1
+                if pending and state.rx_expected not in pending:
+                    state.rx_wait_start=time.time()
                 else:
-                    self.conn_data_rx_wait_start.pop(conn_id,None)
+                    state.rx_wait_start=None
 
     async def handle_remote_close(self,conn_id):
-        self.conn_channel_map.pop(conn_id,None)
+        self.tunnel_manager.pop_channel(conn_id)
         self.preconnect_buffers.pop(conn_id,None)
-        queue=self.conn_write_queues.get(conn_id)
+        state=self.tunnel_manager.conns.get(conn_id)
+        queue=state.write_queue if state else None
         if queue:
             try:
                 queue.put_nowait(None)
             except asyncio.QueueFull:
-                task=self.conn_write_tasks.get(conn_id)
-                if task:
-                    task.cancel()
-                self.conn_write_queues.pop(conn_id,None)
-                self.conn_write_tasks.pop(conn_id,None)
+                if state.write_task:
+                    state.write_task.cancel()
+                self.tunnel_manager.pop_writer(conn_id)
                 self.tunnel_manager.remove_connection(conn_id)
         else:
             self.tunnel_manager.remove_connection(conn_id)
         self.clear_conn_data_state(conn_id)
 
+    async def handle_server_info(self,payload):
+        version,features=unpack_info(payload)
+        self.server_features=features
+        self.implicit_nonces=self.config.implicit_nonces and FEATURE_IMPLICIT_NONCE in features
+        self.compression_codec=pick_codec(self.config.compression,features)
+        self.cipher=pick_cipher(self.config.cipher,features) if self.implicit_nonces else CIPHER_AESGCM
+        logger.info(f"Server version: {version} (implicit nonces {'on' if self.implicit_nonces else 'off'}, cipher {self.cipher}, compression {codec_name(self.compression_codec)})")
+        features=supported_features()
+        if self.config.implicit_nonces:
+            features.append(FEATURE_IMPLICIT_NONCE)
+            features.extend(cipher_features(self.config.cipher))
+        if FEATURE_SHARDED in self.server_features:
+            features.append(FEATURE_SHARDED)
+        if FEATURE_FLOW_CONTROL in self.server_features:
+            features.append(FEATURE_FLOW_CONTROL)
+            self.enable_flow_control()
+        try:
+            self.main_control_queue.put_nowait(await pack_info(self.updater.current_version,self.key,features))
+        except (asyncio.QueueFull,AttributeError):
+            logger.warning("Control queue unavailable, dropping feature info")
+
+    def new_compressor(self,port):
+        return PayloadCompressor(self.compression_codec,port) if self.compression_codec else None
+
+    def new_write_queue(self):
+        return BudgetedQueue("write_queue",0 if self.conn_windows.enabled else 512)
+
+    def conn_control_queue(self,conn_id):
+        if FEATURE_SHARDED in self.server_features:
+            channel=self.get_channel(self.tunnel_manager.get_channel(conn_id,"main"))
+            if channel:
+                return channel.get("control_queue")
+        return self.main_control_queue
+
+    def grant_window(self,conn_id,size):
+        increment=self.conn_windows.consume(conn_id,size)
+        control_queue=self.conn_control_queue(conn_id)
+        if increment and control_queue:
+            frame=window_update_frame(conn_id,increment)
+            try:
+                control_queue.put_nowait(frame)
+            except asyncio.QueueFull:
+                asyncio.ensure_future(control_queue.put(frame))
+
+    def enable_flow_control(self):
+        for conn_id,increment in self.conn_windows.enable():
+            try:
+                self.conn_control_queue(conn_id).put_nowait(window_update_frame(conn_id,increment))
+            except (asyncio.QueueFull,AttributeError):
+                logger.warning(f"Control queue unavailable, dropping window update for {conn_id}")
+
     async def handle_remote_error(self,conn_id,payload):
         logger.error(f"Server error for {conn_id}: {payload.decode()}")
-        self.conn_channel_map.pop(conn_id,None)
+        self.tunnel_manager.pop_channel(conn_id)
         self.tunnel_manager.remove_connection(conn_id)
         self.clear_conn_data_state(conn_id)
 
     async def grpc_receive_messages(self,transport,channel_id):
-        buffer=bytearray()
+        decoder=FrameDecoder()
         try:
             while transport.connected:
                 self.last_rx_time=time.time()
@@ -521,21 +518,15 @@ class GhostWireClient:
                         break
                 except EOFError:
                     break
-                buffer.extend(msg_data)
-                while len(buffer)>=9:
-                    try:
-                        msg_type,conn_id,payload,consumed=await unpack_message(buffer,self.key)
-                        del buffer[:consumed]
-                    except ValueError:
-                        break
+                async for msg_type,conn_id,payload in iter_open_frames(decoder.feed(msg_data),self.key):
                     if msg_type==MSG_CONNECT and self.mode_accept_remote_connect():
                         remote_ip,remote_port=unpack_connect(payload)
-                        self.conn_channel_map[conn_id]=channel_id
+                        self.tunnel_manager.set_channel(conn_id,channel_id)
                         logger.debug(f"Routing connection {conn_id} via {channel_id}")
                         self.spawn_connect_task(conn_id,remote_ip,remote_port)
                     elif msg_type==MSG_CONNECT_UDP and self.mode_accept_remote_connect():
                         remote_ip,remote_port=unpack_connect(payload)
-                        self.conn_channel_map[conn_id]=channel_id
+                        self.tunnel_manager.set_channel(conn_id,channel_id)
                         self.spawn_connect_udp_task(conn_id,remote_ip,remote_port)
                     elif msg_type==MSG_DATA:
                         await self.handle_data(conn_id,payload)
@@ -546,7 +537,7 @@ class GhostWireClient:
                         await self.handle_remote_close(conn_id)
                     elif msg_type==MSG_CLOSE_SEQ:
                         close_seq,reason=unpack_close_seq(payload)
-                        self.conn_data_close_seq[conn_id]=(close_seq,reason)
+                        self.tunnel_manager.state(conn_id).close_seq=(close_seq,reason)
                         await self.maybe_finalize_close_seq(conn_id)
                     elif msg_type==MSG_ERROR:
                         await self.handle_remote_error(conn_id,payload)
@@ -582,12 +573,12 @@ class GhostWireClient:
                 msg_type,conn_id,payload,_=await unpack_message(msg_data,self.key)
                 if msg_type==MSG_CONNECT and self.mode_accept_remote_connect():
                     remote_ip,remote_port=unpack_connect(payload)
-                    self.conn_channel_map[conn_id]=channel_id
+                    self.tunnel_manager.set_channel(conn_id,channel_id)
                     logger.debug(f"Routing connection {conn_id} via {channel_id}")
                     self.spawn_connect_task(conn_id,remote_ip,remote_port)
                 elif msg_type==MSG_CONNECT_UDP and self.mode_accept_remote_connect():
                     remote_ip,remote_port=unpack_connect(payload)
-                    self.conn_channel_map[conn_id]=channel_id
+                    self.tunnel_manager.set_channel(conn_id,channel_id)
                     self.spawn_connect_udp_task(conn_id,remote_ip,remote_port)
                 elif msg_type==MSG_DATA:
                     await self.handle_data(conn_id,payload)
@@ -598,7 +589,7 @@ class GhostWireClient:
                     await self.handle_remote_close(conn_id)
                 elif msg_type==MSG_CLOSE_SEQ:
                     close_seq,reason=unpack_close_seq(payload)
-                    self.conn_data_close_seq[conn_id]=(close_seq,reason)
+                    self.tunnel_manager.state(conn_id).close_seq=(close_seq,reason)
                     await self.maybe_finalize_close_seq(conn_id)
                 elif msg_type==MSG_ERROR:
                     await self.handle_remote_error(conn_id,payload)
@@ -664,21 +655,31 @@ class GhostWireClient:
 
     async def child_worker(self,slot_id):
         delay=self.config.initial_delay
+        quick_retries=0
         while self.running and not self.shutdown_event.is_set():
             if not self.main_websocket and not (self.config.protocol=="udp" and self.udp_transport and self.udp_transport.connected):
                 break
             server_url=self.connected_server_url if self.connected_server_url else self.config.server_url
             child_id=await self.connect_child_channel(server_url,slot_id)
+            retry_now=False
             if child_id:
                 delay=self.config.initial_delay
+                ws=self.child_channels.get(child_id,{}).get("ws")
                 recv_task=self.channel_recv_tasks.get(child_id)
                 if recv_task:
                     try:
                         await recv_task
                     except:
                         pass
+                retry_now=getattr(ws,"close_code",None)==CLOSE_TRY_AGAIN and quick_retries<16
             if not self.running or self.shutdown_event.is_set() or not self.main_websocket:
                 break
+            if retry_now:
+                quick_retries+=1
+                logger.debug(f"Child slot {slot_id} landed on a busy server worker, retrying")
+                await asyncio.sleep(0.05*random.random())
+                continue
+            quick_retries=0
             jitter=delay*(0.5+random.random())
             logger.info(f"Child slot {slot_id} reconnecting in {jitter:.1f} seconds...")
             try:
@@ -718,6 +719,10 @@ class GhostWireClient:
                     server_url=self.config.server_url.replace(self.config.cloudflare_host,best_ip)
                     logger.info(f"Using CloudFlare IP: {best_ip}")
             self.connected_server_url=server_url
+            self.main_nonces=(None,None)
+            self.implicit_nonces=False
+            self.compression_codec=None
+            self.cipher=CIPHER_AESGCM
             server_url,extra_headers,sni_host=self.apply_resolve_ip(server_url)
             if self.config.protocol=="http2":
                 from http2_transport import HTTP2ClientTransport
@@ -763,6 +768,7 @@ class GhostWireClient:
                 self.reconnect_delay=self.config.initial_delay
                 return True
             elif self.config.protocol=="aiohttp-ws":
+                early=await self.prepare_main_handshake(extra_headers)
                 session=aiohttp.ClientSession()
                 try:
                     ws=await session.ws_connect(server_url,max_msg_size=0,compress=False,heartbeat=None,proxy=self.pick_ws_proxy(server_url),ssl=self.make_ssl_context(server_url),headers=extra_headers,server_hostname=sni_host)
@@ -771,22 +777,8 @@ class GhostWireClient:
                     raise
                 self.main_websocket=AiohttpClientWebSocket(ws,session)
                 self.websocket=self.main_websocket
-                pubkey_msg=await asyncio.wait_for(self.main_websocket.recv(),timeout=10)
-                if len(pubkey_msg)<9:
-                    raise ValueError("Invalid public key message")
-                msg_type,_,pubkey_bytes,_=await unpack_message(pubkey_msg,None)
-                if msg_type!=MSG_PUBKEY:
-                    raise ValueError("Expected public key from server")
-                server_public_key,auth_salt=unpack_pubkey_payload(pubkey_bytes)
-                client_private_key,client_public_key=generate_rsa_keypair()
-                auth_msg=pack_auth_message(self.config.token,server_public_key,role="main",auth_salt=auth_salt)
-                await self.main_websocket.send(auth_msg)
-                await self.main_websocket.send(pack_pubkey(client_public_key))
-                session_msg=await asyncio.wait_for(self.main_websocket.recv(),timeout=10)
-                session_type,_,session_payload,_=await unpack_message(session_msg,None)
-                if session_type!=MSG_SESSION_KEY:
-                    raise ValueError("Expected session key from server")
-                self.key=unpack_session_key(session_payload,client_private_key)
+                self.key,auth_salt=await self.authenticate_main(self.main_websocket,early)
+                self.main_nonces=channel_nonce_counters(self.key,auth_salt,"client")
                 self.last_ping_time=time.time()
                 self.last_pong_time=time.time()
                 self.last_rx_time=time.time()
@@ -796,6 +788,7 @@ class GhostWireClient:
                 self.reconnect_delay=self.config.initial_delay
                 return True
             else:
+                early=await self.prepare_main_handshake(extra_headers)
                 session=aiohttp.ClientSession()
                 try:
                     ws=await session.ws_connect(server_url,max_msg_size=0,compress=False,heartbeat=None,proxy=self.pick_ws_proxy(server_url),ssl=self.make_ssl_context(server_url),headers=extra_headers,server_hostname=sni_host)
@@ -804,22 +797,8 @@ class GhostWireClient:
                     raise
                 self.main_websocket=AiohttpClientWebSocket(ws,session)
                 self.websocket=self.main_websocket
-                pubkey_msg=await asyncio.wait_for(self.main_websocket.recv(),timeout=10)
-                if len(pubkey_msg)<9:
-                    raise ValueError("Invalid public key message")
-                msg_type,_,pubkey_bytes,_=await unpack_message(pubkey_msg,None)
-                if msg_type!=MSG_PUBKEY:
-                    raise ValueError("Expected public key from server")
-                server_public_key,auth_salt=unpack_pubkey_payload(pubkey_bytes)
-                client_private_key,client_public_key=generate_rsa_keypair()
-                auth_msg=pack_auth_message(self.config.token,server_public_key,role="main",auth_salt=auth_salt)
-                await self.main_websocket.send(auth_msg)
-                await self.main_websocket.send(pack_pubkey(client_public_key))
-                session_msg=await asyncio.wait_for(self.main_websocket.recv(),timeout=10)
-                session_type,_,session_payload,_=await unpack_message(session_msg,None)
-                if session_type!=MSG_SESSION_KEY:
-                    raise ValueError("Expected session key from server")
-                self.key=unpack_session_key(session_payload,client_private_key)
+                self.key,auth_salt=await self.authenticate_main(self.main_websocket,early)
+                self.main_nonces=channel_nonce_counters(self.key,auth_salt,"client")
                 self.last_ping_time=time.time()
                 self.last_pong_time=time.time()
                 self.last_rx_time=time.time()
@@ -830,11 +809,61 @@ class GhostWireClient:
                 return True
         except Exception as e:
             logger.error(f"Connection failed: {e}")
+            self.server_features=set()
             self.connected_server_url=""
             self.main_websocket=None
             self.websocket=None
             return False
 
+    async def prepare_main_handshake(self,headers):
+        ticket=self.resume_ticket
+        self.resume_ticket=None
+        if ticket and self.config.session_tickets:
+            client_salt=os.urandom(AUTH_SALT_SIZE)
+            headers[HANDSHAKE_HEADER]=encode_handshake_header(pack_resume(*ticket,client_salt))
+            return MSG_RESUME,ticket[1],client_salt
+        if self.pinned_server_key and self.config.fast_handshake and FEATURE_FAST_HANDSHAKE in self.server_features:
+            client_private_key,client_public_key=generate_x25519_keypair()
+            hello_msg,client_salt=await asyncio.get_running_loop().run_in_executor(None,pack_hello,self.config.token,self.pinned_server_key,client_public_key)
+            headers[HANDSHAKE_HEADER]=encode_handshake_header(hello_msg)
+            return MSG_HELLO,client_private_key,client_salt
+        return None,None,None
+
+    async def authenticate_main(self,websocket,early):
+        first_type,early_secret,client_salt=early
+        pubkey_msg=await asyncio.wait_for(websocket.recv(),timeout=10)
+        if len(pubkey_msg)<9:
+            raise ValueError("Invalid public key message")
+        msg_type,_,pubkey_bytes,_=await unpack_message(pubkey_msg,None)
+        if msg_type!=MSG_PUBKEY:
+            raise ValueError("Expected public key from server")
+        server_public_key,auth_salt=unpack_pubkey_payload(pubkey_bytes)
+        self.pinned_server_key=server_public_key
+        if first_type:
+            reply_msg=await asyncio.wait_for(websocket.recv(),timeout=10)
+            reply_type,_,reply,_=await unpack_message(reply_msg,None)
+            if reply_type==MSG_RESUME and reply==b"\x01":
+                logger.info("Resumed session with ticket")
+                return resumed_session_key(early_secret,client_salt),client_salt
+            if reply_type==MSG_SESSION_KEY and first_type==MSG_HELLO:
+                logger.info("Fast handshake accepted")
+                return unpack_session_key(reply,early_secret,client_salt),client_salt
+            if reply_type!=first_type:
+                raise ValueError("Unexpected handshake reply from server")
+            logger.info(f"{'Resumption ticket' if first_type==MSG_RESUME else 'Fast handshake'} rejected, using full handshake")
+        if FEATURE_X25519 in self.server_features:
+            client_private_key,client_public_key=generate_x25519_keypair()
+        else:
+            client_private_key,client_public_key=await acquire_rsa_keypair()
+        auth_msg=pack_auth_message(self.config.token,server_public_key,role="main",auth_salt=auth_salt)
+        await websocket.send(auth_msg)
+        await websocket.send(pack_pubkey(client_public_key))
+        session_msg=await asyncio.wait_for(websocket.recv(),timeout=10)
+        session_type,_,session_payload,_=await unpack_message(session_msg,None)
+        if session_type!=MSG_SESSION_KEY:
+            raise ValueError("Expected session key from server")
+        return unpack_session_key(session_payload,client_private_key,auth_salt),auth_salt
+
     async def find_best_cloudflare_ip(self):
         best_ip=None
         best_latency=float("inf")
@@ -876,15 +905,20 @@ class GhostWireClient:
             if msg_type!=MSG_PUBKEY:
                 raise ValueError("Expected public key from server")
             server_public_key,auth_salt=unpack_pubkey_payload(pubkey_bytes)
-            auth_msg=pack_auth_message(self.config.token,server_public_key,role="child",child_id=child_id,auth_salt=auth_salt)
+            if FEATURE_CHILD_ATTACH in self.server_features:
+                auth_msg=pack_attach(self.key,auth_salt,child_id)
+            else:
+                auth_msg=pack_auth_message(self.config.token,server_public_key,role="child",child_id=child_id,auth_salt=auth_salt)
             await ws.send(auth_msg)
-            send_queue=asyncio.Queue(maxsize=512)
-            control_queue=asyncio.Queue(maxsize=256)
-            stop_event=asyncio.Event()
+            tx,rx=channel_nonce_counters(self.key,auth_salt,"client")
+            outbound=OutboundQueue()
+            send_queue=outbound.data
+            control_queue=outbound.control
+            stop_event=outbound.stop_event
             self.child_channels[child_id]={"ws":ws,"send_queue":send_queue,"control_queue":control_queue,"slot_id":slot_id}
             self.channel_stop_events[child_id]=stop_event
-            self.channel_sender_tasks[child_id]=asyncio.create_task(self.sender_task(ws,send_queue,control_queue,stop_event))
-            self.channel_recv_tasks[child_id]=asyncio.create_task(self.receive_messages(ws,child_id))
+            self.channel_sender_tasks[child_id]=asyncio.create_task(self.sender_task(ws,outbound,tx))
+            self.channel_recv_tasks[child_id]=asyncio.create_task(self.receive_messages(ws,child_id,rx))
             logger.info(f"Child channel established: slot={slot_id} id={child_id}")
             return child_id
         except Exception as e:
@@ -894,47 +928,53 @@ class GhostWireClient:
     async def handle_connect(self,conn_id,remote_ip,remote_port):
         try:
             async with self.connect_semaphore:
-                channel_id=self.conn_channel_map.get(conn_id,"main")
+                channel_id=self.tunnel_manager.get_channel(conn_id,"main")
                 logger.debug(f"CONNECT request: {conn_id} -> {remote_ip}:{remote_port} via {channel_id}")
                 direct_proxy=self.pick_direct_proxy(remote_port)
                 if direct_proxy:
                     reader,writer=await self.connect_via_http_proxy(remote_ip,remote_port,direct_proxy,timeout=10)
+                elif self.config.local_io=="protocol":
+                    loop=asyncio.get_running_loop()
+                    await asyncio.wait_for(loop.create_connection(lambda:TunnelProtocol(self,remote_port,conn_id),remote_ip,remote_port),timeout=10)
+                    return
                 else:
                     reader,writer=await asyncio.wait_for(asyncio.open_connection(remote_ip,remote_port),timeout=10)
             self.tunnel_manager.add_connection(conn_id,(reader,writer))
             buffered=self.preconnect_buffers.pop(conn_id,[])
             for payload in buffered:
                 await self.handle_data(conn_id,payload)
-            asyncio.create_task(self.forward_remote_to_websocket(conn_id,reader))
+            asyncio.create_task(self.forward_remote_to_websocket(conn_id,reader,remote_port))
         except Exception as e:
             logger.error(f"Failed to connect to {remote_ip}:{remote_port}: {e}")
             self.preconnect_buffers.pop(conn_id,None)
             self.clear_conn_data_state(conn_id)
             error_msg=await pack_error(conn_id,str(e),self.key)
             try:
-                if self.control_queue:
-                    self.control_queue.put_nowait(error_msg)
+                control_queue=self.conn_control_queue(conn_id)
+                if control_queue:
+                    control_queue.put_nowait(error_msg)
             except (asyncio.QueueFull,AttributeError):
                 logger.warning(f"Control queue unavailable, dropping error message")
 
-    async def forward_remote_to_websocket(self,conn_id,reader):
+    async def forward_remote_to_websocket(self,conn_id,reader,port):
+        compressor=self.new_compressor(port)
+        self.conn_windows.open(conn_id)
         try:
             while True:
-                data=await reader.read(self.io_chunk_size)
+                if governor.over_budget():
+                    await governor.wait_for_room()
+                size=await self.conn_windows.acquire(conn_id,self.io_chunk_size)
+                data=await reader.read(size)
                 if not data:
                     break
-                channel_id=self.pick_data_channel(conn_id)
-                channel=self.get_channel(channel_id)
-                send_queue=channel.get("send_queue") if channel else None
+                self.conn_windows.spend(conn_id,len(data))
+                send_queue=self.data_send_queue(conn_id)
                 if not send_queue:
                     logger.debug(f"Send queue unavailable, stopping forward for {conn_id}")
                     break
-                use_seq=conn_id in self.conn_data_seq_enabled or self.should_stripe_data()
-                if use_seq:
-                    self.conn_data_seq_enabled.add(conn_id)
-                    message=await pack_data_seq(conn_id,self.next_data_seq(conn_id),data,self.key)
-                else:
-                    message=await pack_data(conn_id,data,self.key)
+                message=self.local_data_frame(conn_id,data)
+                if compressor:
+                    message=await compressor.compress_frame(message)
                 try:
                     send_queue.put_nowait(message)
                 except asyncio.QueueFull:
@@ -946,46 +986,57 @@ class GhostWireClient:
         except Exception as e:
             logger.debug(f"Forward error for {conn_id}: {e}")
         finally:
-            try:
-                channel_id=self.conn_channel_map.get(conn_id,"main")
-                channel=self.get_channel(channel_id)
-                control_queue=channel.get("control_queue") if channel else None
-                send_queue=channel.get("send_queue") if channel else None
-                if send_queue:
-                    if conn_id in self.conn_data_seq_enabled:
-                        send_queue.put_nowait(await pack_close_seq(conn_id,self.conn_data_tx_seq.get(conn_id,0),0,self.key))
-                    else:
-                        send_queue.put_nowait(await pack_close(conn_id,0,self.key))
-                elif control_queue:
-                    control_queue.put_nowait(await pack_close(conn_id,0,self.key))
-            except:
-                pass
-            self.conn_channel_map.pop(conn_id,None)
-            self.clear_conn_data_state(conn_id)
-            self.tunnel_manager.remove_connection(conn_id)
+            self.finish_local_forward(conn_id)
+
+    def data_send_queue(self,conn_id):
+        channel=self.get_channel(self.pick_data_channel(conn_id))
+        return channel.get("send_queue") if channel else None
+
+    def local_data_frame(self,conn_id,data):
+        state=self.tunnel_manager.state(conn_id)
+        if state.striped or self.should_stripe_data():
+            self.tunnel_manager.mark_striped(state)
+            seq=state.tx_seq
+            state.tx_seq=seq+1
+            return data_seq_frame(conn_id,seq,data)
+        return data_frame(conn_id,data)
+
+    def finish_local_forward(self,conn_id):
+        try:
+            channel_id=self.tunnel_manager.get_channel(conn_id,"main")
+            channel=self.get_channel(channel_id)
+            control_queue=channel.get("control_queue") if channel else None
+            send_queue=channel.get("send_queue") if channel else None
+            state=self.tunnel_manager.conns.get(conn_id)
+            if send_queue:
+                if state and state.striped:
+                    send_queue.put_nowait(close_seq_frame(conn_id,state.tx_seq,0))
+                else:
+                    send_queue.put_nowait(close_frame(conn_id,0))
+            elif control_queue:
+                control_queue.put_nowait(close_frame(conn_id,0))
+        except:
+            pass
+        self.tunnel_manager.pop_channel(conn_id)
+        self.clear_conn_data_state(conn_id)
+        self.tunnel_manager.remove_connection(conn_id)
 
-    async def receive_messages(self,websocket,channel_id):
-        buffer=bytearray()
+    async def receive_messages(self,websocket,channel_id,rx=None):
+        decoder=FrameDecoder()
         try:
             async for message in websocket:
                 self.last_rx_time=time.time()
                 if channel_id=="main":
                     self.last_ping_time=time.time()
-                buffer.extend(message)
-                while len(buffer)>=9:
-                    try:
-                        msg_type,conn_id,payload,consumed=await unpack_message(buffer,self.key)
-                        del buffer[:consumed]
-                    except ValueError:
-                        break
+                async for msg_type,conn_id,payload in iter_open_frames(decoder.feed(message),self.key,rx):
                     if msg_type==MSG_CONNECT and self.mode_accept_remote_connect():
                         remote_ip,remote_port=unpack_connect(payload)
-                        self.conn_channel_map[conn_id]=channel_id
+                        self.tunnel_manager.set_channel(conn_id,channel_id)
                         logger.debug(f"Routing connection {conn_id} via {channel_id}")
                         self.spawn_connect_task(conn_id,remote_ip,remote_port)
                     elif msg_type==MSG_CONNECT_UDP and self.mode_accept_remote_connect():
                         remote_ip,remote_port=unpack_connect(payload)
-                        self.conn_channel_map[conn_id]=channel_id
+                        self.tunnel_manager.set_channel(conn_id,channel_id)
                         logger.debug(f"Routing UDP connection {conn_id} via {channel_id}")
                         self.spawn_connect_udp_task(conn_id,remote_ip,remote_port)
                     elif msg_type==MSG_DATA:
@@ -997,8 +1048,10 @@ class GhostWireClient:
                         await self.handle_remote_close(conn_id)
                     elif msg_type==MSG_CLOSE_SEQ:
                         close_seq,reason=unpack_close_seq(payload)
-                        self.conn_data_close_seq[conn_id]=(close_seq,reason)
+                        self.tunnel_manager.state(conn_id).close_seq=(close_seq,reason)
                         await self.maybe_finalize_close_seq(conn_id)
+                    elif msg_type==MSG_WINDOW_UPDATE:
+                        self.conn_windows.grant(conn_id,unpack_window_update(payload))
                     elif msg_type==MSG_ERROR:
                         await self.handle_remote_error(conn_id,payload)
                     elif msg_type==MSG_PING:
@@ -1018,28 +1071,32 @@ class GhostWireClient:
                     elif msg_type==MSG_CHILD_CFG and channel_id=="main":
                         child_count=unpack_child_cfg(payload)
                         await self.sync_child_workers(child_count)
+                    elif msg_type==MSG_INFO and channel_id=="main":
+                        await self.handle_server_info(payload)
+                    elif msg_type==MSG_TICKET and channel_id=="main":
+                        self.resume_ticket=(bytes(payload),resumption_secret(self.key))
         except ConnectionError:
             logger.warning(f"Connection closed by server channel={channel_id}")
         except Exception as e:
             logger.error(f"Receive error channel={channel_id}: {e}",exc_info=True)
         finally:
             if channel_id!="main":
-                affected=[conn_id for conn_id,mapped_channel in self.conn_channel_map.items() if mapped_channel==channel_id]
-                if self.conn_data_seq_enabled:
-                    striped_count=len(self.conn_data_seq_enabled)
+                affected=self.tunnel_manager.channel_conns(channel_id)
+                striped_count=self.tunnel_manager.striped_count()
+                if striped_count:
                     logger.info(f"Child {channel_id} lost during striped mode, {striped_count} striped connections will timeout if sequences are missing")
                     for conn_id in affected:
-                        self.conn_channel_map.pop(conn_id,None)
+                        self.tunnel_manager.pop_channel(conn_id)
                     await self.close_channel(channel_id)
                     return
-                available_children=[cid for cid,ch in self.child_channels.items() if cid!=channel_id and ch.get("ws") and getattr(ch.get("ws"),"close_code",None) is None]
+                available_children=[] if FEATURE_SHARDED in self.server_features else [cid for cid in self.get_available_child_ids() if cid!=channel_id]
                 for conn_id in affected:
                     if available_children:
                         new_channel=available_children[0]
-                        self.conn_channel_map[conn_id]=new_channel
+                        self.tunnel_manager.set_channel(conn_id,new_channel)
                         logger.debug(f"Reassigned {conn_id} from {channel_id} to {new_channel}")
                         continue
-                    self.conn_channel_map.pop(conn_id,None)
+                    self.tunnel_manager.pop_channel(conn_id)
                     self.preconnect_buffers.pop(conn_id,None)
                     self.clear_conn_data_state(conn_id)
                     await self.close_conn_writer(conn_id,flush=False)
@@ -1047,22 +1104,22 @@ class GhostWireClient:
                 await self.close_channel(channel_id)
 
     async def handle_data(self,conn_id,payload):
-        connection=self.tunnel_manager.get_connection(conn_id)
+        state=self.tunnel_manager.conns.get(conn_id)
+        connection=state.connection if state else None
         if not connection:
-            buffer=self.preconnect_buffers.setdefault(conn_id,[])
-            if len(buffer)<16:
-                buffer.append(payload)
-            else:
+            if not self.preconnect_buffers.append(conn_id,payload):
                 logger.warning(f"Preconnect buffer full for remote connection {conn_id}")
             return
+        if not isinstance(connection,tuple):
+            connection.write(payload)
+            return
         if connection:
             _,writer=connection
             try:
-                queue=self.conn_write_queues.get(conn_id)
+                queue=state.write_queue
                 if not queue:
-                    queue=asyncio.Queue(maxsize=512)
-                    self.conn_write_queues[conn_id]=queue
-                    self.conn_write_tasks[conn_id]=asyncio.create_task(self.conn_writer_loop(conn_id,writer,queue))
+                    queue=state.write_queue=self.new_write_queue()
+                    state.write_task=asyncio.create_task(self.conn_writer_loop(conn_id,writer,queue))
                 queue.put_nowait(payload)
             except asyncio.QueueFull:
                 logger.warning(f"Write queue full for remote connection {conn_id}")
@@ -1126,6 +1183,10 @@ class GhostWireClient:
             logger.info(f"Direct listening on {local_ip}:{local_port} -> {remote_ip}:{remote_port}")
 
     async def handle_direct_local_connection(self,reader,writer,remote_ip,remote_port):
+        if not governor.admit_connection():
+            logger.warning(f"Memory budget reached, shedding direct connection to {remote_ip}:{remote_port}")
+            writer.close()
+            return
         conn_id=self.tunnel_manager.generate_conn_id()
         self.tunnel_manager.add_connection(conn_id,(reader,writer))
         logger.debug(f"New direct local connection {conn_id} -> {remote_ip}:{remote_port}")
@@ -1148,24 +1209,32 @@ class GhostWireClient:
                 logger.error(f"Control queue unavailable, dropping direct connection {conn_id}")
                 self.tunnel_manager.remove_connection(conn_id)
                 return
-            self.conn_channel_map[conn_id]=channel_id
-            asyncio.create_task(self.forward_direct_local_to_ws(conn_id,reader))
+            self.tunnel_manager.set_channel(conn_id,channel_id)
+            asyncio.create_task(self.forward_direct_local_to_ws(conn_id,reader,remote_port))
         except Exception as e:
             logger.error(f"Error sending direct CONNECT: {e}")
             self.tunnel_manager.remove_connection(conn_id)
 
-    async def forward_direct_local_to_ws(self,conn_id,reader):
+    async def forward_direct_local_to_ws(self,conn_id,reader,port):
+        compressor=self.new_compressor(port)
+        self.conn_windows.open(conn_id)
         try:
             while True:
-                data=await reader.read(self.io_chunk_size)
+                if governor.over_budget():
+                    await governor.wait_for_room()
+                size=await self.conn_windows.acquire(conn_id,self.io_chunk_size)
+                data=await reader.read(size)
                 if not data:
                     break
+                self.conn_windows.spend(conn_id,len(data))
                 channel_id=self.pick_data_channel(conn_id)
                 channel=self.get_channel(channel_id)
                 send_queue=channel.get("send_queue") if channel else None
                 if not send_queue:
                     break
-                message=await pack_data(conn_id,data,self.key)
+                message=data_frame(conn_id,data)
+                if compressor:
+                    message=await compressor.compress_frame(message)
                 try:
                     send_queue.put_nowait(message)
                 except asyncio.QueueFull:
@@ -1178,48 +1247,54 @@ class GhostWireClient:
             logger.debug(f"Direct local forward error for {conn_id}: {e}")
         finally:
             try:
-                channel_id=self.conn_channel_map.get(conn_id,"main")
+                channel_id=self.tunnel_manager.get_channel(conn_id,"main")
                 channel=self.get_channel(channel_id)
                 send_queue=channel.get("send_queue") if channel else None
                 if send_queue:
-                    send_queue.put_nowait(await pack_close(conn_id,0,self.key))
+                    send_queue.put_nowait(close_frame(conn_id,0))
                 elif self.main_control_queue:
-                    self.main_control_queue.put_nowait(await pack_close(conn_id,0,self.key))
+                    self.main_control_queue.put_nowait(close_frame(conn_id,0))
             except:
                 pass
-            self.conn_channel_map.pop(conn_id,None)
+            self.tunnel_manager.pop_channel(conn_id)
             self.clear_conn_data_state(conn_id)
             self.tunnel_manager.remove_connection(conn_id)
 
     async def run(self):
         self.running=True
+        dispatch=await calibrate_crypto_dispatch()
+        logger.info(f"Crypto dispatch: inline up to {dispatch['threshold']} bytes (executor hop {dispatch['executor_hop_us']}us, cipher {dispatch['cipher_us_per_kb']}us/KB)")
+        speeds=benchmark_ciphers()
+        logger.info(f"Cipher benchmark: {', '.join(f'{name} {speed} MB/s' for name,speed in speeds.items())}")
+        prefill_rsa_keypairs()
         update_task=None
         if self.config.auto_update:
             update_task=asyncio.create_task(self.updater.update_loop(self.shutdown_event))
         while self.running and not self.shutdown_event.is_set():
             if await self.connect():
-                send_queue=asyncio.Queue(maxsize=512)
-                control_queue=asyncio.Queue(maxsize=256)
-                stop_event=asyncio.Event()
+                outbound=OutboundQueue()
+                send_queue=outbound.data
+                control_queue=outbound.control
+                stop_event=outbound.stop_event
                 self.send_queue=send_queue
                 self.control_queue=control_queue
                 self.main_send_queue=send_queue
                 self.main_control_queue=control_queue
                 try:
                     if self.config.protocol=="http2":
-                        sender_task=asyncio.create_task(self.http2_sender_task(self.http2_transport,send_queue,control_queue,stop_event))
+                        sender_task=asyncio.create_task(self.http2_sender_task(self.http2_transport,outbound))
                         receive_task=asyncio.create_task(self.http2_receive_messages(self.http2_transport,"main"))
                     elif self.config.protocol=="grpc":
-                        sender_task=asyncio.create_task(self.http2_sender_task(self.grpc_transport,send_queue,control_queue,stop_event))
+                        sender_task=asyncio.create_task(self.http2_sender_task(self.grpc_transport,outbound))
                         receive_task=asyncio.create_task(self.grpc_receive_messages(self.grpc_transport,"main"))
                     elif self.config.protocol=="udp":
-                        sender_task=asyncio.create_task(self.sender_task(self.udp_transport,send_queue,control_queue,stop_event))
+                        sender_task=asyncio.create_task(self.sender_task(self.udp_transport,outbound))
                         receive_task=asyncio.create_task(self.receive_messages(self.udp_transport,"main"))
                         if self.config.mode=="direct" and not self.direct_listeners:
                             await self.start_direct_listeners()
                     else:
-                        sender_task=asyncio.create_task(self.sender_task(self.main_websocket,send_queue,control_queue,stop_event))
-                        receive_task=asyncio.create_task(self.receive_messages(self.main_websocket,"main"))
+                        sender_task=asyncio.create_task(self.sender_task(self.main_websocket,outbound,self.main_nonces[0]))
+                        receive_task=asyncio.create_task(self.receive_messages(self.main_websocket,"main",self.main_nonces[1]))
                         if self.config.mode=="direct" and not self.direct_listeners:
                             await self.start_direct_listeners()
                     self.channel_sender_tasks["main"]=sender_task
@@ -1290,6 +1365,10 @@ class GhostWireClient:
                     self.main_send_queue=None
                     self.main_control_queue=None
                     self.tunnel_manager.close_all()
+                    stats=get_crypto_stats()
+                    logger.info(f"Crypto dispatch stats: inline={stats['inline_calls']} ({stats['inline_seconds']:.3f}s) offload={stats['offload_calls']} ({stats['offload_seconds']:.3f}s)")
+                    for port,port_stats in get_compression_stats().items():
+                        logger.info(f"Compression port {port}: ratio={port_stats['ratio']} raw={port_stats['raw_bytes']} sent={port_stats['sent_bytes']} cpu={port_stats['cpu_seconds']:.3f}s disabled={port_stats['disabled']}/{port_stats['connections']}")
             if self.running and not self.shutdown_event.is_set():
                 jitter_delay=self.reconnect_delay*(0.5+random.random())
                 logger.info(f"Reconnecting in {jitter_delay:.1f} seconds...")
@@ -1312,6 +1391,7 @@ def signal_handler(client,loop):
     loop.call_soon_threadsafe(client.stop)
 
 def main():
+    multiprocessing.freeze_support()
     if len(sys.argv)>=2 and sys.argv[1]=="update":
         config_path=next((sys.argv[i+1] for i,a in enumerate(sys.argv) if a in ("-c","--config") and i+1<len(sys.argv)),None)
         if config_path:
@@ -1324,10 +1404,17 @@ def main():
     parser.add_argument("-c","--config",help="Path to configuration file")
     parser.add_argument("--generate-token",action="store_true",help="Generate authentication token and exit")
     parser.add_argument("--version",action="store_true",help="Print version and exit")
+    parser.add_argument("--crypto-benchmark",action="store_true",help="Benchmark AEAD ciphers and exit")
     args=parser.parse_args()
     if args.version:
         print(Updater("client").current_version)
         sys.exit(0)
+    if args.crypto_benchmark:
+        speeds=benchmark_ciphers()
+        for size in (64,1400,16384,65536):
+            print(f"{size:>6}B  "+"  ".join(f"{name} {cipher_speed(name,size):>8,.1f} MB/s" for name in speeds))
+        print(f"Preferred cipher: {pick_cipher('auto',cipher_features())}")
+        sys.exit(0)
     if args.generate_token:
         from auth import generate_token
         print(generate_token())
@@ -1342,8 +1429,7 @@ def main():
         sys.exit(1)
     setup_logging(config)
     client=GhostWireClient(config)
-    loop=asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
+    loop=new_event_loop(config.event_loop)
     for sig in (signal.SIGTERM,signal.SIGINT):
         loop.add_signal_handler(sig,lambda:signal_handler(client,loop))
     try:
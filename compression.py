@@ -0,0 +1,110 @@
+import asyncio
+import threading
+import time
+import zlib
+try:
+    import zstandard
+except ImportError:
+    zstandard=None
+from threadstats import ThreadStats
+
+FLAG_COMPRESSED=0x40
+CODEC_ZLIB=1
+CODEC_ZSTD=2
+FEATURE_ZLIB="compress-zlib"
+FEATURE_ZSTD="compress-zstd"
+COMPRESS_MIN_PAYLOAD=256
+COMPRESS_INLINE_MAX=16384
+COMPRESS_PROBE_BYTES=65536
+COMPRESS_MIN_SAVING=0.1
+MAX_DECOMPRESSED=1048576
+
+_zstd_local=threading.local()
+_port_stats=ThreadStats(dict)
+
+def supported_features():
+    return ([FEATURE_ZSTD] if zstandard else [])+[FEATURE_ZLIB]
+
+def pick_codec(mode,peer_features):
+    if mode in ("auto","zstd") and zstandard and FEATURE_ZSTD in peer_features:
+        return CODEC_ZSTD
+    if mode in ("auto","zlib") and FEATURE_ZLIB in peer_features:
+        return CODEC_ZLIB
+    return None
+
+def codec_name(codec):
+    return {CODEC_ZLIB:"zlib",CODEC_ZSTD:"zstd"}.get(codec,"off")
+
+def _zstd_compressor():
+    compressor=getattr(_zstd_local,"compressor",None)
+    if compressor is None:
+        compressor=_zstd_local.compressor=zstandard.ZstdCompressor(level=3)
+    return compressor
+
+def compress_payload(codec,data):
+    if codec==CODEC_ZSTD:
+        return bytes([CODEC_ZSTD])+_zstd_compressor().compress(data)
+    return bytes([CODEC_ZLIB])+zlib.compress(data,1)
+
+def _timed_compress(codec,data):
+    start=time.perf_counter()
+    compressed=compress_payload(codec,data)
+    return compressed,time.perf_counter()-start
+
+def decompress_payload(payload):
+    codec=payload[0]
+    data=payload[1:]
+    if codec==CODEC_ZLIB:
+        decompressor=zlib.decompressobj()
+        plaintext=decompressor.decompress(data,MAX_DECOMPRESSED)
+        if decompressor.unconsumed_tail:
+            raise ValueError("Decompressed payload too large")
+        return plaintext
+    if codec==CODEC_ZSTD and zstandard:
+        if zstandard.frame_content_size(data)>MAX_DECOMPRESSED:
+            raise ValueError("Decompressed payload too large")
+        return zstandard.ZstdDecompressor().decompress(data,max_output_size=MAX_DECOMPRESSED)
+    raise ValueError(f"Unsupported compression codec {codec}")
+
+def port_stats(port):
+    ports=_port_stats.get()
+    stats=ports.get(port)
+    if stats is None:
+        stats=ports[port]={"connections":0,"disabled":0,"raw_bytes":0,"sent_bytes":0,"cpu_seconds":0.0}
+    return stats
+
+def get_compression_stats():
+    return {str(port):{**stats,"ratio":round(stats["sent_bytes"]/stats["raw_bytes"],4) if stats["raw_bytes"] else 1.0} for port,stats in _port_stats.sum().items()}
+
+class PayloadCompressor:
+    def __init__(self,codec,port):
+        self.codec=codec
+        self.stats=port_stats(port)
+        self.stats["connections"]+=1
+        self.active=True
+        self.probe_raw=0
+        self.probe_sent=0
+
+    async def compress_frame(self,frame):
+        msg_type,conn_id,payload=frame
+        size=len(payload)
+        self.stats["raw_bytes"]+=size
+        if not self.active or size<COMPRESS_MIN_PAYLOAD:
+            self.stats["sent_bytes"]+=size
+            return frame
+        if size>COMPRESS_INLINE_MAX:
+            compressed,elapsed=await asyncio.get_running_loop().run_in_executor(None,_timed_compress,self.codec,payload)
+        else:
+            compressed,elapsed=_timed_compress(self.codec,payload)
+        self.stats["cpu_seconds"]+=elapsed
+        if self.probe_raw<COMPRESS_PROBE_BYTES:
+            self.probe_raw+=size
+            self.probe_sent+=min(len(compressed),size)
+            if self.probe_raw>=COMPRESS_PROBE_BYTES and self.probe_sent>self.probe_raw*(1-COMPRESS_MIN_SAVING):
+                self.active=False
+                self.stats["disabled"]+=1
+        if len(compressed)>=size:
+            self.stats["sent_bytes"]+=size
+            return frame
+        self.stats["sent_bytes"]+=len(compressed)
+        return (msg_type|FLAG_COMPRESSED,conn_id,compressed)
@@ -1,4 +1,5 @@
 import tomllib
+import os
 import ipaddress
 
 def load_toml(config_path):
@@ -83,6 +84,19 @@ class ServerConfig:
         self.ws_pool_scale_down=config["server"].get("ws_pool_scale_down",16)
         self.ws_pool_stripe=config["server"].get("ws_pool_stripe",False)
         self.ws_send_batch_bytes=config["server"].get("ws_send_batch_bytes",65536)
+        self.batch_latency_ms=config["server"].get("batch_latency_ms",1.0)
+        self.memory_budget_mb=config["server"].get("memory_budget_mb",256)
+        self.local_io=config["server"].get("local_io","streams")
+        self.recv_pool_mb=config["server"].get("recv_pool_mb",0)
+        self.event_loop=config["server"].get("event_loop","asyncio")
+        self.workers=config["server"].get("workers",1)
+        self.worker_mode=config["server"].get("worker_mode","process")
+        self.implicit_nonces=config["server"].get("implicit_nonces",True)
+        self.compression=config["server"].get("compression","off")
+        self.cipher=config["server"].get("cipher","auto")
+        self.session_tickets=config["server"].get("session_tickets",True)
+        self.session_ticket_lifetime=config["server"].get("session_ticket_lifetime",3600)
+        self.auth_workers=config["server"].get("auth_workers",min(4,os.cpu_count() or 1))
         self.udp_enabled=config["server"].get("udp_enabled",True)
         self.auto_update=config["server"].get("auto_update",True)
         self.update_check_interval=config["server"].get("update_check_interval",300)
@@ -109,6 +123,16 @@ class ClientConfig:
         self.ping_interval=config["server"].get("ping_interval",10)
         self.ping_timeout=config["server"].get("ping_timeout",10)
         self.ws_send_batch_bytes=config["server"].get("ws_send_batch_bytes",65536)
+        self.batch_latency_ms=config["server"].get("batch_latency_ms",1.0)
+        self.memory_budget_mb=config["server"].get("memory_budget_mb",256)
+        self.local_io=config["server"].get("local_io","streams")
+        self.recv_pool_mb=config["server"].get("recv_pool_mb",0)
+        self.event_loop=config["server"].get("event_loop","asyncio")
+        self.implicit_nonces=config["server"].get("implicit_nonces",True)
+        self.compression=config["server"].get("compression","off")
+        self.cipher=config["server"].get("cipher","auto")
+        self.session_tickets=config["server"].get("session_tickets",True)
+        self.fast_handshake=config["server"].get("fast_handshake",True)
         self.ws_pool_enabled=config["server"].get("ws_pool_enabled",True)
         self.ws_pool_children=config["server"].get("ws_pool_children",8)
         self.ws_pool_min=config["server"].get("ws_pool_min",2)
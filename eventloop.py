@@ -0,0 +1,28 @@
+import asyncio
+import logging
+try:
+    import uvloop
+except ImportError:
+    uvloop=None
+
+logger=logging.getLogger(__name__)
+
+LOOP_BACKENDS=("asyncio","uvloop","auto")
+
+def available_backends():
+    return ["asyncio"]+(["uvloop"] if uvloop else [])
+
+def new_event_loop(backend="asyncio"):
+    if backend not in LOOP_BACKENDS:
+        logger.warning(f"Unknown event_loop '{backend}', using asyncio")
+        backend="asyncio"
+    if backend=="uvloop" and not uvloop:
+        logger.warning("event_loop=uvloop but uvloop is not installed, falling back to asyncio")
+    if backend in ("uvloop","auto") and uvloop:
+        loop=uvloop.new_event_loop()
+        logger.info(f"Event loop: uvloop {uvloop.__version__}")
+    else:
+        loop=asyncio.new_event_loop()
+        logger.info(f"Event loop: asyncio ({type(loop).__name__})")
+    asyncio.set_event_loop(loop)
+    return loop
@@ -0,0 +1,86 @@
+import asyncio
+import weakref
+from protocol import CONN_WINDOW_BYTES
+from threadstats import ThreadStats
+
+_flow_stats=ThreadStats(lambda:{"stalls":0,"updates_sent":0,"bytes_granted":0})
+_conn_windows=weakref.WeakSet()
+
+class ConnWindows:
+    def __init__(self,window=CONN_WINDOW_BYTES):
+        self.window=window
+        self.threshold=window//2
+        self.enabled=False
+        self.credits={}
+        self.consumed={}
+        self.waiters={}
+        _conn_windows.add(self)
+
+    def enable(self):
+        self.enabled=True
+        pending=[(conn_id,consumed) for conn_id,consumed in self.consumed.items() if consumed]
+        self.consumed=dict.fromkeys(self.consumed,0)
+        stats=_flow_stats.get()
+        stats["updates_sent"]+=len(pending)
+        stats["bytes_granted"]+=sum(consumed for _,consumed in pending)
+        return pending
+
+    def reset(self):
+        self.enabled=False
+        for conn_id in list(self.credits):
+            self.discard(conn_id)
+        self.consumed.clear()
+
+    def open(self,conn_id):
+        if self.enabled:
+            self.credits[conn_id]=self.window
+
+    async def acquire(self,conn_id,size):
+        credit=self.credits.get(conn_id)
+        while credit is not None and credit<=0:
+            _flow_stats.get()["stalls"]+=1
+            waiter=self.waiters[conn_id]=asyncio.get_running_loop().create_future()
+            try:
+                await waiter
+            finally:
+                if self.waiters.get(conn_id) is waiter:
+                    del self.waiters[conn_id]
+            credit=self.credits.get(conn_id)
+        return size if credit is None else min(size,credit)
+
+    def spend(self,conn_id,size):
+        if conn_id in self.credits:
+            self.credits[conn_id]-=size
+
+    def grant(self,conn_id,increment):
+        if conn_id not in self.credits:
+            return
+        self.credits[conn_id]+=increment
+        self.wake(conn_id)
+
+    def wake(self,conn_id):
+        waiter=self.waiters.get(conn_id)
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+
+    def consume(self,conn_id,size):
+        consumed=self.consumed.get(conn_id,0)+size
+        if self.enabled and consumed>=self.threshold:
+            self.consumed[conn_id]=0
+            stats=_flow_stats.get()
+            stats["updates_sent"]+=1
+            stats["bytes_granted"]+=consumed
+            return consumed
+        self.consumed[conn_id]=consumed
+        return 0
+
+    def discard(self,conn_id):
+        self.credits.pop(conn_id,None)
+        self.wake(conn_id)
+
+    def finish(self,conn_id):
+        self.consumed.pop(conn_id,None)
+
+def get_flow_stats():
+    stalled=sum(len(windows.waiters) for windows in list(_conn_windows))
+    return {"window":CONN_WINDOW_BYTES,"stalled":stalled,**_flow_stats.sum()}
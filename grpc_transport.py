@@ -9,6 +9,7 @@ from urllib.parse import urlparse
 from grpclib.server import Server,Stream
 from grpclib.client import Channel
 from protocol import *
+from outbound import OutboundQueue
 from auth import validate_token
 from tunnel_grpc import TunnelBase,TunnelStub
 from tunnel_pb2 import TunnelMessage
@@ -27,9 +28,10 @@ class GrpcTunnelServicer(TunnelBase):
         logger.info(f"gRPC client connected: {peer}")
         key=None
         last_ping_time=[time.time()]
-        send_queue=asyncio.Queue(maxsize=512)
-        control_queue=asyncio.Queue(maxsize=256)
-        stop_event=asyncio.Event()
+        outbound=OutboundQueue()
+        send_queue=outbound.data
+        control_queue=outbound.control
+        stop_event=outbound.stop_event
         sender_task=None
         ping_monitor=None
         authenticated=False
@@ -91,22 +93,16 @@ class GrpcTunnelServicer(TunnelBase):
             self.server.main_control_queue=control_queue
             if not self.server.listeners:
                 await self.server.start_listeners()
-            sender_task=asyncio.create_task(self._sender_loop(stream,send_queue,control_queue,stop_event))
+            sender_task=asyncio.create_task(self._sender_loop(stream,outbound,key))
             ping_monitor=asyncio.create_task(self._ping_monitor(last_ping_time,stop_event,control_queue,key))
-            buffer=bytearray()
+            decoder=FrameDecoder()
             while not stop_event.is_set():
                 msg=await stream.recv_message()
                 if not msg or not msg.data:
                     break
                 last_ping_time[0]=time.time()
-                buffer.extend(msg.data)
-                while len(buffer)>=9:
-                    try:
-                        msg_type,conn_id,payload,consumed=await unpack_message(buffer,key)
-                        del buffer[:consumed]
-                    except ValueError:
-                        break
-                    if msg_type in (MSG_DATA,MSG_CLOSE,MSG_ERROR,MSG_INFO):
+                async for msg_type,conn_id,payload in iter_open_frames(decoder.feed(msg.data),key):
+                    if msg_type in self.server.ROUTED_MESSAGES:
                         await self.server.route_message(msg_type,conn_id,payload)
                     elif msg_type==MSG_PING:
                         timestamp=struct.unpack("!Q",payload)[0]
@@ -136,47 +132,33 @@ class GrpcTunnelServicer(TunnelBase):
                 self.server.client_version=None
                 self.server.tunnel_manager.close_all()
             logger.info(f"gRPC client disconnected: {peer}")
-    async def _sender_loop(self,stream,send_queue,control_queue,stop_event):
+    async def _sender_loop(self,stream,outbound,key):
+        send_queue=outbound.data
+        control_queue=outbound.control
         try:
-            while not stop_event.is_set() or not send_queue.empty() or not control_queue.empty():
-                batch=bytearray()
+            while not outbound.stop_event.is_set() or not outbound.empty():
+                if outbound.empty():
+                    await outbound.wait()
+                    continue
+                batch=[]
+                batch_bytes=0
                 for _ in range(64):
                     try:
-                        batch.extend(control_queue.get_nowait())
+                        frame=control_queue.get_nowait()
                     except asyncio.QueueEmpty:
                         break
-                while len(batch)<1048576:
+                    batch.append(frame)
+                    batch_bytes+=frame_size(frame)
+                while batch_bytes<1048576:
                     try:
-                        batch.extend(send_queue.get_nowait())
+                        frame=send_queue.get_nowait()
                     except asyncio.QueueEmpty:
                         break
-                if not batch:
-                    control_get=asyncio.create_task(control_queue.get())
-                    data_get=asyncio.create_task(send_queue.get())
-                    stop_get=asyncio.create_task(stop_event.wait())
-                    done,pending=await asyncio.wait({control_get,data_get,stop_get},return_when=asyncio.FIRST_COMPLETED)
-                    for task in pending:
-                        task.cancel()
-                    if pending:
-                        await asyncio.gather(*pending,return_exceptions=True)
-                    if stop_get in done and control_get not in done and data_get not in done:
-                        break
-                    if control_get in done:
-                        batch.extend(control_get.result())
-                    if data_get in done:
-                        batch.extend(data_get.result())
-                    while len(batch)<1048576:
-                        try:
-                            batch.extend(control_queue.get_nowait())
-                        except asyncio.QueueEmpty:
-                            break
-                    while len(batch)<1048576:
-                        try:
-                            batch.extend(send_queue.get_nowait())
-                        except asyncio.QueueEmpty:
-                            break
+                    batch.append(frame)
+                    batch_bytes+=frame_size(frame)
                 if batch:
-                    await stream.send_message(TunnelMessage(data=bytes(batch)))
+                    frames=await pack_messages(batch,key)
+                    await stream.send_message(TunnelMessage(data=b"".join(frames)))
         except Exception as e:
             logger.debug(f"gRPC sender task error: {e}")
         finally:
@@ -254,7 +236,7 @@ class GrpcClientTransport:
                 raise ValueError("Expected public key from server")
             server_public_key,auth_salt=unpack_pubkey_payload(pubkey_bytes)
             logger.debug("Performing authentication...")
-            client_private_key,client_public_key=generate_rsa_keypair()
+            client_private_key,client_public_key=await acquire_rsa_keypair()
             auth_msg=pack_auth_message(self.token,server_public_key,role="main",auth_salt=auth_salt)
             await self.stream.send_message(TunnelMessage(data=auth_msg))
             pubkey_msg_data=pack_pubkey(client_public_key)
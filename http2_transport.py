@@ -108,7 +108,7 @@ class HTTP2ServerHandler:
                                     self.server.control_queue=send_queue
                                     if not self.server.listeners:
                                         await self.server.start_listeners()
-                                    sender_task=asyncio.create_task(self._sender_loop(stream_id,conn,writer,send_queue,stop_event,conn_lock,window_event))
+                                    sender_task=asyncio.create_task(self._sender_loop(stream_id,conn,writer,send_queue,stop_event,conn_lock,window_event,key))
                                     ping_task=asyncio.create_task(self._ping_monitor(last_ping_time,stop_event,send_queue,key))
                                     msg_buffer=auth_buffer
                                     auth_buffer=b""
@@ -224,7 +224,7 @@ class HTTP2ServerHandler:
             self.server.control_queue=send_queue
             if not self.server.listeners:
                 await self.server.start_listeners()
-            sender_task=asyncio.create_task(self._http11_sender_loop(writer,send_queue,stop_event))
+            sender_task=asyncio.create_task(self._http11_sender_loop(writer,send_queue,stop_event,key))
             ping_task=asyncio.create_task(self._ping_monitor(last_ping_time,stop_event,send_queue,key))
             while not stop_event.is_set():
                 msg_len_data=await reader.readexactly(4)
@@ -266,12 +266,13 @@ class HTTP2ServerHandler:
             except:
                 pass
             logger.info(f"HTTP/1.1 client disconnected: {peer}")
-    async def _http11_sender_loop(self,writer,send_queue,stop_event):
+    async def _http11_sender_loop(self,writer,send_queue,stop_event,key):
         try:
             while not stop_event.is_set():
                 msg=await send_queue.get()
                 if msg is None:
                     break
+                msg=(await pack_messages([msg],key))[0]
                 writer.write(struct.pack("!I",len(msg))+msg)
                 await writer.drain()
         except asyncio.CancelledError:
@@ -309,12 +310,13 @@ class HTTP2ServerHandler:
             except asyncio.TimeoutError:
                 if stop_event.is_set():
                     break
-    async def _sender_loop(self,stream_id,conn,writer,send_queue,stop_event,conn_lock,window_event):
+    async def _sender_loop(self,stream_id,conn,writer,send_queue,stop_event,conn_lock,window_event,key):
         try:
             while not stop_event.is_set():
                 msg=await send_queue.get()
                 if msg is None:
                     break
+                msg=(await pack_messages([msg],key))[0]
                 frame_data=struct.pack("!I",len(msg))+msg
                 await self._send_framed_bytes(stream_id,frame_data,conn,writer,conn_lock,window_event,stop_event)
         except asyncio.CancelledError:
@@ -410,7 +412,7 @@ class HTTP2ClientTransport:
                 raise ValueError("Expected public key from server")
             server_public_key,auth_salt=unpack_pubkey_payload(server_pubkey)
             logger.debug("Performing authentication...")
-            client_private_key,client_public_key=generate_rsa_keypair()
+            client_private_key,client_public_key=await acquire_rsa_keypair()
             auth_msg=pack_auth_message(self.token,server_public_key,role="main",auth_salt=auth_salt)
             frame_data=struct.pack("!I",len(auth_msg))+auth_msg
             await self._send_framed_bytes(frame_data)
@@ -0,0 +1,207 @@
+import asyncio
+import bisect
+import threading
+import weakref
+from collections import deque
+
+RESUME_RATIO=0.8
+SUBSYSTEMS=("send_queue","write_queue","preconnect")
+SLAB_CLASSES=(2048,16384,65536,262144)
+SLAB_SCAN=4
+
+class MemoryGovernor:
+    def __init__(self,budget=256*1048576):
+        self.used=dict.fromkeys(SUBSYSTEMS,0)
+        self.total=0
+        self.waiters=deque()
+        self.paused_reads=0
+        self.shed_connections=0
+        self.lock=None
+        self.configure(budget)
+
+    def share_between_threads(self):
+        self.lock=threading.Lock()
+
+    def configure(self,budget):
+        self.budget=budget
+        self.resume_bytes=int(budget*RESUME_RATIO)
+        self.wake()
+
+    def charge(self,subsystem,size):
+        if self.lock:
+            with self.lock:
+                self.used[subsystem]+=size
+                self.total+=size
+            return
+        self.used[subsystem]+=size
+        self.total+=size
+
+    def release(self,subsystem,size):
+        if self.lock:
+            with self.lock:
+                self.used[subsystem]-=size
+                self.total-=size
+        else:
+            self.used[subsystem]-=size
+            self.total-=size
+        if self.waiters and self.total<=self.resume_bytes:
+            self.wake()
+
+    def over_budget(self):
+        return self.total>=self.budget
+
+    def wake(self):
+        while self.waiters:
+            try:
+                waiter=self.waiters.popleft()
+            except IndexError:
+                break
+            if self.lock:
+                try:
+                    waiter.get_loop().call_soon_threadsafe(_resolve,waiter)
+                except RuntimeError:
+                    pass
+            elif not waiter.done():
+                waiter.set_result(None)
+
+    async def wait_for_room(self):
+        if self.total<self.budget:
+            return
+        self.paused_reads+=1
+        while self.total>self.resume_bytes:
+            waiter=asyncio.get_running_loop().create_future()
+            self.waiters.append(waiter)
+            if self.lock and self.total<=self.resume_bytes:
+                self.wake()
+            try:
+                await waiter
+            except BaseException:
+                if waiter in self.waiters:
+                    self.waiters.remove(waiter)
+                raise
+
+    def admit_connection(self):
+        if self.total<self.budget:
+            return True
+        self.shed_connections+=1
+        return False
+
+    def stats(self):
+        return {"budget":self.budget,"used":self.total,"subsystems":dict(self.used),"paused_reads":self.paused_reads,"shed_connections":self.shed_connections}
+
+def _resolve(waiter):
+    if not waiter.done():
+        waiter.set_result(None)
+
+governor=MemoryGovernor()
+
+def _release_held(subsystem,held):
+    if held[0]:
+        governor.release(subsystem,held[0])
+        held[0]=0
+
+def track_held(owner,subsystem):
+    held=[0]
+    weakref.finalize(owner,_release_held,subsystem,held).atexit=False
+    return held
+
+class BudgetedQueue(asyncio.Queue):
+    def __init__(self,subsystem,maxsize=0):
+        super().__init__(maxsize)
+        self.subsystem=subsystem
+        self.held=track_held(self,subsystem)
+
+    def put_nowait(self,item):
+        super().put_nowait(item)
+        if item is not None:
+            size=len(item)
+            self.held[0]+=size
+            governor.charge(self.subsystem,size)
+
+    def get_nowait(self):
+        item=super().get_nowait()
+        if item is not None:
+            size=len(item)
+            self.held[0]-=size
+            governor.release(self.subsystem,size)
+        return item
+
+class BudgetedBuffers(dict):
+    def __init__(self,subsystem,max_items):
+        super().__init__()
+        self.subsystem=subsystem
+        self.max_items=max_items
+        self.held=track_held(self,subsystem)
+
+    def append(self,key,payload):
+        buffer=self.setdefault(key,[])
+        if len(buffer)>=self.max_items:
+            return False
+        buffer.append(payload)
+        self.held[0]+=len(payload)
+        governor.charge(self.subsystem,len(payload))
+        return True
+
+    def pop(self,key,*default):
+        buffer=super().pop(key,*default)
+        if buffer:
+            size=sum(len(payload) for payload in buffer)
+            self.held[0]-=size
+            governor.release(self.subsystem,size)
+        return buffer
+
+    def clear(self):
+        _release_held(self.subsystem,self.held)
+        super().clear()
+
+def _unexported(buffer):
+    try:
+        last=buffer.pop()
+    except BufferError:
+        return False
+    buffer.append(last)
+    return True
+
+class SlabPool:
+    def __init__(self,classes=SLAB_CLASSES,max_bytes=0):
+        self.classes=classes
+        self.max_bytes=max_bytes
+        self.slabs={size:deque() for size in classes}
+        self.arena_bytes=0
+        self.peak_bytes=0
+        self.hits=0
+        self.misses=0
+
+    def acquire(self,size):
+        index=bisect.bisect_left(self.classes,size)
+        if index==len(self.classes):
+            self.misses+=1
+            return bytearray(size)
+        slab_size=self.classes[index]
+        slots=self.slabs[slab_size]
+        for _ in range(min(len(slots),SLAB_SCAN)):
+            slot=slots[0]
+            slots.rotate(-1)
+            if _unexported(slot):
+                self.hits+=1
+                return slot
+        self.misses+=1
+        if self.arena_bytes+slab_size>self.max_bytes:
+            return bytearray(size)
+        slot=bytearray(slab_size)
+        slots.append(slot)
+        self.arena_bytes+=slab_size
+        self.peak_bytes=max(self.peak_bytes,self.arena_bytes)
+        return slot
+
+    def configure(self,max_bytes):
+        self.max_bytes=max_bytes
+
+    def stats(self):
+        requests=self.hits+self.misses
+        return {"enabled":bool(self.max_bytes),"hit_rate":round(self.hits/requests,4) if requests else 0.0,"hits":self.hits,"misses":self.misses,"arena_bytes":self.arena_bytes,"peak_arena_bytes":self.peak_bytes,"slots":{size:len(slots) for size,slots in self.slabs.items()}}
+
+recv_pool=SlabPool()
+
+def get_memory_stats():
+    return dict(governor.stats(),slabs=recv_pool.stats())
@@ -0,0 +1,342 @@
+import asyncio
+import bisect
+import time
+import weakref
+from collections import deque
+from protocol import frame_size,FRAME_OVERHEAD,IO_CHUNK_SIZE,MSG_CLOSE,MSG_CLOSE_SEQ
+from compression import FLAG_COMPRESSED
+from memory import governor,track_held
+from threadstats import ThreadStats
+
+DRR_QUANTUM=IO_CHUNK_SIZE+4+FRAME_OVERHEAD
+FLOW_QUEUE_BYTES=1048576
+MIN_BATCH_BYTES=16384
+INTERACTIVE_FRAME_BYTES=2048
+BACKLOG_FRAMES=50
+RATE_WINDOW=0.5
+BATCH_BUCKETS=(1024,4096,16384,65536,131072)
+BATCH_BUCKET_NAMES=("<=1K","<=4K","<=16K","<=64K","<=128K",">128K")
+FLUSH_REASONS=("interactive","control","full","deadline","immediate","stop")
+_batch_stats=ThreadStats(lambda:{"sizes":dict.fromkeys(BATCH_BUCKET_NAMES,0),"reasons":dict.fromkeys(FLUSH_REASONS,0),"batches":0,"frames":0,"bytes":0})
+_fair_lanes=weakref.WeakSet()
+
+class OutboundLane:
+    def __init__(self,outbound,maxsize):
+        self.outbound=outbound
+        self.maxsize=maxsize
+        self.items=deque()
+        self.putters=deque()
+        self.held=track_held(self,"send_queue")
+
+    def qsize(self):
+        return len(self.items)
+
+    def empty(self):
+        return not self.items
+
+    def full(self):
+        return 0<self.maxsize<=len(self.items)
+
+    def put_nowait(self,item):
+        if self.full():
+            raise asyncio.QueueFull
+        self.items.append(item)
+        self.charge(frame_size(item))
+        self.outbound.wake()
+
+    async def put(self,item):
+        while self.full():
+            putter=asyncio.get_running_loop().create_future()
+            self.putters.append(putter)
+            try:
+                await putter
+            except BaseException:
+                if putter in self.putters:
+                    self.putters.remove(putter)
+                elif not putter.cancelled():
+                    self.wake_putter()
+                raise
+        self.put_nowait(item)
+
+    def get_nowait(self):
+        if not self.items:
+            raise asyncio.QueueEmpty
+        item=self.items.popleft()
+        self.discharge(frame_size(item))
+        if self.putters:
+            self.wake_putter()
+        return item
+
+    def charge(self,size):
+        self.held[0]+=size
+        governor.charge("send_queue",size)
+
+    def discharge(self,size):
+        self.held[0]-=size
+        governor.release("send_queue",size)
+
+    def wake_putter(self):
+        while self.putters:
+            putter=self.putters.popleft()
+            if not putter.done():
+                putter.set_result(None)
+                return
+
+class FairLane(OutboundLane):
+    def __init__(self,outbound,maxsize,quantum=DRR_QUANTUM,flow_bytes_limit=FLOW_QUEUE_BYTES):
+        super().__init__(outbound,maxsize)
+        self.quantum=quantum
+        self.flow_bytes_limit=flow_bytes_limit
+        self.flows={}
+        self.flow_bytes={}
+        self.deficits={}
+        self.flow_putters={}
+        self.active=deque()
+        self.credited=False
+        self.size=0
+        _fair_lanes.add(self)
+
+    def qsize(self):
+        return self.size
+
+    def empty(self):
+        return not self.size
+
+    def full(self):
+        return 0<self.maxsize<=self.size
+
+    def admits(self,item):
+        if isinstance(item,tuple) and item[0]&~FLAG_COMPRESSED in (MSG_CLOSE,MSG_CLOSE_SEQ):
+            return True
+        if self.full():
+            return False
+        if not isinstance(item,tuple):
+            return True
+        return self.flow_bytes.get(item[1],0)<self.flow_bytes_limit
+
+    def put_nowait(self,item):
+        if not self.admits(item):
+            raise asyncio.QueueFull
+        conn_id=item[1] if isinstance(item,tuple) else None
+        flow=self.flows.get(conn_id)
+        if flow is None:
+            flow=self.flows[conn_id]=deque()
+            self.flow_bytes[conn_id]=0
+            self.deficits[conn_id]=0
+            self.active.append(conn_id)
+        flow.append((time.monotonic(),item))
+        size=frame_size(item)
+        self.flow_bytes[conn_id]+=size
+        self.size+=1
+        self.charge(size)
+        self.outbound.wake()
+
+    async def put(self,item):
+        conn_id=item[1] if isinstance(item,tuple) else None
+        while not self.admits(item):
+            putter=asyncio.get_running_loop().create_future()
+            putters=self.flow_putters.setdefault(conn_id,deque())
+            putters.append(putter)
+            try:
+                await putter
+            except BaseException:
+                if putter in putters:
+                    putters.remove(putter)
+                elif not putter.cancelled():
+                    self.wake_flow(conn_id)
+                raise
+        self.put_nowait(item)
+
+    def wake_flow(self,conn_id):
+        putters=self.flow_putters.get(conn_id)
+        while putters:
+            putter=putters.popleft()
+            if not putter.done():
+                putter.set_result(None)
+                break
+        if putters is not None and not putters:
+            del self.flow_putters[conn_id]
+
+    def get_nowait(self):
+        if not self.size:
+            raise asyncio.QueueEmpty
+        was_full=self.full()
+        while True:
+            conn_id=self.active[0]
+            flow=self.flows[conn_id]
+            size=frame_size(flow[0][1])
+            if self.deficits[conn_id]>=size:
+                break
+            if self.credited:
+                self.active.rotate(-1)
+                self.credited=False
+            else:
+                self.deficits[conn_id]+=self.quantum
+                self.credited=True
+        item=flow.popleft()[1]
+        self.deficits[conn_id]-=size
+        self.flow_bytes[conn_id]-=size
+        self.size-=1
+        self.discharge(size)
+        if not flow:
+            del self.flows[conn_id]
+            del self.flow_bytes[conn_id]
+            del self.deficits[conn_id]
+            self.active.popleft()
+            self.credited=False
+        if self.flow_putters:
+            self.wake_flow(conn_id)
+            if was_full:
+                for other in list(self.flow_putters):
+                    if other!=conn_id:
+                        self.wake_flow(other)
+                        break
+        return item
+
+    def stats(self,now):
+        result={}
+        for conn_id,flow in list(self.flows.items()):
+            try:
+                result[conn_id]=(len(flow),self.flow_bytes.get(conn_id,0),now-flow[0][0])
+            except IndexError:
+                continue
+        return result
+
+class OutboundStopEvent(asyncio.Event):
+    def __init__(self,outbound):
+        super().__init__()
+        self.outbound=outbound
+
+    def set(self):
+        super().set()
+        self.outbound.wake()
+
+class OutboundQueue:
+    def __init__(self,data_maxsize=512,control_maxsize=256):
+        self.control=OutboundLane(self,control_maxsize)
+        self.data=FairLane(self,data_maxsize)
+        self.stop_event=OutboundStopEvent(self)
+        self.waiter=None
+
+    def qsize(self):
+        return self.control.qsize()+self.data.qsize()
+
+    def empty(self):
+        return self.control.empty() and self.data.empty()
+
+    def wake(self):
+        waiter=self.waiter
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+
+    async def wait(self):
+        while self.empty() and not self.stop_event.is_set():
+            self.waiter=asyncio.get_running_loop().create_future()
+            try:
+                await self.waiter
+            finally:
+                self.waiter=None
+
+    async def wait_more(self,timeout):
+        if not self.empty() or self.stop_event.is_set():
+            return
+        loop=asyncio.get_running_loop()
+        self.waiter=loop.create_future()
+        timer=loop.call_later(timeout,self.wake)
+        try:
+            await self.waiter
+        finally:
+            self.waiter=None
+            timer.cancel()
+
+class BatchPolicy:
+    def __init__(self,max_bytes,latency_budget):
+        self.max_bytes=max_bytes
+        self.backlog_bytes=max(max_bytes,min(max_bytes*2,131072))
+        self.latency_budget=latency_budget
+        self.rate=0.0
+        self.window_start=time.monotonic()
+        self.window_bytes=0
+
+    def target(self,queue_depth):
+        if queue_depth>=BACKLOG_FRAMES:
+            return self.backlog_bytes
+        return min(self.max_bytes,max(MIN_BATCH_BYTES,int(self.rate*self.latency_budget)))
+
+    async def collect(self,outbound):
+        loop=asyncio.get_running_loop()
+        batch=[]
+        batch_bytes=0
+        limit=self.target(outbound.qsize())
+        deadline=None
+        while True:
+            control=False
+            for _ in range(64):
+                try:
+                    frame=outbound.control.get_nowait()
+                except asyncio.QueueEmpty:
+                    break
+                batch.append(frame)
+                batch_bytes+=frame_size(frame)
+                control=True
+            bulk=False
+            while batch_bytes<limit:
+                try:
+                    frame=outbound.data.get_nowait()
+                except asyncio.QueueEmpty:
+                    break
+                batch.append(frame)
+                size=frame_size(frame)
+                batch_bytes+=size
+                bulk=bulk or size>INTERACTIVE_FRAME_BYTES
+            if batch_bytes>=limit:
+                reason="full"
+            elif control:
+                reason="control"
+            elif not bulk and deadline is None:
+                reason="interactive"
+            elif self.latency_budget<=0:
+                reason="immediate"
+            elif outbound.stop_event.is_set():
+                reason="stop"
+            else:
+                if deadline is None:
+                    deadline=loop.time()+self.latency_budget
+                remaining=deadline-loop.time()
+                if remaining>0:
+                    await outbound.wait_more(remaining)
+                    continue
+                reason="deadline"
+            self.record(batch,batch_bytes,reason)
+            return batch
+
+    def record(self,batch,batch_bytes,reason):
+        stats=_batch_stats.get()
+        stats["sizes"][BATCH_BUCKET_NAMES[bisect.bisect_left(BATCH_BUCKETS,batch_bytes)]]+=1
+        stats["reasons"][reason]+=1
+        stats["batches"]+=1
+        stats["frames"]+=len(batch)
+        stats["bytes"]+=batch_bytes
+        self.window_bytes+=batch_bytes
+        now=time.monotonic()
+        elapsed=now-self.window_start
+        if elapsed>=RATE_WINDOW:
+            self.rate=self.rate*0.5+self.window_bytes/elapsed*0.5
+            self.window_start=now
+            self.window_bytes=0
+
+def get_outbound_stats():
+    now=time.monotonic()
+    connections={}
+    for lane in list(_fair_lanes):
+        for conn_id,(depth,queued_bytes,wait) in lane.stats(now).items():
+            entry=connections.setdefault(str(conn_id),{"depth":0,"bytes":0,"wait_ms":0.0})
+            entry["depth"]+=depth
+            entry["bytes"]+=queued_bytes
+            entry["wait_ms"]=max(entry["wait_ms"],round(wait*1000,1))
+    return {"quantum":DRR_QUANTUM,"connections":connections}
+
+def get_batch_stats():
+    stats=_batch_stats.sum()
+    batches=stats["batches"]
+    return {"sizes":stats["sizes"],"flush_reasons":stats["reasons"],"batches":batches,"avg_frames":round(stats["frames"]/batches,2) if batches else 0,"avg_bytes":stats["bytes"]//batches if batches else 0}
@@ -13,6 +13,12 @@ import toml
 from flask import Flask,request,jsonify,Response
 from waitress import serve
 from updater import Updater
+from protocol import get_crypto_stats
+from compression import get_compression_stats
+from outbound import get_outbound_stats,get_batch_stats
+from memory import get_memory_stats
+from flowcontrol import get_flow_stats
+from tcp_protocol import get_protocol_stats
 
 app=Flask(__name__)
 
@@ -155,6 +161,10 @@ def api_status():
 def api_system():
     return jsonify(get_system_info())
 
+@panel_route("/api/metrics")
+def api_metrics():
+    return jsonify({"crypto":get_crypto_stats(),"compression":get_compression_stats(),"outbound":get_outbound_stats(),"batching":get_batch_stats(),"memory":get_memory_stats(),"flow":get_flow_stats(),"local_io":get_protocol_stats()})
+
 @panel_route("/api/tunnels")
 def api_tunnels():
     config=read_config()
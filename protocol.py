@@ -1,15 +1,56 @@
 import struct
 import os
+import base64
 import asyncio
 import hashlib
+import hmac
+import sys
+import time
 from functools import lru_cache
-from concurrent.futures import ThreadPoolExecutor
-from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor,ProcessPoolExecutor
+from cryptography.hazmat.primitives.ciphers import Cipher,algorithms,modes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM,ChaCha20Poly1305
 from cryptography.hazmat.primitives import hashes,serialization
 from cryptography.hazmat.primitives.asymmetric import rsa,padding
+from cryptography.hazmat.primitives.asymmetric.x25519 import X25519PrivateKey,X25519PublicKey
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from compression import FLAG_COMPRESSED,decompress_payload
+from threadstats import ThreadStats
 
-_executor=ThreadPoolExecutor(max_workers=os.cpu_count())
+_cpu_count=os.cpu_count() or 1
+_executor=ThreadPoolExecutor(max_workers=_cpu_count)
 AUTH_SALT_SIZE=32
+FRAME_OVERHEAD=9+12+16
+IO_CHUNK_SIZE=262144
+SEAL_INTO_MIN=65536
+OPEN_GROUP_MIN=262144
+OPEN_BATCH_FRAME=32768
+RECV_WINDOW_BYTES=524288
+FLAG_IMPLICIT_NONCE=0x80
+FEATURE_IMPLICIT_NONCE="implicit-nonce"
+FLAG_CHACHA=0x20
+CIPHER_AESGCM="aes256gcm"
+CIPHER_CHACHA="chacha20poly1305"
+CIPHER_BENCH_BYTES=16384
+TICKET_LIFETIME=3600
+FEATURE_X25519="x25519"
+X25519_KEY_SIZE=32
+RSA_POOL_SIZE=2
+FEATURE_FAST_HANDSHAKE="1rtt"
+FEATURE_CHILD_ATTACH="child-attach"
+FEATURE_FLOW_CONTROL="conn-window"
+FEATURE_SHARDED="sharded"
+CLOSE_TRY_AGAIN=1013
+CONN_WINDOW_BYTES=4194304
+HELLO_MAX_SKEW=300
+HANDSHAKE_HEADER="X-GhostWire-Handshake"
+_crypto_dispatch={"threshold":1024,"calibrated":False,"executor_hop_us":0.0,"cipher_us_per_kb":0.0}
+_cipher_speeds={}
+_rsa_keypairs=[]
+_rsa_refill=None
+_keygen_executor=None
+_crypto_stats=ThreadStats(lambda:{"inline_calls":0,"inline_bytes":0,"inline_seconds":0.0,"offload_calls":0,"offload_bytes":0,"offload_seconds":0.0})
 
 MSG_PUBKEY=0x00
 MSG_AUTH=0x01
@@ -25,15 +66,96 @@ MSG_SESSION_KEY=0x0A
 MSG_DATA_SEQ=0x0B
 MSG_CLOSE_SEQ=0x0C
 MSG_CONNECT_UDP=0x0D
+MSG_TICKET=0x0E
+MSG_RESUME=0x0F
+MSG_HELLO=0x10
+MSG_ATTACH=0x11
+MSG_WINDOW_UPDATE=0x12
 
 @lru_cache(maxsize=64)
 def get_aesgcm(key):
     return AESGCM(key)
 
+@lru_cache(maxsize=64)
+def get_aes(key):
+    return algorithms.AES(key)
+
+def derive_subkey(key,salt,info):
+    return HKDF(algorithm=hashes.SHA256(),length=32,salt=salt,info=info).derive(key)
+
+class NonceCounter:
+    def __init__(self,key,salt,direction):
+        self.key=derive_subkey(key,salt,b"ghostwire implicit nonce "+direction)
+        self.aesgcm=AESGCM(self.key)
+        self.chacha=ChaCha20Poly1305(derive_subkey(key,salt,b"ghostwire chacha20 "+direction))
+        self.cipher=CIPHER_AESGCM
+        self.counter=0
+
+    def next(self):
+        nonce=self.counter.to_bytes(12,"big")
+        self.counter+=1
+        return nonce
+
+    def flags(self):
+        return FLAG_IMPLICIT_NONCE|FLAG_CHACHA if self.cipher==CIPHER_CHACHA else FLAG_IMPLICIT_NONCE
+
+    def aead(self,msg_type):
+        return self.chacha if msg_type&FLAG_CHACHA else self.aesgcm
+
+def channel_nonce_counters(key,auth_salt,role):
+    client_to_server=NonceCounter(key,auth_salt,b"c2s")
+    server_to_client=NonceCounter(key,auth_salt,b"s2c")
+    if role=="server":
+        return server_to_client,client_to_server
+    return client_to_server,server_to_client
+
 def generate_rsa_keypair():
     private_key=rsa.generate_private_key(public_exponent=65537,key_size=2048)
     return private_key,private_key.public_key()
 
+def _generate_rsa_der():
+    private_key,_=generate_rsa_keypair()
+    return private_key.private_bytes(encoding=serialization.Encoding.DER,format=serialization.PrivateFormat.PKCS8,encryption_algorithm=serialization.NoEncryption())
+
+async def _generate_rsa_keypair_offloop():
+    global _keygen_executor
+    loop=asyncio.get_running_loop()
+    if getattr(sys,"frozen",False):
+        return await loop.run_in_executor(_executor,generate_rsa_keypair)
+    try:
+        if _keygen_executor is None:
+            _keygen_executor=ProcessPoolExecutor(max_workers=1,mp_context=multiprocessing.get_context("forkserver"))
+        der=await loop.run_in_executor(_keygen_executor,_generate_rsa_der)
+    except Exception:
+        return await loop.run_in_executor(_executor,generate_rsa_keypair)
+    private_key=serialization.load_der_private_key(der,password=None,unsafe_skip_rsa_key_validation=True)
+    return private_key,private_key.public_key()
+
+async def _refill_rsa_keypairs():
+    while len(_rsa_keypairs)<RSA_POOL_SIZE:
+        _rsa_keypairs.append(await _generate_rsa_keypair_offloop())
+
+def prefill_rsa_keypairs():
+    global _rsa_refill
+    if _rsa_refill is None or _rsa_refill.done() or _rsa_refill.get_loop() is not asyncio.get_running_loop():
+        _rsa_refill=asyncio.ensure_future(_refill_rsa_keypairs())
+
+async def acquire_rsa_keypair():
+    if _rsa_keypairs:
+        keypair=_rsa_keypairs.pop()
+    else:
+        keypair=await asyncio.get_running_loop().run_in_executor(_executor,generate_rsa_keypair)
+    prefill_rsa_keypairs()
+    return keypair
+
+def generate_x25519_keypair():
+    private_key=X25519PrivateKey.generate()
+    return private_key,private_key.public_key().public_bytes(encoding=serialization.Encoding.Raw,format=serialization.PublicFormat.Raw)
+
+def x25519_session_key(private_key,peer_public_bytes,auth_salt):
+    shared=private_key.exchange(X25519PublicKey.from_public_bytes(bytes(peer_public_bytes)))
+    return derive_subkey(shared,auth_salt,b"ghostwire x25519 session")
+
 def serialize_public_key(public_key):
     return public_key.public_bytes(encoding=serialization.Encoding.DER,format=serialization.PublicFormat.SubjectPublicKeyInfo)
 
@@ -46,31 +168,244 @@ def rsa_encrypt(public_key,plaintext):
 def rsa_decrypt(private_key,ciphertext):
     return private_key.decrypt(ciphertext,padding.OAEP(mgf=padding.MGF1(algorithm=hashes.SHA256()),algorithm=hashes.SHA256(),label=None))
 
+async def run_crypto(size,func,*args):
+    start=time.perf_counter()
+    if size<=_crypto_dispatch["threshold"]:
+        result=func(*args)
+        stats=_crypto_stats.get()
+        stats["inline_calls"]+=1
+        stats["inline_bytes"]+=size
+        stats["inline_seconds"]+=time.perf_counter()-start
+        return result
+    result=await asyncio.get_running_loop().run_in_executor(_executor,func,*args)
+    stats=_crypto_stats.get()
+    stats["offload_calls"]+=1
+    stats["offload_bytes"]+=size
+    stats["offload_seconds"]+=time.perf_counter()-start
+    return result
+
+def _median_seconds(func,samples):
+    timings=[]
+    for _ in range(samples):
+        start=time.perf_counter()
+        func()
+        timings.append(time.perf_counter()-start)
+    return sorted(timings)[samples//2]
+
+async def calibrate_crypto_dispatch(samples=200):
+    loop=asyncio.get_running_loop()
+    hops=[]
+    for _ in range(samples):
+        start=time.perf_counter()
+        await loop.run_in_executor(_executor,int)
+        hops.append(time.perf_counter()-start)
+    hop_cost=sorted(hops)[samples//2]
+    aesgcm=get_aesgcm(os.urandom(32))
+    nonce=bytes(12)
+    threshold=0
+    cost_per_kb=0.0
+    size=64
+    while size<=262144:
+        payload=bytes(size)
+        cost=_median_seconds(lambda:aesgcm.encrypt(nonce,payload,None),20)
+        cost_per_kb=cost*1024/size
+        if cost>hop_cost:
+            break
+        threshold=size
+        size*=2
+    _crypto_dispatch.update(threshold=threshold,calibrated=True,executor_hop_us=round(hop_cost*1e6,2),cipher_us_per_kb=round(cost_per_kb*1e6,3))
+    return dict(_crypto_dispatch)
+
+def cipher_speed(name,size=CIPHER_BENCH_BYTES,samples=50):
+    key=os.urandom(32)
+    aead=ChaCha20Poly1305(key) if name==CIPHER_CHACHA else AESGCM(key)
+    nonce=bytes(12)
+    payload=bytes(size)
+    return size/_median_seconds(lambda:aead.encrypt(nonce,payload,None),samples)/1048576
+
+def benchmark_ciphers(samples=50):
+    for name in (CIPHER_AESGCM,CIPHER_CHACHA):
+        _cipher_speeds[name]=round(cipher_speed(name,CIPHER_BENCH_BYTES,samples),1)
+    return dict(_cipher_speeds)
+
+def cipher_features(mode="auto"):
+    return [f"cipher-{name}:{speed}" for name,speed in _cipher_speeds.items() if mode in ("auto",name)]
+
+def peer_cipher_speeds(features):
+    speeds={}
+    for feature in features:
+        if not feature.startswith("cipher-"):
+            continue
+        name,_,speed=feature[7:].partition(":")
+        try:
+            speeds[name]=float(speed)
+        except ValueError:
+            continue
+    return speeds
+
+def pick_cipher(mode,features):
+    peer=peer_cipher_speeds(features)
+    common=[name for name in _cipher_speeds if mode in ("auto",name) and name in peer]
+    if not common:
+        return CIPHER_AESGCM
+    return max(common,key=lambda name:(min(_cipher_speeds[name],peer[name]),name==CIPHER_AESGCM))
+
+def get_crypto_stats():
+    return {**_crypto_dispatch,**_crypto_stats.sum(),"cipher_speeds":dict(_cipher_speeds)}
+
 async def encrypt_payload(key,plaintext,header):
     nonce=os.urandom(12)
     aesgcm=get_aesgcm(key)
-    loop=asyncio.get_running_loop()
-    ciphertext=await loop.run_in_executor(_executor,aesgcm.encrypt,nonce,plaintext,header)
+    ciphertext=await run_crypto(len(plaintext),aesgcm.encrypt,nonce,plaintext,header)
     return nonce+ciphertext
 
 async def decrypt_payload(key,encrypted_payload,header):
-    nonce=encrypted_payload[:12]
+    nonce=bytes(encrypted_payload[:12])
     ciphertext=encrypted_payload[12:]
     aesgcm=get_aesgcm(key)
-    loop=asyncio.get_running_loop()
-    return await loop.run_in_executor(_executor,aesgcm.decrypt,nonce,bytes(ciphertext),header)
+    return await run_crypto(len(ciphertext),aesgcm.decrypt,nonce,ciphertext,header)
+
+def _seal_frame(aesgcm,msg_type,conn_id,payload):
+    nonce=os.urandom(12)
+    ciphertext=aesgcm.encrypt(nonce,payload,pack_header(msg_type,conn_id,0))
+    return pack_header(msg_type,conn_id,12+len(ciphertext))+nonce+ciphertext
+
+def _seal_implicit_frame(tx,aead,flags,msg_type,conn_id,payload):
+    msg_type|=flags
+    ciphertext=aead.encrypt(tx.next(),payload,pack_header(msg_type,conn_id,0))
+    return pack_header(msg_type,conn_id,len(ciphertext))+ciphertext
+
+def _seal_frames(frames,key,tx=None):
+    if tx is not None:
+        flags=tx.flags()
+        aead=tx.aead(flags)
+        return [frame if isinstance(frame,(bytes,bytearray)) else _seal_implicit_frame(tx,aead,flags,*frame) for frame in frames]
+    aesgcm=get_aesgcm(key)
+    return [frame if isinstance(frame,(bytes,bytearray)) else _seal_frame(aesgcm,*frame) for frame in frames]
+
+async def pack_messages(frames,key,tx=None):
+    size=sum(len(frame[2]) for frame in frames if isinstance(frame,tuple))
+    if not size and not any(isinstance(frame,tuple) for frame in frames):
+        return frames
+    return await run_crypto(size,_seal_frames,frames,key,tx)
+
+def _seal_into(view,offset,key,aead,tx,flags,msg_type,conn_id,payload):
+    msg_type|=flags
+    if tx is not None:
+        nonce=tx.next()
+        start=offset+9
+    else:
+        nonce=os.urandom(12)
+        view[offset+9:offset+21]=nonce
+        start=offset+21
+    aad=pack_header(msg_type,conn_id,0)
+    if len(payload)>=SEAL_INTO_MIN and not msg_type&FLAG_CHACHA:
+        encryptor=Cipher(get_aes(key),modes.GCM(nonce)).encryptor()
+        encryptor.authenticate_additional_data(aad)
+        end=start+encryptor.update_into(payload,view[start:])
+        encryptor.finalize()
+        view[end:end+16]=encryptor.tag
+        end+=16
+    else:
+        ciphertext=aead.encrypt(nonce,payload,aad)
+        end=start+len(ciphertext)
+        view[start:end]=ciphertext
+    _header_struct.pack_into(view,offset,msg_type,conn_id,end-offset-9)
+    return end
+
+def _seal_batch_into(buffer,frames,key,tx):
+    if tx is not None:
+        flags=tx.flags()
+        aead=tx.aead(flags)
+        key=tx.key
+    else:
+        flags=0
+        aead=get_aesgcm(key)
+    view=memoryview(buffer)
+    offset=0
+    for frame in frames:
+        if isinstance(frame,tuple):
+            offset=_seal_into(view,offset,key,aead,tx,flags,*frame)
+        else:
+            view[offset:offset+len(frame)]=frame
+            offset+=len(frame)
+    view.release()
+    return offset
+
+class BatchBufferPool:
+    def __init__(self,max_buffers=4,min_size=65536):
+        self.free=[]
+        self.max_buffers=max_buffers
+        self.min_size=min_size
+
+    def acquire(self,size):
+        while self.free:
+            buffer=self.free.pop()
+            if len(buffer)>=size:
+                return buffer
+        return bytearray(max(size,self.min_size))
+
+    def release(self,buffer):
+        if len(self.free)>=self.max_buffers:
+            return
+        try:
+            last=buffer.pop()
+        except BufferError:
+            return
+        buffer.append(last)
+        self.free.append(buffer)
+
+async def pack_messages_into(frames,key,pool,tx=None):
+    buffer=pool.acquire(sum(frame_size(frame) for frame in frames))
+    size=sum(len(frame[2]) for frame in frames if isinstance(frame,tuple))
+    end=await run_crypto(size,_seal_batch_into,buffer,frames,key,tx)
+    return buffer,memoryview(buffer)[:end]
+
+def frame_size(frame):
+    if isinstance(frame,tuple):
+        return len(frame[2])+FRAME_OVERHEAD
+    return len(frame)
+
+_header_struct=struct.Struct("!BII")
 
 def pack_header(msg_type,conn_id,payload_length):
-    return struct.pack("!BII",msg_type,conn_id,payload_length)
+    return _header_struct.pack(msg_type,conn_id,payload_length)
 
 def unpack_header(header):
-    return struct.unpack("!BII",header)
+    return _header_struct.unpack(header)
+
+class FrameDecoder:
+    def __init__(self):
+        self.pending=bytearray()
+
+    def feed(self,data):
+        if self.pending:
+            self.pending+=data
+            data=self.pending
+        view=memoryview(data)
+        size=len(view)
+        frames=[]
+        offset=0
+        while size-offset>=9:
+            msg_type,conn_id,payload_length=_header_struct.unpack_from(view,offset)
+            end=offset+9+payload_length
+            if end>size:
+                break
+            frames.append((msg_type,conn_id,view[offset+9:end]))
+            offset=end
+        if offset==size:
+            self.pending=bytearray()
+        elif offset or data is not self.pending:
+            self.pending=bytearray(view[offset:])
+        else:
+            view.release()
+        return frames
 
 def derive_auth_key(token,auth_salt):
     return hashlib.pbkdf2_hmac("sha256",token.encode(),auth_salt,100000,32)
 
 def pack_pubkey(public_key,auth_salt=None):
-    pubkey_bytes=serialize_public_key(public_key)
+    pubkey_bytes=public_key if isinstance(public_key,bytes) else serialize_public_key(public_key)
     data=pubkey_bytes+(auth_salt if auth_salt is not None else b"")
     header=pack_header(MSG_PUBKEY,0,len(data))
     return header+data
@@ -106,28 +441,169 @@ async def pack_message(msg_type,conn_id,payload,key):
     header=pack_header(msg_type,conn_id,len(encrypted))
     return header+encrypted
 
-async def unpack_message(data,key):
+async def unpack_message(data,key,rx=None):
     if len(data)<9:
         raise ValueError("Message too short")
     header=data[:9]
     msg_type,conn_id,payload_length=unpack_header(header)
     if len(data)<9+payload_length:
         raise ValueError("Incomplete message")
-    payload=bytes(data[9:9+payload_length])
-    if msg_type==MSG_PUBKEY:
-        return msg_type,conn_id,payload,9+payload_length
-    if msg_type==MSG_AUTH:
-        return msg_type,conn_id,payload,9+payload_length
-    if msg_type==MSG_SESSION_KEY:
-        return msg_type,conn_id,payload,9+payload_length
-    aad=pack_header(msg_type,conn_id,0)
-    decrypted=await decrypt_payload(key,payload,aad)
-    return msg_type,conn_id,decrypted,9+payload_length
+    msg_type,conn_id,payload=await open_frame(msg_type,conn_id,memoryview(data)[9:9+payload_length],key,rx)
+    return msg_type,conn_id,payload,9+payload_length
+
+async def open_frame(msg_type,conn_id,payload,key,rx=None):
+    if msg_type in (MSG_PUBKEY,MSG_AUTH,MSG_SESSION_KEY,MSG_RESUME,MSG_HELLO,MSG_ATTACH):
+        return msg_type,conn_id,bytes(payload)
+    if msg_type&FLAG_IMPLICIT_NONCE:
+        if rx is None:
+            raise ConnectionError("Implicit nonce frame on a channel without nonce state")
+        nonce=rx.next()
+        decrypted=await run_crypto(len(payload),rx.aead(msg_type).decrypt,nonce,payload,pack_header(msg_type,conn_id,0))
+        msg_type&=~(FLAG_IMPLICIT_NONCE|FLAG_CHACHA)
+    else:
+        decrypted=await decrypt_payload(key,payload,pack_header(msg_type,conn_id,0))
+    if msg_type&FLAG_COMPRESSED:
+        return msg_type&~FLAG_COMPRESSED,conn_id,decompress_payload(decrypted)
+    return msg_type,conn_id,decrypted
+
+def _open_job(aesgcm,nonce,ciphertext,aad,compressed):
+    if aesgcm is None:
+        return ciphertext
+    plaintext=aesgcm.decrypt(nonce,ciphertext,aad)
+    return decompress_payload(plaintext) if compressed else plaintext
+
+def _open_jobs(jobs):
+    return [_open_job(*job) for job in jobs]
+
+def _open_route(frame,key,rx):
+    msg_type,conn_id,payload=frame
+    route=(msg_type&~(FLAG_IMPLICIT_NONCE|FLAG_CHACHA|FLAG_COMPRESSED),conn_id)
+    compressed=msg_type&FLAG_COMPRESSED
+    if msg_type in (MSG_PUBKEY,MSG_AUTH,MSG_SESSION_KEY,MSG_RESUME,MSG_HELLO,MSG_ATTACH):
+        return route,(None,None,bytes(payload),None,False)
+    if msg_type&FLAG_IMPLICIT_NONCE:
+        if rx is None:
+            raise ConnectionError("Implicit nonce frame on a channel without nonce state")
+        return route,(rx.aead(msg_type),rx.next(),payload,pack_header(msg_type,conn_id,0),compressed)
+    return route,(get_aesgcm(key),bytes(payload[:12]),payload[12:],pack_header(msg_type,conn_id,0),compressed)
+
+def _open_groups(frames,key,rx,group_bytes):
+    routes=[]
+    group=[]
+    size=0
+    for frame in frames:
+        route,job=_open_route(frame,key,rx)
+        if group and size+len(job[2])>group_bytes:
+            yield size,routes,group
+            routes=[]
+            group=[]
+            size=0
+        routes.append(route)
+        group.append(job)
+        size+=len(job[2])
+    if group:
+        yield size,routes,group
+
+async def _iter_open_window(frames,key,rx):
+    threshold=_crypto_dispatch["threshold"]
+    total=sum(len(frame[2]) for frame in frames)
+    group_bytes=max(total//_cpu_count,OPEN_GROUP_MIN,threshold+1)
+    if _cpu_count>1 and total>=group_bytes*2:
+        groups=list(_open_groups(frames,key,rx,group_bytes))
+        opened=await asyncio.gather(*[run_crypto(size,_open_jobs,group) for size,_,group in groups])
+        for (_,routes,_),plaintexts in zip(groups,opened):
+            for route,plaintext in zip(routes,plaintexts):
+                yield (*route,plaintext)
+        return
+    async for frame in _SerialOpener(frames,key,rx):
+        yield frame
+
+async def open_frames(frames,key,rx=None):
+    return [frame async for frame in _iter_open_window(frames,key,rx)]
+
+def _frame_windows(frames,window_bytes):
+    windows=[]
+    window=[]
+    size=0
+    for frame in frames:
+        window.append(frame)
+        size+=len(frame[2])
+        if size>=window_bytes:
+            windows.append(window)
+            window=[]
+            size=0
+    if window:
+        windows.append(window)
+    return windows
+
+class _SerialOpener:
+    def __init__(self,frames,key,rx):
+        self.frames=frames
+        self.key=key
+        self.rx=rx
+        self.index=0
+        self.opened=[]
+
+    def __aiter__(self):
+        return self
+
+    def __anext__(self):
+        if self.opened:
+            return self._pop()
+        frames=self.frames
+        start=end=self.index
+        if start>=len(frames):
+            raise StopAsyncIteration
+        threshold=_crypto_dispatch["threshold"]
+        size=0
+        while end<len(frames) and len(frames[end][2])<OPEN_BATCH_FRAME and size+len(frames[end][2])<=threshold:
+            size+=len(frames[end][2])
+            end+=1
+        if end-start<=1:
+            self.index=start+1
+            return open_frame(*frames[start],self.key,self.rx)
+        self.index=end
+        return self._open_batch(size,frames[start:end])
+
+    async def _pop(self):
+        return self.opened.pop()
+
+    async def _open_batch(self,size,frames):
+        routes,jobs=zip(*[_open_route(frame,self.key,self.rx) for frame in frames])
+        plaintexts=await run_crypto(size,_open_jobs,jobs)
+        self.opened=[(*route,plaintext) for route,plaintext in zip(routes,plaintexts)]
+        self.opened.reverse()
+        return self.opened.pop()
+
+def iter_open_frames(frames,key,rx=None,window_bytes=RECV_WINDOW_BYTES):
+    if _cpu_count<=1:
+        return _SerialOpener(frames,key,rx)
+    return _iter_open_windows(frames,key,rx,window_bytes)
+
+async def _iter_open_windows(frames,key,rx,window_bytes):
+    windows=_frame_windows(frames,window_bytes)
+    if len(windows)==1:
+        async for frame in _iter_open_window(windows[0],key,rx):
+            yield frame
+        return
+    pending=None
+    try:
+        for index,window in enumerate(windows):
+            opened=await pending if pending else await open_frames(window,key,rx)
+            pending=asyncio.ensure_future(open_frames(windows[index+1],key,rx)) if index+1<len(windows) else None
+            for frame in opened:
+                yield frame
+    finally:
+        if pending and not pending.done():
+            pending.cancel()
 
 async def pack_connect(conn_id,remote_ip,remote_port,key):
     payload=remote_ip.encode()+struct.pack("!H",remote_port)
     return await pack_message(MSG_CONNECT,conn_id,payload,key)
 
+def connect_frame(conn_id,remote_ip,remote_port):
+    return (MSG_CONNECT,conn_id,remote_ip.encode()+struct.pack("!H",remote_port))
+
 async def pack_connect_udp(conn_id,remote_ip,remote_port,key):
     payload=remote_ip.encode()+struct.pack("!H",remote_port)
     return await pack_message(MSG_CONNECT_UDP,conn_id,payload,key)
@@ -140,6 +616,12 @@ def unpack_connect(payload):
 async def pack_data(conn_id,data,key):
     return await pack_message(MSG_DATA,conn_id,data,key)
 
+def data_frame(conn_id,data):
+    return (MSG_DATA,conn_id,data)
+
+def data_seq_frame(conn_id,seq,data):
+    return (MSG_DATA_SEQ,conn_id,struct.pack("!I",seq)+data)
+
 async def pack_data_seq(conn_id,seq,data,key):
     return await pack_message(MSG_DATA_SEQ,conn_id,struct.pack("!I",seq)+data,key)
 
@@ -149,12 +631,24 @@ def unpack_data_seq(payload):
 async def pack_close(conn_id,reason,key):
     return await pack_message(MSG_CLOSE,conn_id,bytes([reason]),key)
 
+def close_frame(conn_id,reason):
+    return (MSG_CLOSE,conn_id,bytes([reason]))
+
 async def pack_close_seq(conn_id,seq,reason,key):
     return await pack_message(MSG_CLOSE_SEQ,conn_id,struct.pack("!IB",seq,reason),key)
 
+def close_seq_frame(conn_id,seq,reason):
+    return (MSG_CLOSE_SEQ,conn_id,struct.pack("!IB",seq,reason))
+
 def unpack_close_seq(payload):
     return struct.unpack("!IB",payload)
 
+def window_update_frame(conn_id,increment):
+    return (MSG_WINDOW_UPDATE,conn_id,struct.pack("!I",increment))
+
+def unpack_window_update(payload):
+    return struct.unpack("!I",payload)[0]
+
 async def pack_ping(timestamp,key):
     return await pack_message(MSG_PING,0,struct.pack("!Q",timestamp),key)
 
@@ -164,8 +658,15 @@ async def pack_pong(timestamp,key):
 async def pack_error(conn_id,error_msg,key):
     return await pack_message(MSG_ERROR,conn_id,error_msg.encode(),key)
 
-async def pack_info(version,key):
-    return await pack_message(MSG_INFO,0,version.encode(),key)
+async def pack_info(version,key,features=()):
+    payload=version.encode()
+    if features:
+        payload+=b"\x00"+",".join(features).encode()
+    return await pack_message(MSG_INFO,0,payload,key)
+
+def unpack_info(payload):
+    version,_,features=bytes(payload).partition(b"\x00")
+    return version.decode(),{feature for feature in features.decode().split(",") if feature}
 
 async def pack_child_cfg(child_count,key):
     return await pack_message(MSG_CHILD_CFG,0,struct.pack("!H",child_count),key)
@@ -178,5 +679,105 @@ def pack_session_key(session_key,client_public_key):
     header=pack_header(MSG_SESSION_KEY,0,len(encrypted_key))
     return header+encrypted_key
 
-def unpack_session_key(payload,client_private_key):
+def pack_x25519_session(public_bytes):
+    return pack_header(MSG_SESSION_KEY,0,len(public_bytes))+public_bytes
+
+def unpack_session_key(payload,client_private_key,auth_salt=None):
+    if isinstance(client_private_key,X25519PrivateKey):
+        return x25519_session_key(client_private_key,payload,auth_salt)
     return rsa_decrypt(client_private_key,payload)
+
+def resumption_secret(session_key):
+    return derive_subkey(session_key,b"",b"ghostwire resumption")
+
+def issue_ticket(ticket_key,session_key,lifetime=TICKET_LIFETIME):
+    nonce=os.urandom(12)
+    plaintext=struct.pack("!Q",int(time.time())+lifetime)+resumption_secret(session_key)
+    return nonce+get_aesgcm(ticket_key).encrypt(nonce,plaintext,b"ghostwire ticket")
+
+def open_ticket(ticket_key,ticket):
+    plaintext=get_aesgcm(ticket_key).decrypt(ticket[:12],ticket[12:],b"ghostwire ticket")
+    if struct.unpack("!Q",plaintext[:8])[0]<time.time():
+        raise ValueError("Ticket expired")
+    return plaintext[8:]
+
+def ticket_binder(secret,auth_salt,ticket):
+    return hmac.new(secret,auth_salt+ticket,hashlib.sha256).digest()
+
+def resumed_session_key(secret,auth_salt):
+    return derive_subkey(secret,auth_salt,b"ghostwire resumed session")
+
+async def pack_ticket(ticket,key):
+    return await pack_message(MSG_TICKET,0,ticket,key)
+
+def pack_resume(ticket,secret,client_salt):
+    payload=client_salt+ticket+ticket_binder(secret,client_salt,ticket)
+    return pack_header(MSG_RESUME,0,len(payload))+payload
+
+def unpack_resume(payload,ticket_key):
+    client_salt=payload[:AUTH_SALT_SIZE]
+    ticket=payload[AUTH_SALT_SIZE:-32]
+    secret=open_ticket(ticket_key,ticket)
+    if not hmac.compare_digest(payload[-32:],ticket_binder(secret,client_salt,ticket)):
+        raise ValueError("Ticket binder mismatch")
+    return resumed_session_key(secret,client_salt),client_salt,ticket[:12]
+
+def pack_handshake_ack(msg_type,accepted):
+    return pack_header(msg_type,0,1)+bytes([accepted])
+
+def pack_hello(token,server_public_key,kex_public_bytes,role="main",child_id=""):
+    client_salt=os.urandom(AUTH_SALT_SIZE)
+    plaintext=struct.pack("!Q",int(time.time()))+client_salt+bytes([len(kex_public_bytes)])+kex_public_bytes+pack_auth_payload(token,role,child_id,client_salt)
+    encrypted=rsa_encrypt(server_public_key,plaintext)
+    return pack_header(MSG_HELLO,0,len(encrypted))+encrypted,client_salt
+
+def unpack_hello(payload,private_key):
+    plaintext=rsa_decrypt(private_key,payload)
+    timestamp=struct.unpack("!Q",plaintext[:8])[0]
+    if abs(time.time()-timestamp)>HELLO_MAX_SKEW:
+        raise ValueError("Hello timestamp outside allowed skew")
+    client_salt=plaintext[8:8+AUTH_SALT_SIZE]
+    kex_end=9+AUTH_SALT_SIZE+plaintext[8+AUTH_SALT_SIZE]
+    token,role,child_id=unpack_auth_payload(plaintext[kex_end:])
+    return client_salt,plaintext[9+AUTH_SALT_SIZE:kex_end],token,role,child_id
+
+def encode_handshake_header(msg):
+    return base64.urlsafe_b64encode(msg).decode()
+
+def decode_handshake_header(value):
+    return base64.urlsafe_b64decode(value.encode())
+
+@lru_cache(maxsize=4)
+def child_attach_key(session_key):
+    return derive_subkey(session_key,b"",b"ghostwire child attach")
+
+def attach_binder(session_key,auth_salt,child_id):
+    return hmac.new(child_attach_key(session_key),auth_salt+child_id.encode(),hashlib.sha256).digest()
+
+def pack_attach(session_key,auth_salt,child_id):
+    payload=attach_binder(session_key,auth_salt,child_id)+child_id.encode()
+    return pack_header(MSG_ATTACH,0,len(payload))+payload
+
+def unpack_attach(payload,session_key,auth_salt):
+    child_id=bytes(payload[32:]).decode()
+    if not hmac.compare_digest(bytes(payload[:32]),attach_binder(session_key,auth_salt,child_id)):
+        raise ValueError("Invalid attach binder")
+    return child_id
+
+class ReplayCache:
+    def __init__(self,window,max_entries=4096):
+        self.window=window
+        self.max_entries=max_entries
+        self.seen={}
+
+    def check(self,token):
+        now=time.time()
+        while self.seen:
+            oldest=next(iter(self.seen))
+            if self.seen[oldest]>now:
+                break
+            del self.seen[oldest]
+        if token in self.seen or len(self.seen)>=self.max_entries:
+            return False
+        self.seen[token]=now+self.window
+        return True
@@ -9,14 +9,22 @@ import argparse
 import os
 import ssl
 import base64
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urlparse,unquote
 from protocol import *
+from outbound import OutboundQueue,BatchPolicy
+from memory import governor,recv_pool,SlabPool,BudgetedQueue,BudgetedBuffers
+from flowcontrol import ConnWindows
+from tcp_protocol import TunnelProtocol
 from config import ServerConfig
-from auth import validate_token
+from auth import expected_token_key,validate_token_key
 from tunnel import TunnelManager
+from eventloop import new_event_loop
+from workers import Coordinator,sharding_unsupported,gil_enabled
 from updater import Updater
 from panel import start_panel
 from udp_transport import UDPWriterAdapter
+from compression import PayloadCompressor,supported_features,pick_codec,codec_name
 
 logging.basicConfig(level=logging.INFO,format="%(asctime)s [%(levelname)s] %(message)s")
 logger=logging.getLogger(__name__)
@@ -30,13 +38,16 @@ def setup_logging(config):
         logging.getLogger().addHandler(handler)
 
 class GhostWireServer:
-    def __init__(self,config):
+    ROUTED_MESSAGES=(MSG_DATA,MSG_DATA_SEQ,MSG_CLOSE,MSG_CLOSE_SEQ,MSG_WINDOW_UPDATE,MSG_ERROR,MSG_INFO)
+
+    def __init__(self,config,shard=None):
         self.config=config
+        self.shard=shard
         self.running=False
         self.websocket=None
         self.main_websocket=None
         self.key=None
-        self.tunnel_manager=TunnelManager()
+        self.tunnel_manager=TunnelManager(shard.index+1,shard.count) if shard else TunnelManager()
         self.listeners=[]
         self.send_queue=None
         self.control_queue=None
@@ -44,35 +55,125 @@ class GhostWireServer:
         self.main_control_queue=None
         self.shutdown_event=asyncio.Event()
         self.auth_lock=asyncio.Lock()
+        self.auth_executor=ThreadPoolExecutor(max_workers=config.auth_workers,thread_name_prefix="auth")
         self.last_ping_time=0
         self.ping_timeout=config.ping_timeout
-        self.conn_write_queues={}
-        self.conn_write_tasks={}
         self.client_version=None
-        self.child_channels={}
-        self.conn_channel_map={}
-        self.child_rr_index=0
-        self.data_rr_index=0
+        self.implicit_nonces=False
+        self.compression_codec=None
+        self.cipher=CIPHER_AESGCM
+        self.ticket_key=shard.secrets["ticket_key"] if shard else os.urandom(32)
+        self.ticket_replay=ReplayCache(config.session_ticket_lifetime)
+        self.hello_replay=ReplayCache(HELLO_MAX_SKEW*2)
+        self.child_channels=self.tunnel_manager.channels
         self.child_queue_sizes={}
         self.current_child_count=0
-        self.conn_data_tx_seq={}
-        self.conn_data_seq_enabled=set()
-        self.conn_data_rx_expected={}
-        self.conn_data_rx_pending={}
-        self.conn_data_rx_wait_start={}
-        self.conn_data_close_seq={}
         self.seq_timeout=30
         self.udp_sessions={}
-        self.preconnect_buffers={}
-        self.io_chunk_size=262144
+        self.preconnect_buffers=BudgetedBuffers("preconnect",16)
+        self.conn_windows=ConnWindows()
+        self.io_chunk_size=IO_CHUNK_SIZE
+        self.read_view=memoryview(bytearray(self.io_chunk_size))
         self.writer_batch_bytes=262144
         self.ws_send_batch_bytes=config.ws_send_batch_bytes
+        governor.configure(config.memory_budget_mb*1048576)
+        self.recv_pool=SlabPool() if shard and shard.threaded and shard.index else recv_pool
+        self.recv_pool.configure(config.recv_pool_mb*1048576)
         self.ws_write_limit=4194304
         self.ws_max_queue=2048
-        logger.info("Generating RSA key pair for secure authentication...")
-        self.private_key,self.public_key=generate_rsa_keypair()
+        if shard:
+            self.private_key,self.public_key=shard.secrets["private_key"],shard.secrets["public_key"]
+        else:
+            logger.info("Generating RSA key pair for secure authentication...")
+            self.private_key,self.public_key=generate_rsa_keypair()
         self.updater=Updater("server",check_interval=config.update_check_interval,check_on_startup=config.update_check_on_startup,http_proxy=config.update_http_proxy,https_proxy=config.update_https_proxy,service_name=config.service_name)
 
+    def local_features(self):
+        features=supported_features()+[FEATURE_X25519,FEATURE_FAST_HANDSHAKE,FEATURE_CHILD_ATTACH,FEATURE_FLOW_CONTROL]
+        if self.config.implicit_nonces:
+            features.append(FEATURE_IMPLICIT_NONCE)
+            features.extend(cipher_features(self.config.cipher))
+        if self.shard:
+            features.append(FEATURE_SHARDED)
+        return features
+
+    def apply_client_features(self,features):
+        self.implicit_nonces=self.config.implicit_nonces and FEATURE_IMPLICIT_NONCE in features
+        self.compression_codec=pick_codec(self.config.compression,features)
+        self.cipher=pick_cipher(self.config.cipher,features) if self.implicit_nonces else CIPHER_AESGCM
+        if FEATURE_FLOW_CONTROL in features:
+            self.enable_flow_control()
+
+    def session_active(self):
+        return bool(self.websocket) or bool(self.shard and self.shard.active)
+
+    async def check_replay(self,kind,token):
+        if self.shard:
+            return await self.shard.request("replay",kind,token)
+        return (self.ticket_replay if kind=="ticket" else self.hello_replay).check(token)
+
+    async def resume_session(self,payload,client_id):
+        if not self.config.session_tickets:
+            return None
+        try:
+            session_key,client_salt,ticket_id=unpack_resume(payload,self.ticket_key)
+        except Exception as e:
+            logger.info(f"Resumption rejected for {client_id}: {str(e) or 'invalid ticket'}")
+            return None
+        if not await self.check_replay("ticket",ticket_id):
+            logger.warning(f"Resumption rejected for {client_id}: ticket already used")
+            return None
+        return session_key,client_salt,pack_handshake_ack(MSG_RESUME,True)
+
+    async def accept_hello(self,payload,client_id):
+        loop=asyncio.get_running_loop()
+        try:
+            client_salt,kex_public_bytes,token,role,child_id=await loop.run_in_executor(self.auth_executor,unpack_hello,payload,self.private_key)
+        except Exception as e:
+            logger.info(f"Fast handshake rejected for {client_id}: {str(e) or 'undecryptable hello'}")
+            return None
+        if role!="main" or len(kex_public_bytes)!=X25519_KEY_SIZE:
+            logger.warning(f"Fast handshake rejected for {client_id}: unsupported role {role}")
+            return None
+        if not validate_token_key(token,await loop.run_in_executor(self.auth_executor,expected_token_key,self.config.token,client_salt)):
+            logger.warning(f"Invalid token from {client_id}")
+            return None
+        if not await self.check_replay("hello",client_salt):
+            logger.warning(f"Fast handshake rejected for {client_id}: replayed hello")
+            return None
+        server_private_key,server_public_bytes=generate_x25519_keypair()
+        return x25519_session_key(server_private_key,kex_public_bytes,client_salt),client_salt,pack_x25519_session(server_public_bytes)
+
+    def new_compressor(self,port):
+        return PayloadCompressor(self.compression_codec,port) if self.compression_codec else None
+
+    def new_write_queue(self):
+        return BudgetedQueue("write_queue",0 if self.conn_windows.enabled else 512)
+
+    def conn_queues(self,conn_id):
+        if self.shard:
+            channel=self.child_channels.get(self.tunnel_manager.get_channel(conn_id,"main"))
+            if channel:
+                return channel.get("send_queue"),channel.get("control_queue")
+        return self.main_send_queue,self.main_control_queue
+
+    def grant_window(self,conn_id,size):
+        increment=self.conn_windows.consume(conn_id,size)
+        control_queue=self.conn_queues(conn_id)[1]
+        if increment and control_queue:
+            frame=window_update_frame(conn_id,increment)
+            try:
+                control_queue.put_nowait(frame)
+            except asyncio.QueueFull:
+                asyncio.ensure_future(control_queue.put(frame))
+
+    def enable_flow_control(self):
+        for conn_id,increment in self.conn_windows.enable():
+            try:
+                self.conn_queues(conn_id)[1].put_nowait(window_update_frame(conn_id,increment))
+            except (asyncio.QueueFull,AttributeError):
+                logger.warning(f"Control queue unavailable, dropping window update for {conn_id}")
+
     def mode_is_server_listen(self):
         return self.config.mode=="reverse"
 
@@ -119,23 +220,15 @@ class GhostWireServer:
         return reader,writer
 
     def clear_conn_writers(self):
-        for conn_id,task in list(self.conn_write_tasks.items()):
-            if not task.done():
-                task.cancel()
-        self.conn_write_tasks.clear()
-        self.conn_write_queues.clear()
-        self.conn_data_tx_seq.clear()
-        self.conn_data_seq_enabled.clear()
-        self.conn_data_rx_expected.clear()
-        self.conn_data_rx_pending.clear()
-        self.conn_data_close_seq.clear()
+        self.tunnel_manager.clear_writers()
+        self.conn_windows.reset()
 
     async def close_conn_writer(self,conn_id,flush=False):
-        queue=self.conn_write_queues.get(conn_id)
-        task=self.conn_write_tasks.get(conn_id)
+        state=self.tunnel_manager.conns.get(conn_id)
+        queue=state.write_queue if state else None
+        task=state.write_task if state else None
         if not queue or not task:
-            self.conn_write_queues.pop(conn_id,None)
-            self.conn_write_tasks.pop(conn_id,None)
+            self.tunnel_manager.pop_writer(conn_id)
             return
         if flush:
             try:
@@ -150,8 +243,7 @@ class GhostWireServer:
             await asyncio.wait_for(task,timeout=2)
         except:
             task.cancel()
-        self.conn_write_queues.pop(conn_id,None)
-        self.conn_write_tasks.pop(conn_id,None)
+        self.tunnel_manager.pop_writer(conn_id)
 
     async def conn_writer_loop(self,conn_id,writer,queue):
         try:
@@ -176,6 +268,7 @@ class GhostWireServer:
                     written+=len(p)
                     queue.task_done()
                 await asyncio.wait_for(writer.drain(),timeout=15)
+                self.grant_window(conn_id,written)
         except asyncio.CancelledError:
             logger.debug(f"Writer task canceled for {conn_id}")
         except asyncio.TimeoutError:
@@ -183,118 +276,53 @@ class GhostWireServer:
         except Exception as e:
             logger.debug(f"Writer loop error for {conn_id}: {e}")
         finally:
-            self.conn_write_queues.pop(conn_id,None)
-            self.conn_write_tasks.pop(conn_id,None)
+            self.conn_windows.finish(conn_id)
             self.clear_conn_data_state(conn_id)
             self.tunnel_manager.remove_connection(conn_id)
 
-    async def sender_task(self,websocket,send_queue,control_queue,stop_event):
+    async def sender_task(self,websocket,outbound,tx=None):
+        policy=BatchPolicy(self.ws_send_batch_bytes,self.config.batch_latency_ms/1000)
+        pool=BatchBufferPool()
         try:
-            while not stop_event.is_set() or not send_queue.empty() or not control_queue.empty():
-                batch=bytearray()
-                queue_depth=send_queue.qsize()+control_queue.qsize()
-                if queue_depth<10:
-                    adaptive_batch_size=16384
-                elif queue_depth<50:
-                    adaptive_batch_size=self.ws_send_batch_bytes
-                else:
-                    adaptive_batch_size=min(self.ws_send_batch_bytes*2,131072)
-                for _ in range(64):
-                    try:
-                        batch.extend(control_queue.get_nowait())
-                    except asyncio.QueueEmpty:
-                        break
-                while len(batch)<adaptive_batch_size:
-                    try:
-                        batch.extend(send_queue.get_nowait())
-                    except asyncio.QueueEmpty:
-                        break
-                if not batch:
-                    control_get=asyncio.create_task(control_queue.get())
-                    data_get=asyncio.create_task(send_queue.get())
-                    stop_get=asyncio.create_task(stop_event.wait())
-                    done,pending=await asyncio.wait({control_get,data_get,stop_get},return_when=asyncio.FIRST_COMPLETED)
-                    for task in pending:
-                        task.cancel()
-                    if pending:
-                        await asyncio.gather(*pending,return_exceptions=True)
-                    if stop_get in done and control_get not in done and data_get not in done:
-                        break
-                    if control_get in done:
-                        batch.extend(control_get.result())
-                    if data_get in done:
-                        batch.extend(data_get.result())
-                    while len(batch)<adaptive_batch_size:
-                        try:
-                            batch.extend(control_queue.get_nowait())
-                        except asyncio.QueueEmpty:
-                            break
-                    while len(batch)<adaptive_batch_size:
-                        try:
-                            batch.extend(send_queue.get_nowait())
-                        except asyncio.QueueEmpty:
-                            break
+            while not outbound.stop_event.is_set() or not outbound.empty():
+                if outbound.empty():
+                    await outbound.wait()
+                    continue
+                batch=await policy.collect(outbound)
                 if batch:
-                    await websocket.send(bytes(batch))
+                    if tx is not None:
+                        tx.cipher=self.cipher
+                    buffer,view=await pack_messages_into(batch,self.key,pool,tx if self.implicit_nonces else None)
+                    try:
+                        await websocket.send(view)
+                    finally:
+                        del view
+                        pool.release(buffer)
         except Exception as e:
             logger.debug(f"Sender task error: {e}")
         finally:
             logger.debug("Sender task stopped")
 
     def get_available_child_ids(self):
-        return [child_id for child_id,channel in self.child_channels.items() if channel.get("ws") and getattr(channel.get("ws"),"close_code",None) is None]
+        return self.child_channels.available_ids()
 
     def pick_child_for_connection(self):
-        child_ids=self.get_available_child_ids()
-        if not child_ids:
-            return None
-        best_child=None
-        min_load=float("inf")
-        for child_id in child_ids:
-            channel=self.child_channels.get(child_id)
-            if not channel:
-                continue
-            send_queue=channel.get("send_queue")
-            conn_count=sum(1 for mapped_child in self.conn_channel_map.values() if mapped_child==child_id)
-            queue_depth=send_queue.qsize() if send_queue else 0
-            load_score=queue_depth+conn_count*10
-            if load_score<min_load:
-                min_load=load_score
-                best_child=child_id
-        if best_child:
-            return best_child
-        child_id=child_ids[self.child_rr_index%len(child_ids)]
-        self.child_rr_index+=1
-        return child_id
+        return self.child_channels.least_loaded()
 
     def clear_conn_data_state(self,conn_id):
+        self.conn_windows.discard(conn_id)
         self.preconnect_buffers.pop(conn_id,None)
-        self.conn_data_tx_seq.pop(conn_id,None)
-        self.conn_data_seq_enabled.discard(conn_id)
-        self.conn_data_rx_expected.pop(conn_id,None)
-        self.conn_data_rx_pending.pop(conn_id,None)
-        self.conn_data_rx_wait_start.pop(conn_id,None)
-        self.conn_data_close_seq.pop(conn_id,None)
+        self.tunnel_manager.clear_data(conn_id)
 
     def should_stripe_data(self):
-        return self.config.ws_pool_enabled and self.config.ws_pool_stripe and self.config.protocol in ("websocket","aiohttp-ws") and len(self.get_available_child_ids())>1
-
-    def next_data_seq(self,conn_id):
-        seq=self.conn_data_tx_seq.get(conn_id,0)
-        self.conn_data_tx_seq[conn_id]=seq+1
-        return seq
+        return self.config.ws_pool_enabled and self.config.ws_pool_stripe and self.config.protocol in ("websocket","aiohttp-ws") and not self.shard and self.child_channels.available_count()>1
 
     def pick_data_channel(self,conn_id):
         if self.should_stripe_data():
-            child_ids=self.get_available_child_ids()
-            if child_ids:
-                child_id=child_ids[self.data_rr_index%len(child_ids)]
-                self.data_rr_index+=1
+            child_id=self.child_channels.next_available()
+            if child_id:
                 return child_id
-        mapped_child=self.conn_channel_map.get(conn_id)
-        if mapped_child:
-            return mapped_child
-        return "main"
+        return self.tunnel_manager.get_channel(conn_id,"main")
 
     def get_send_queue_for_channel(self,channel_id):
         if channel_id=="main":
@@ -305,68 +333,62 @@ class GhostWireServer:
         return None
 
     async def maybe_finalize_close_seq(self,conn_id):
-        close_state=self.conn_data_close_seq.get(conn_id)
-        if not close_state:
+        state=self.tunnel_manager.conns.get(conn_id)
+        if not state or not state.close_seq:
             return
-        close_seq,_=close_state
-        expected=self.conn_data_rx_expected.get(conn_id,0)
-        pending=self.conn_data_rx_pending.get(conn_id,{})
-        if expected>=close_seq and not pending:
-            self.conn_data_close_seq.pop(conn_id,None)
+        close_seq,_=state.close_seq
+        if state.rx_expected>=close_seq and not state.rx_pending:
+            state.close_seq=None
             await self.handle_close(conn_id)
-            self.conn_channel_map.pop(conn_id,None)
+            self.tunnel_manager.pop_channel(conn_id)
             self.clear_conn_data_state(conn_id)
 
     async def handle_data_seq(self,conn_id,seq,payload):
-        expected=self.conn_data_rx_expected.get(conn_id,0)
+        state=self.tunnel_manager.state(conn_id)
+        expected=state.rx_expected
         if seq<expected:
             return
         if seq==expected:
-            self.conn_data_rx_wait_start.pop(conn_id,None)
+            state.rx_wait_start=None
             await self.handle_data(conn_id,payload)
             expected+=1
-            pending=self.conn_data_rx_pending.get(conn_id)
+            pending=state.rx_pending
             while pending and expected in pending:
                 next_payload=pending.pop(expected)
                 await self.handle_data(conn_id,next_payload)
                 expected+=1
             if pending is not None and not pending:
-                self.conn_data_rx_pending.pop(conn_id,None)
-                self.conn_data_rx_wait_start.pop(conn_id,None)
-            else:
-                if conn_id not in self.conn_data_rx_wait_start:
-                    self.conn_data_rx_wait_start[conn_id]=time.time()
-            self.conn_data_rx_expected[conn_id]=expected
+                state.rx_pending=None
+                state.rx_wait_start=None
+            elif state.rx_wait_start is None:
+                state.rx_wait_start=time.time()
+            state.rx_expected=expected
             await self.maybe_finalize_close_seq(conn_id)
             return
-        pending=self.conn_data_rx_pending.setdefault(conn_id,{})
-        if seq not in pending:
-            pending[seq]=payload
-            if conn_id not in self.conn_data_rx_wait_start:
-                self.conn_data_rx_wait_start[conn_id]=time.time()
+        if state.rx_pending is None:
+            state.rx_pending={}
+        if seq not in state.rx_pending:
+            state.rx_pending[seq]=payload
+            if state.rx_wait_start is None:
+                state.rx_wait_start=time.time()
 
     async def sequence_timeout_monitor(self):
         while self.running and not self.shutdown_event.is_set():
             await asyncio.sleep(2)
             now=time.time()
-            timed_out=[]
-            for conn_id,start_time in list(self.conn_data_rx_wait_start.items()):
-                if now-start_time>self.seq_timeout:
-                    timed_out.append(conn_id)
-            for conn_id in timed_out:
-                expected=self.conn_data_rx_expected.get(conn_id,0)
-                logger.warning(f"Connection {conn_id} sequence {expected} missing, skipping (VPN/TCP will retransmit)")
-                self.conn_data_rx_expected[conn_id]=expected+1
-                pending=self.conn_data_rx_pending.get(conn_id,{})
-                while pending and self.conn_data_rx_expected[conn_id] in pending:
-                    next_seq=self.conn_data_rx_expected[conn_id]
-                    next_payload=pending.pop(next_seq)
+            timed_out=[(conn_id,state) for conn_id,state in list(self.tunnel_manager.conns.items()) if state.rx_wait_start is not None and now-state.rx_wait_start>self.seq_timeout]
+            for conn_id,state in timed_out:
+                logger.warning(f"Connection {conn_id} sequence {state.rx_expected} missing, skipping (VPN/TCP will retransmit)")
+                state.rx_expected+=1
+                pending=state.rx_pending or {}
+                while pending and state.rx_expected in pending:
+                    next_payload=pending.pop(state.rx_expected)
                     await self.handle_data(conn_id,next_payload)
-                    self.conn_data_rx_expected[conn_id]+=1
-                if pending and self.conn_data_rx_expected[conn_id] not in pending:
-                    self.conn_data_rx_wait_start[conn_id]=time.time()
+                    state.rx_expected+=1
+                if pending and state.rx_expected not in pending:
+                    state.rx_wait_start=time.time()
                 else:
-                    self.conn_data_rx_wait_start.pop(conn_id,None)
+                    state.rx_wait_start=None
 
     async def close_child_channels(self):
         async def _close_one(child_id,channel):
@@ -387,21 +409,21 @@ class GhostWireServer:
                     pass
             self.child_channels.pop(child_id,None)
         await asyncio.gather(*[_close_one(cid,ch) for cid,ch in list(self.child_channels.items())],return_exceptions=True)
-        self.conn_channel_map.clear()
+        self.tunnel_manager.clear_channels()
 
     async def close_connections_for_child(self,child_id):
-        affected=[conn_id for conn_id,mapped_child in self.conn_channel_map.items() if mapped_child==child_id]
-        if self.conn_data_seq_enabled:
-            striped_count=len(self.conn_data_seq_enabled)
+        affected=self.tunnel_manager.channel_conns(child_id)
+        striped_count=self.tunnel_manager.striped_count()
+        if striped_count:
             logger.info(f"Child {child_id} lost during striped mode, {striped_count} striped connections will timeout if sequences are missing")
             for conn_id in affected:
-                self.conn_channel_map.pop(conn_id,None)
+                self.tunnel_manager.pop_channel(conn_id)
             return
-        alternative_children=self.get_available_child_ids()
+        alternative_children=[] if self.shard else self.get_available_child_ids()
         if not alternative_children:
             logger.warning(f"Child {child_id} lost, closing {len(affected)} connections (no alternatives)")
             for conn_id in affected:
-                self.conn_channel_map.pop(conn_id,None)
+                self.tunnel_manager.pop_channel(conn_id)
                 self.clear_conn_data_state(conn_id)
                 await self.close_conn_writer(conn_id,flush=False)
                 self.tunnel_manager.remove_connection(conn_id)
@@ -411,7 +433,7 @@ class GhostWireServer:
             for conn_id in affected:
                 new_child=alternative_children[reassign_index%len(alternative_children)]
                 reassign_index+=1
-                self.conn_channel_map[conn_id]=new_child
+                self.tunnel_manager.set_channel(conn_id,new_child)
                 logger.debug(f"Reassigned connection {conn_id} from {child_id} to {new_child}")
 
     async def route_message(self,msg_type,conn_id,payload):
@@ -422,19 +444,33 @@ class GhostWireServer:
             await self.handle_data_seq(conn_id,seq,data_payload)
         elif msg_type==MSG_CLOSE:
             await self.handle_close(conn_id)
-            self.conn_channel_map.pop(conn_id,None)
+            self.tunnel_manager.pop_channel(conn_id)
             self.clear_conn_data_state(conn_id)
         elif msg_type==MSG_CLOSE_SEQ:
             close_seq,reason=unpack_close_seq(payload)
-            self.conn_data_close_seq[conn_id]=(close_seq,reason)
+            self.tunnel_manager.state(conn_id).close_seq=(close_seq,reason)
             await self.maybe_finalize_close_seq(conn_id)
+        elif msg_type==MSG_WINDOW_UPDATE:
+            self.conn_windows.grant(conn_id,unpack_window_update(payload))
         elif msg_type==MSG_ERROR:
             logger.error(f"Client error for {conn_id}: {payload.decode()}")
             self.tunnel_manager.remove_connection(conn_id)
-            self.conn_channel_map.pop(conn_id,None)
+            self.tunnel_manager.pop_channel(conn_id)
             self.clear_conn_data_state(conn_id)
         elif msg_type==MSG_INFO:
-            self.client_version=payload.decode()
+            version,features=unpack_info(payload)
+            if features:
+                if self.shard and FEATURE_SHARDED not in features:
+                    logger.error("Client does not support sharded workers, upgrade the client or set workers=1")
+                    if self.main_websocket:
+                        await self.main_websocket.close()
+                    return
+                self.apply_client_features(features)
+                if self.shard:
+                    self.shard.send("session",self.key,features)
+                logger.info(f"Client features: {','.join(sorted(features))} (implicit nonces {'on' if self.implicit_nonces else 'off'}, cipher {self.cipher}, compression {codec_name(self.compression_codec)})")
+                return
+            self.client_version=version
             logger.info(f"Client version: {self.client_version}")
     async def handle_client(self,websocket):
         client_id=f"{websocket.remote_address[0]}:{websocket.remote_address[1]}"
@@ -447,44 +483,107 @@ class GhostWireServer:
         seq_monitor=None
         pool_monitor=None
         udp_cleanup=None
-        send_queue=asyncio.Queue(maxsize=512)
-        control_queue=asyncio.Queue(maxsize=256)
-        stop_event=asyncio.Event()
+        outbound=OutboundQueue()
+        send_queue=outbound.data
+        control_queue=outbound.control
+        stop_event=outbound.stop_event
         self.last_ping_time=time.time()
         try:
+            loop=asyncio.get_running_loop()
             auth_salt=os.urandom(AUTH_SALT_SIZE)
+            early_handshake=websocket.early_handshake
             pubkey_msg=pack_pubkey(self.public_key,auth_salt)
             await websocket.send(pubkey_msg)
-            buffer=bytearray()
-            auth_msg=await asyncio.wait_for(websocket.recv(),timeout=30)
-            buffer.extend(auth_msg)
-            async with self.auth_lock:
-                if len(buffer)<9:
-                    logger.warning(f"Incomplete auth from {client_id}")
+            decoder=FrameDecoder()
+            if early_handshake:
+                try:
+                    frames=decoder.feed(decode_handshake_header(early_handshake))
+                except ValueError:
+                    frames=[]
+            else:
+                frames=decoder.feed(await asyncio.wait_for(websocket.recv(),timeout=30))
+            session_key=None
+            session_msg=None
+            handshake="authenticated"
+            if frames and frames[0][0] in (MSG_RESUME,MSG_HELLO):
+                first_type,_,first_payload=await open_frame(*frames[0],None)
+                if first_type==MSG_RESUME:
+                    accepted=await self.resume_session(first_payload,client_id)
+                    handshake="resumed"
+                else:
+                    accepted=await self.accept_hello(first_payload,client_id)
+                    handshake="fast-handshake"
+                if accepted is None:
+                    await websocket.send(pack_handshake_ack(first_type,False))
+                    frames=decoder.feed(await asyncio.wait_for(websocket.recv(),timeout=30))
+                    handshake="authenticated"
+                else:
+                    session_key,auth_salt,session_msg=accepted
+            elif frames and frames[0][0]==MSG_ATTACH and not early_handshake:
+                role="child"
+                handshake="attached"
+                try:
+                    child_id=unpack_attach(frames[0][2],self.key,auth_salt) if self.key else ""
+                except (ValueError,UnicodeDecodeError):
+                    logger.warning(f"Invalid attach from {client_id}")
                     return
-                msg_type,conn_id,encrypted_token,consumed=await unpack_message(buffer,None)
-                del buffer[:consumed]
+            elif early_handshake:
+                frames=[]
+            if not frames:
+                logger.warning(f"Incomplete auth from {client_id}")
+                return
+            if handshake=="authenticated":
+                msg_type,conn_id,encrypted_token=await open_frame(*frames[0],None)
                 if msg_type!=MSG_AUTH:
                     logger.warning(f"Expected AUTH message from {client_id}")
                     return
+                expected_key=loop.run_in_executor(self.auth_executor,expected_token_key,self.config.token,auth_salt)
                 try:
-                    token,role,child_id=unpack_auth_payload(rsa_decrypt(self.private_key,encrypted_token))
+                    token,role,child_id=unpack_auth_payload(await loop.run_in_executor(self.auth_executor,rsa_decrypt,self.private_key,encrypted_token))
                 except Exception as e:
+                    expected_key.cancel()
                     logger.warning(f"Failed to decrypt token from {client_id}: {e}")
                     return
-                if not validate_token(token,self.config.token,auth_salt):
+                if not validate_token_key(token,await expected_key):
                     logger.warning(f"Invalid token from {client_id}")
                     return
+                if role=="main":
+                    client_pubkey_msg=await asyncio.wait_for(websocket.recv(),timeout=10)
+                    if len(client_pubkey_msg)<9:
+                        logger.warning(f"Rejecting {client_id}: invalid client public key message")
+                        return
+                    try:
+                        key_msg_type,_,client_pubkey_bytes,_=await unpack_message(client_pubkey_msg,None)
+                        if key_msg_type!=MSG_PUBKEY:
+                            logger.warning(f"Rejecting {client_id}: expected client public key message")
+                            return
+                        client_public_key=bytes(client_pubkey_bytes) if len(client_pubkey_bytes)==X25519_KEY_SIZE else deserialize_public_key(client_pubkey_bytes)
+                    except Exception as e:
+                        logger.warning(f"Rejecting {client_id}: invalid client public key: {e}")
+                        return
+                    if isinstance(client_public_key,bytes):
+                        server_private_key,server_public_bytes=generate_x25519_keypair()
+                        session_key=x25519_session_key(server_private_key,client_public_key,auth_salt)
+                        session_msg=pack_x25519_session(server_public_bytes)
+                    else:
+                        session_key=os.urandom(32)
+                        session_msg=await loop.run_in_executor(self.auth_executor,pack_session_key,session_key,client_public_key)
+            async with self.auth_lock:
                 if role=="main":
                     if self.main_websocket is not None:
                         logger.warning(f"Rejecting {client_id}: main already connected")
                         return
+                    if self.shard and not await self.shard.request("claim"):
+                        logger.warning(f"Rejecting {client_id}: main already connected to another worker")
+                        return
                 elif role=="child":
                     if not self.config.ws_pool_enabled:
                         logger.warning(f"Rejecting {client_id}: child channels disabled")
                         return
-                    if self.main_websocket is None:
+                    if not self.session_active():
                         logger.warning(f"Rejecting {client_id}: main not connected")
+                        if self.shard:
+                            await websocket.close(CLOSE_TRY_AGAIN)
                         return
                     if not child_id:
                         logger.warning(f"Rejecting {client_id}: missing child id")
@@ -492,28 +591,21 @@ class GhostWireServer:
                     if self.key is None:
                         logger.warning(f"Rejecting {client_id}: missing main session key")
                         return
+                    if self.shard and len(self.child_channels)>=self.shard.child_quota():
+                        logger.info(f"Rejecting {client_id}: worker {self.shard.index} holds its share of {self.shard.child_count} children")
+                        await websocket.close(CLOSE_TRY_AGAIN)
+                        return
                 else:
                     logger.warning(f"Rejecting {client_id}: unknown role {role}")
                     return
                 authenticated=True
                 if role=="main":
-                    client_pubkey_msg=await asyncio.wait_for(websocket.recv(),timeout=10)
-                    if len(client_pubkey_msg)<9:
-                        logger.warning(f"Rejecting {client_id}: invalid client public key message")
-                        return
-                    try:
-                        key_msg_type,_,client_pubkey_bytes,_=await unpack_message(client_pubkey_msg,None)
-                        if key_msg_type!=MSG_PUBKEY:
-                            logger.warning(f"Rejecting {client_id}: expected client public key message")
-                            return
-                        client_public_key=deserialize_public_key(client_pubkey_bytes)
-                    except Exception as e:
-                        logger.warning(f"Rejecting {client_id}: invalid client public key: {e}")
-                        return
-                    self.key=os.urandom(32)
-                    await websocket.send(pack_session_key(self.key,client_public_key))
-                logger.info(f"Client {client_id} authenticated role={role}")
-                sender=asyncio.create_task(self.sender_task(websocket,send_queue,control_queue,stop_event))
+                    self.key=session_key
+                    if session_msg:
+                        await websocket.send(session_msg)
+                tx,rx=channel_nonce_counters(self.key,auth_salt,"server")
+                logger.info(f"Client {client_id} {handshake} role={role}")
+                sender=asyncio.create_task(self.sender_task(websocket,outbound,tx))
                 if role=="main":
                     self.websocket=websocket
                     self.main_websocket=websocket
@@ -523,14 +615,19 @@ class GhostWireServer:
                     self.main_control_queue=control_queue
                     ping_monitor=asyncio.create_task(self.ping_monitor_loop())
                     seq_monitor=asyncio.create_task(self.sequence_timeout_monitor())
+                    control_queue.put_nowait(await pack_info(self.updater.current_version,self.key,self.local_features()))
+                    if self.config.session_tickets:
+                        control_queue.put_nowait(await pack_ticket(issue_ticket(self.ticket_key,self.key,self.config.session_ticket_lifetime),self.key))
                     if self.config.ws_pool_enabled:
                         self.current_child_count=self.config.ws_pool_min
+                        self.publish_pool()
                         try:
                             control_queue.put_nowait(await pack_child_cfg(self.current_child_count,self.key))
                         except asyncio.QueueFull:
                             logger.warning("Main control queue full, child config dropped")
                         pool_monitor=asyncio.create_task(self.pool_manager_loop())
-                    udp_cleanup=asyncio.create_task(self.udp_session_cleanup_loop())
+                    if not self.shard:
+                        udp_cleanup=asyncio.create_task(self.udp_session_cleanup_loop())
                 else:
                     self.child_channels[child_id]={"ws":websocket,"send_queue":send_queue,"control_queue":control_queue,"stop_event":stop_event,"sender":sender}
                 if not self.listeners and self.mode_is_server_listen():
@@ -538,14 +635,8 @@ class GhostWireServer:
             async for message in websocket:
                 if role=="main":
                     self.last_ping_time=time.time()
-                buffer.extend(message)
-                while len(buffer)>=9:
-                    try:
-                        msg_type,conn_id,payload,consumed=await unpack_message(buffer,self.key)
-                        del buffer[:consumed]
-                    except ValueError:
-                        break
-                    if msg_type in (MSG_DATA,MSG_DATA_SEQ,MSG_CLOSE,MSG_CLOSE_SEQ,MSG_ERROR,MSG_INFO):
+                async for msg_type,conn_id,payload in iter_open_frames(decoder.feed(message),self.key,rx):
+                    if msg_type in self.ROUTED_MESSAGES:
                         await self.route_message(msg_type,conn_id,payload)
                     elif msg_type==MSG_PING:
                         timestamp=struct.unpack("!Q",payload)[0]
@@ -557,11 +648,11 @@ class GhostWireServer:
                         pass
                     elif msg_type==MSG_CONNECT and self.mode_is_client_connect():
                         remote_ip,remote_port=unpack_connect(payload)
-                        self.conn_channel_map[conn_id]="main"
+                        self.tunnel_manager.set_channel(conn_id,child_id if self.shard and role=="child" else "main")
                         asyncio.create_task(self.handle_direct_connect(conn_id,remote_ip,remote_port))
                     elif msg_type==MSG_CONNECT_UDP and self.mode_is_client_connect():
                         remote_ip,remote_port=unpack_connect(payload)
-                        self.conn_channel_map[conn_id]="main"
+                        self.tunnel_manager.set_channel(conn_id,child_id if self.shard and role=="child" else "main")
                         asyncio.create_task(self.handle_direct_connect_udp(conn_id,remote_ip,remote_port))
         except asyncio.TimeoutError:
             logger.warning(f"Client {client_id} authentication timeout")
@@ -586,20 +677,57 @@ class GhostWireServer:
                 udp_cleanup.cancel()
             if authenticated:
                 if role=="main":
-                    self.udp_sessions.clear()
-                    await self.close_child_channels()
-                    self.clear_conn_writers()
-                    self.websocket=None
-                    self.main_websocket=None
-                    self.send_queue=None
-                    self.control_queue=None
-                    self.main_send_queue=None
-                    self.main_control_queue=None
-                    self.client_version=None
-                    self.tunnel_manager.close_all()
+                    if self.shard:
+                        self.shard.send("closed")
+                    await self.end_session()
                 else:
                     self.child_channels.pop(child_id,None)
                     await self.close_connections_for_child(child_id)
+                    self.release_listeners()
+
+    async def end_session(self):
+        self.udp_sessions.clear()
+        await self.close_child_channels()
+        self.clear_conn_writers()
+        self.websocket=None
+        self.main_websocket=None
+        self.send_queue=None
+        self.control_queue=None
+        self.main_send_queue=None
+        self.main_control_queue=None
+        self.client_version=None
+        self.implicit_nonces=False
+        self.compression_codec=None
+        self.cipher=CIPHER_AESGCM
+        self.tunnel_manager.close_all()
+        self.release_listeners()
+
+    def publish_pool(self):
+        if self.shard:
+            self.shard.child_count=self.current_child_count
+            self.shard.send("pool",self.current_child_count)
+
+    def on_shard_message(self,message):
+        kind=message[0]
+        if kind=="session":
+            self.key=message[1]
+            self.apply_client_features(message[2])
+            self.shard.active=True
+            logger.info(f"Worker {self.shard.index} joined main session")
+        elif kind=="closed":
+            self.shard.active=False
+            asyncio.create_task(self.end_session())
+        elif kind=="pool":
+            self.shard.child_count=message[1]
+        elif kind=="load":
+            self.shard.loads[message[1]]=message[2:]
+
+    async def shard_report_loop(self):
+        while self.running and not self.shutdown_event.is_set():
+            await asyncio.sleep(self.config.ws_pool_scale_interval)
+            if self.shard.active and not self.main_websocket:
+                qsize=sum(channel["send_queue"].qsize() for channel in self.child_channels.values())
+                self.shard.send("load",self.tunnel_manager.active_count(),qsize)
 
     async def pool_manager_loop(self):
         scale_down_count=0
@@ -608,7 +736,11 @@ class GhostWireServer:
             if not self.main_websocket or not self.send_queue:
                 continue
             qsize=self.send_queue.qsize()
-            active=len(self.tunnel_manager.connections)
+            active=self.tunnel_manager.active_count()
+            if self.shard:
+                remote_active,remote_queued=self.shard.remote_load()
+                active+=remote_active
+                qsize+=remote_queued
             target=self.current_child_count
             if qsize>=self.config.ws_pool_scale_up or active>self.current_child_count*10:
                 target=min(self.config.ws_pool_children,self.current_child_count+1)
@@ -622,6 +754,7 @@ class GhostWireServer:
                 scale_down_count=0
             if target!=self.current_child_count:
                 self.current_child_count=target
+                self.publish_pool()
                 try:
                     self.control_queue.put_nowait(await pack_child_cfg(self.current_child_count,self.key))
                     logger.info(f"Pool scaled to {self.current_child_count} connections (queue={qsize}, active={active})")
@@ -646,7 +779,7 @@ class GhostWireServer:
             conn_id,_,channel_id=self.udp_sessions[key]
             self.udp_sessions[key]=(conn_id,time.time(),channel_id)
         else:
-            if not self.websocket or not self.send_queue:
+            if not self.session_active():
                 return
             conn_id=self.tunnel_manager.generate_conn_id()
             writer=UDPWriterAdapter(local_transport,src_addr)
@@ -661,7 +794,7 @@ class GhostWireServer:
                     if channel:
                         send_queue=channel.get("send_queue")
                         control_queue=channel.get("control_queue")
-                        self.conn_channel_map[conn_id]=selected_child
+                        self.tunnel_manager.set_channel(conn_id,selected_child)
                         channel_id=selected_child
             self.udp_sessions[key]=(conn_id,time.time(),channel_id)
             connect_msg=await pack_connect_udp(conn_id,remote_ip,remote_port,self.key)
@@ -675,7 +808,7 @@ class GhostWireServer:
         send_queue=self.get_send_queue_for_channel(channel_id)
         if not send_queue:
             return
-        message=await pack_data(conn_id,data,self.key)
+        message=data_frame(conn_id,data)
         try:
             send_queue.put_nowait(message)
         except asyncio.QueueFull:
@@ -691,10 +824,10 @@ class GhostWireServer:
                 send_queue=self.get_send_queue_for_channel(channel_id)
                 if send_queue and self.key:
                     try:
-                        send_queue.put_nowait(await pack_close(conn_id,0,self.key))
+                        send_queue.put_nowait(close_frame(conn_id,0))
                     except asyncio.QueueFull:
                         pass
-                self.conn_channel_map.pop(conn_id,None)
+                self.tunnel_manager.pop_channel(conn_id)
                 self.tunnel_manager.remove_connection(conn_id)
 
     async def handle_udp_client(self,session,role="main",child_id=""):
@@ -723,13 +856,14 @@ class GhostWireServer:
         seq_monitor=None
         pool_monitor=None
         udp_cleanup=None
-        send_queue=asyncio.Queue(maxsize=512)
-        control_queue=asyncio.Queue(maxsize=256)
-        stop_event=asyncio.Event()
+        outbound=OutboundQueue()
+        send_queue=outbound.data
+        control_queue=outbound.control
+        stop_event=outbound.stop_event
         if role=="main":
             self.last_ping_time=time.time()
         try:
-            sender=asyncio.create_task(self.sender_task(session,send_queue,control_queue,stop_event))
+            sender=asyncio.create_task(self.sender_task(session,outbound))
             if role=="main":
                 self.websocket=session
                 self.main_websocket=session
@@ -758,7 +892,7 @@ class GhostWireServer:
                 if role=="main":
                     self.last_ping_time=time.time()
                 msg_type,conn_id,payload,_=await unpack_message(message,self.key)
-                if msg_type in (MSG_DATA,MSG_DATA_SEQ,MSG_CLOSE,MSG_CLOSE_SEQ,MSG_ERROR,MSG_INFO):
+                if msg_type in self.ROUTED_MESSAGES:
                     await self.route_message(msg_type,conn_id,payload)
                 elif msg_type==MSG_PING:
                     timestamp=struct.unpack("!Q",payload)[0]
@@ -768,11 +902,11 @@ class GhostWireServer:
                         pass
                 elif msg_type==MSG_CONNECT and self.mode_is_client_connect():
                     remote_ip,remote_port=unpack_connect(payload)
-                    self.conn_channel_map[conn_id]=source_channel_id
+                    self.tunnel_manager.set_channel(conn_id,source_channel_id)
                     asyncio.create_task(self.handle_direct_connect(conn_id,remote_ip,remote_port))
                 elif msg_type==MSG_CONNECT_UDP and self.mode_is_client_connect():
                     remote_ip,remote_port=unpack_connect(payload)
-                    self.conn_channel_map[conn_id]=source_channel_id
+                    self.tunnel_manager.set_channel(conn_id,source_channel_id)
                     asyncio.create_task(self.handle_direct_connect_udp(conn_id,remote_ip,remote_port))
         except ConnectionError:
             logger.info(f"UDP raw client disconnected from {session.remote_address}")
@@ -794,17 +928,7 @@ class GhostWireServer:
             if udp_cleanup:
                 udp_cleanup.cancel()
             if role=="main":
-                self.udp_sessions.clear()
-                await self.close_child_channels()
-                self.clear_conn_writers()
-                self.websocket=None
-                self.main_websocket=None
-                self.send_queue=None
-                self.control_queue=None
-                self.main_send_queue=None
-                self.main_control_queue=None
-                self.client_version=None
-                self.tunnel_manager.close_all()
+                await self.end_session()
             elif role=="child":
                 self.child_channels.pop(child_id,None)
                 await self.close_connections_for_child(child_id)
@@ -816,38 +940,51 @@ class GhostWireServer:
                 reader,writer=await self.connect_via_http_proxy(remote_ip,remote_port,direct_proxy,timeout=10)
             else:
                 reader,writer=await asyncio.wait_for(asyncio.open_connection(remote_ip,remote_port),timeout=10)
+            if conn_id not in self.tunnel_manager.conns:
+                logger.debug(f"Connection {conn_id} closed while connecting to {remote_ip}:{remote_port}")
+                writer.close()
+                return
             self.tunnel_manager.add_connection(conn_id,(reader,writer))
-            queue=asyncio.Queue(maxsize=512)
-            self.conn_write_queues[conn_id]=queue
-            self.conn_write_tasks[conn_id]=asyncio.create_task(self.conn_writer_loop(conn_id,writer,queue))
+            state=self.tunnel_manager.state(conn_id)
+            queue=state.write_queue=self.new_write_queue()
+            state.write_task=asyncio.create_task(self.conn_writer_loop(conn_id,writer,queue))
             for buffered in self.preconnect_buffers.pop(conn_id,[]):
                 try:
                     queue.put_nowait(buffered)
                 except asyncio.QueueFull:
                     break
-            asyncio.create_task(self.forward_direct_remote_to_ws(conn_id,reader))
+            asyncio.create_task(self.forward_direct_remote_to_ws(conn_id,reader,remote_port))
         except Exception as e:
             logger.error(f"Direct connect failed to {remote_ip}:{remote_port}: {e}")
+            control_queue=self.conn_queues(conn_id)[1]
             self.clear_conn_data_state(conn_id)
-            self.conn_channel_map.pop(conn_id,None)
+            self.tunnel_manager.pop_channel(conn_id)
             error_msg=await pack_error(conn_id,str(e),self.key)
             try:
-                if self.control_queue:
-                    self.control_queue.put_nowait(error_msg)
+                if control_queue:
+                    control_queue.put_nowait(error_msg)
             except (asyncio.QueueFull,AttributeError):
                 pass
 
-    async def forward_direct_remote_to_ws(self,conn_id,reader):
+    async def forward_direct_remote_to_ws(self,conn_id,reader,port):
+        compressor=self.new_compressor(port)
+        self.conn_windows.open(conn_id)
         try:
             while True:
-                data=await reader.read(self.io_chunk_size)
+                if governor.over_budget():
+                    await governor.wait_for_room()
+                size=await self.conn_windows.acquire(conn_id,self.io_chunk_size)
+                data=await reader.read(size)
                 if not data:
                     break
+                self.conn_windows.spend(conn_id,len(data))
                 channel_id=self.pick_data_channel(conn_id)
                 send_queue=self.get_send_queue_for_channel(channel_id)
-                if not self.websocket or not send_queue:
+                if not self.session_active() or not send_queue:
                     break
-                message=await pack_data(conn_id,data,self.key)
+                message=data_frame(conn_id,data)
+                if compressor:
+                    message=await compressor.compress_frame(message)
                 try:
                     send_queue.put_nowait(message)
                 except asyncio.QueueFull:
@@ -860,13 +997,14 @@ class GhostWireServer:
             logger.debug(f"Direct forward error for {conn_id}: {e}")
         finally:
             try:
-                if self.websocket and self.send_queue:
-                    self.send_queue.put_nowait(await pack_close(conn_id,0,self.key))
-                elif self.websocket and self.control_queue:
-                    self.control_queue.put_nowait(await pack_close(conn_id,0,self.key))
+                send_queue,control_queue=self.conn_queues(conn_id)
+                if self.session_active() and send_queue:
+                    send_queue.put_nowait(close_frame(conn_id,0))
+                elif self.session_active() and control_queue:
+                    control_queue.put_nowait(close_frame(conn_id,0))
             except:
                 pass
-            self.conn_channel_map.pop(conn_id,None)
+            self.tunnel_manager.pop_channel(conn_id)
             self.clear_conn_data_state(conn_id)
             self.tunnel_manager.remove_connection(conn_id)
 
@@ -884,12 +1022,13 @@ class GhostWireServer:
             asyncio.create_task(self.forward_direct_udp_response(conn_id,recv_queue))
         except Exception as e:
             logger.error(f"Direct UDP connect failed to {remote_ip}:{remote_port}: {e}")
+            control_queue=self.conn_queues(conn_id)[1]
             self.clear_conn_data_state(conn_id)
-            self.conn_channel_map.pop(conn_id,None)
+            self.tunnel_manager.pop_channel(conn_id)
             error_msg=await pack_error(conn_id,str(e),self.key)
             try:
-                if self.control_queue:
-                    self.control_queue.put_nowait(error_msg)
+                if control_queue:
+                    control_queue.put_nowait(error_msg)
             except (asyncio.QueueFull,AttributeError):
                 pass
 
@@ -905,7 +1044,7 @@ class GhostWireServer:
                 send_queue=self.get_send_queue_for_channel(self.pick_data_channel(conn_id))
                 if not send_queue:
                     break
-                message=await pack_data(conn_id,data,self.key)
+                message=data_frame(conn_id,data)
                 try:
                     send_queue.put_nowait(message)
                 except asyncio.QueueFull:
@@ -914,17 +1053,23 @@ class GhostWireServer:
             logger.debug(f"Direct UDP response error for {conn_id}: {e}")
         finally:
             try:
-                if self.control_queue and self.key:
-                    self.control_queue.put_nowait(await pack_close(conn_id,0,self.key))
+                control_queue=self.conn_queues(conn_id)[1]
+                if control_queue and self.key:
+                    control_queue.put_nowait(close_frame(conn_id,0))
             except:
                 pass
-            self.conn_channel_map.pop(conn_id,None)
+            self.tunnel_manager.pop_channel(conn_id)
             self.clear_conn_data_state(conn_id)
             self.tunnel_manager.remove_connection(conn_id)
 
     async def start_listeners(self):
+        loop=asyncio.get_running_loop()
+        reuse_port=self.shard is not None
         for local_ip,local_port,remote_ip,remote_port in self.config.port_mappings:
-            server=await asyncio.start_server(lambda r,w,rip=remote_ip,rport=remote_port:self.handle_local_connection(r,w,rip,rport),local_ip,local_port,backlog=self.config.listen_backlog)
+            if self.config.local_io=="protocol":
+                server=await loop.create_server(lambda rip=remote_ip,rport=remote_port:TunnelProtocol(self,rport,target=(rip,rport)),local_ip,local_port,backlog=self.config.listen_backlog,reuse_port=reuse_port)
+            else:
+                server=await asyncio.start_server(lambda r,w,rip=remote_ip,rport=remote_port:self.handle_local_connection(r,w,rip,rport),local_ip,local_port,backlog=self.config.listen_backlog,reuse_port=reuse_port)
             self.listeners.append(server)
             logger.info(f"Listening on {local_ip}:{local_port} -> {remote_ip}:{remote_port}")
         if self.config.udp_enabled:
@@ -932,27 +1077,63 @@ class GhostWireServer:
             udp_transports=await start_udp_local_listeners(self)
             self.listeners.extend(udp_transports)
 
+    def release_listeners(self):
+        if not self.shard or self.main_websocket or self.child_channels or not self.listeners:
+            return
+        for listener in self.listeners:
+            listener.close()
+        self.listeners.clear()
+        logger.info(f"Worker {self.shard.index} has no channels left, stopped local listeners")
+
+    def route_local_connection(self,conn_id):
+        send_queue=self.send_queue
+        control_queue=self.control_queue
+        if self.config.ws_pool_enabled:
+            selected_child=self.pick_child_for_connection()
+            if selected_child:
+                channel=self.child_channels.get(selected_child)
+                if channel:
+                    send_queue=channel.get("send_queue")
+                    control_queue=channel.get("control_queue")
+                    self.tunnel_manager.set_channel(conn_id,selected_child)
+            else:
+                logger.debug(f"No child channel available for {conn_id}, using main channel")
+        return send_queue,control_queue
+
+    def accept_local_protocol(self,protocol,remote_ip,remote_port):
+        if not governor.admit_connection():
+            logger.warning(f"Memory budget reached, shedding local connection to {remote_ip}:{remote_port}")
+            protocol.transport.close()
+            return
+        conn_id=self.tunnel_manager.generate_conn_id()
+        send_queue,control_queue=self.route_local_connection(conn_id)
+        if not self.session_active() or not send_queue or not control_queue:
+            logger.error(f"No client connected, dropping connection {conn_id}")
+            self.tunnel_manager.pop_channel(conn_id)
+            protocol.transport.close()
+            return
+        try:
+            control_queue.put_nowait(connect_frame(conn_id,remote_ip,remote_port))
+        except (asyncio.QueueFull,AttributeError):
+            logger.error(f"Control queue unavailable, dropping connection {conn_id}")
+            self.tunnel_manager.pop_channel(conn_id)
+            protocol.transport.close()
+            return
+        protocol.start(conn_id)
+
     async def handle_local_connection(self,reader,writer,remote_ip,remote_port):
+        if not governor.admit_connection():
+            logger.warning(f"Memory budget reached, shedding local connection to {remote_ip}:{remote_port}")
+            writer.close()
+            return
         conn_id=self.tunnel_manager.generate_conn_id()
         self.tunnel_manager.add_connection(conn_id,(reader,writer))
         logger.debug(f"New local connection {conn_id} -> {remote_ip}:{remote_port}")
         try:
-            send_queue=self.send_queue
-            control_queue=self.control_queue
-            selected_child=""
-            if self.config.ws_pool_enabled:
-                selected_child=self.pick_child_for_connection()
-                if selected_child:
-                    channel=self.child_channels.get(selected_child)
-                    if channel:
-                        send_queue=channel.get("send_queue")
-                        control_queue=channel.get("control_queue")
-                        self.conn_channel_map[conn_id]=selected_child
-                else:
-                    logger.debug(f"No child channel available for {conn_id}, using main channel")
-            if not self.websocket or not send_queue or not control_queue:
+            send_queue,control_queue=self.route_local_connection(conn_id)
+            if not self.session_active() or not send_queue or not control_queue:
                 logger.error(f"No client connected, dropping connection {conn_id}")
-                self.conn_channel_map.pop(conn_id,None)
+                self.tunnel_manager.pop_channel(conn_id)
                 self.clear_conn_data_state(conn_id)
                 self.tunnel_manager.remove_connection(conn_id)
                 writer.close()
@@ -963,13 +1144,13 @@ class GhostWireServer:
                 control_queue.put_nowait(connect_msg)
             except (asyncio.QueueFull,AttributeError):
                 logger.error(f"Control queue unavailable, dropping connection {conn_id}")
-                self.conn_channel_map.pop(conn_id,None)
+                self.tunnel_manager.pop_channel(conn_id)
                 self.clear_conn_data_state(conn_id)
                 self.tunnel_manager.remove_connection(conn_id)
                 writer.close()
                 await writer.wait_closed()
                 return
-            asyncio.create_task(self.forward_local_to_websocket(conn_id,reader))
+            asyncio.create_task(self.forward_local_to_websocket(conn_id,reader,remote_port))
         except Exception as e:
             logger.error(f"Error sending CONNECT: {e}")
             self.clear_conn_data_state(conn_id)
@@ -977,23 +1158,25 @@ class GhostWireServer:
             writer.close()
             await writer.wait_closed()
 
-    async def forward_local_to_websocket(self,conn_id,reader):
+    async def forward_local_to_websocket(self,conn_id,reader,port):
+        compressor=self.new_compressor(port)
+        self.conn_windows.open(conn_id)
         try:
             while True:
-                data=await reader.read(self.io_chunk_size)
+                if governor.over_budget():
+                    await governor.wait_for_room()
+                size=await self.conn_windows.acquire(conn_id,self.io_chunk_size)
+                data=await reader.read(size)
                 if not data:
                     break
-                channel_id=self.pick_data_channel(conn_id)
-                send_queue=self.get_send_queue_for_channel(channel_id)
-                if not self.websocket or not send_queue:
+                self.conn_windows.spend(conn_id,len(data))
+                send_queue=self.data_send_queue(conn_id)
+                if not send_queue:
                     logger.debug(f"Client disconnected, stopping forward for {conn_id}")
                     break
-                use_seq=conn_id in self.conn_data_seq_enabled or self.should_stripe_data()
-                if use_seq:
-                    self.conn_data_seq_enabled.add(conn_id)
-                    message=await pack_data_seq(conn_id,self.next_data_seq(conn_id),data,self.key)
-                else:
-                    message=await pack_data(conn_id,data,self.key)
+                message=self.local_data_frame(conn_id,data)
+                if compressor:
+                    message=await compressor.compress_frame(message)
                 try:
                     send_queue.put_nowait(message)
                 except asyncio.QueueFull:
@@ -1005,45 +1188,66 @@ class GhostWireServer:
         except Exception as e:
             logger.debug(f"Forward error for {conn_id}: {e}")
         finally:
-            try:
-                control_queue=self.control_queue
-                send_queue=self.send_queue
-                if self.config.ws_pool_enabled:
-                    mapped_child=self.conn_channel_map.get(conn_id)
-                    if mapped_child:
-                        self.child_queue_sizes[mapped_child]=max(0,self.child_queue_sizes.get(mapped_child,0)-1)
-                        channel=self.child_channels.get(mapped_child)
-                        if channel:
-                            control_queue=channel.get("control_queue")
-                            send_queue=channel.get("send_queue")
-                if self.websocket and send_queue:
-                    if conn_id in self.conn_data_seq_enabled:
-                        send_queue.put_nowait(await pack_close_seq(conn_id,self.conn_data_tx_seq.get(conn_id,0),0,self.key))
-                    else:
-                        send_queue.put_nowait(await pack_close(conn_id,0,self.key))
-                elif self.websocket and control_queue:
-                    control_queue.put_nowait(await pack_close(conn_id,0,self.key))
-            except:
-                pass
-            self.conn_channel_map.pop(conn_id,None)
-            self.clear_conn_data_state(conn_id)
-            self.tunnel_manager.remove_connection(conn_id)
+            self.finish_local_forward(conn_id)
+
+    def data_send_queue(self,conn_id):
+        if not self.session_active():
+            return None
+        return self.get_send_queue_for_channel(self.pick_data_channel(conn_id))
+
+    def local_data_frame(self,conn_id,data):
+        state=self.tunnel_manager.state(conn_id)
+        if state.striped or self.should_stripe_data():
+            self.tunnel_manager.mark_striped(state)
+            seq=state.tx_seq
+            state.tx_seq=seq+1
+            return data_seq_frame(conn_id,seq,data)
+        return data_frame(conn_id,data)
+
+    def finish_local_forward(self,conn_id):
+        try:
+            control_queue=self.control_queue
+            send_queue=self.send_queue
+            if self.config.ws_pool_enabled:
+                mapped_child=self.tunnel_manager.get_channel(conn_id)
+                if mapped_child:
+                    self.child_queue_sizes[mapped_child]=max(0,self.child_queue_sizes.get(mapped_child,0)-1)
+                    channel=self.child_channels.get(mapped_child)
+                    if channel:
+                        control_queue=channel.get("control_queue")
+                        send_queue=channel.get("send_queue")
+            state=self.tunnel_manager.conns.get(conn_id)
+            if self.session_active() and send_queue:
+                if state and state.striped:
+                    send_queue.put_nowait(close_seq_frame(conn_id,state.tx_seq,0))
+                else:
+                    send_queue.put_nowait(close_frame(conn_id,0))
+            elif self.session_active() and control_queue:
+                control_queue.put_nowait(close_frame(conn_id,0))
+        except:
+            pass
+        self.tunnel_manager.pop_channel(conn_id)
+        self.clear_conn_data_state(conn_id)
+        self.tunnel_manager.remove_connection(conn_id)
 
     async def handle_data(self,conn_id,payload):
-        connection=self.tunnel_manager.get_connection(conn_id)
+        state=self.tunnel_manager.conns.get(conn_id)
+        connection=state.connection if state else None
         if not connection:
-            buffer=self.preconnect_buffers.setdefault(conn_id,[])
-            if len(buffer)<16:
-                buffer.append(payload)
+            if not self.preconnect_buffers.append(conn_id,payload):
+                logger.warning(f"Preconnect buffer full for local connection {conn_id}, closing")
+                self.abort_preconnect(conn_id)
+            return
+        if not isinstance(connection,tuple):
+            connection.write(payload)
             return
         if connection:
             _,writer=connection
             try:
-                queue=self.conn_write_queues.get(conn_id)
+                queue=state.write_queue
                 if not queue:
-                    queue=asyncio.Queue(maxsize=512)
-                    self.conn_write_queues[conn_id]=queue
-                    self.conn_write_tasks[conn_id]=asyncio.create_task(self.conn_writer_loop(conn_id,writer,queue))
+                    queue=state.write_queue=self.new_write_queue()
+                    state.write_task=asyncio.create_task(self.conn_writer_loop(conn_id,writer,queue))
                 queue.put_nowait(payload)
             except asyncio.QueueFull:
                 logger.warning(f"Write queue full for local connection {conn_id}")
@@ -1054,19 +1258,28 @@ class GhostWireServer:
                 self.clear_conn_data_state(conn_id)
                 self.tunnel_manager.remove_connection(conn_id)
 
+    def abort_preconnect(self,conn_id):
+        control_queue=self.conn_queues(conn_id)[1]
+        self.clear_conn_data_state(conn_id)
+        self.tunnel_manager.remove_connection(conn_id)
+        try:
+            if control_queue:
+                control_queue.put_nowait(close_frame(conn_id,0))
+        except asyncio.QueueFull:
+            logger.warning(f"Control queue full, dropping CLOSE for {conn_id}")
+
     async def handle_close(self,conn_id):
         self.preconnect_buffers.pop(conn_id,None)
         logger.debug(f"CLOSE from client: {conn_id}")
-        queue=self.conn_write_queues.get(conn_id)
+        state=self.tunnel_manager.conns.get(conn_id)
+        queue=state.write_queue if state else None
         if queue:
             try:
                 queue.put_nowait(None)
             except asyncio.QueueFull:
-                task=self.conn_write_tasks.get(conn_id)
-                if task:
-                    task.cancel()
-                self.conn_write_queues.pop(conn_id,None)
-                self.conn_write_tasks.pop(conn_id,None)
+                if state.write_task:
+                    state.write_task.cancel()
+                self.tunnel_manager.pop_writer(conn_id)
                 self.clear_conn_data_state(conn_id)
                 self.tunnel_manager.remove_connection(conn_id)
         else:
@@ -1076,10 +1289,20 @@ class GhostWireServer:
     async def start(self):
         self.running=True
         logger.info(f"Starting GhostWire server ({self.config.protocol}) on {self.config.listen_host}:{self.config.listen_port}")
-        start_panel(self.config,self)
+        dispatch=await calibrate_crypto_dispatch()
+        logger.info(f"Crypto dispatch: inline up to {dispatch['threshold']} bytes (executor hop {dispatch['executor_hop_us']}us, cipher {dispatch['cipher_us_per_kb']}us/KB)")
+        speeds=benchmark_ciphers()
+        logger.info(f"Cipher benchmark: {', '.join(f'{name} {speed} MB/s' for name,speed in speeds.items())}")
+        lead=not self.shard or self.shard.index==0
+        if lead:
+            start_panel(self.config,self)
         update_task=None
-        if self.config.auto_update:
+        if self.config.auto_update and lead:
             update_task=asyncio.create_task(self.updater.update_loop(self.shutdown_event))
+        shard_tasks=[]
+        if self.shard:
+            self.shard.attach(self)
+            shard_tasks=[asyncio.create_task(self.shard_report_loop()),asyncio.create_task(self.udp_session_cleanup_loop())]
         if self.config.protocol=="http2":
             from http2_transport import start_http2_server
             await start_http2_server(self)
@@ -1094,6 +1317,8 @@ class GhostWireServer:
             await start_aiohttp_ws_server(self)
         if update_task:
             update_task.cancel()
+        for task in shard_tasks:
+            task.cancel()
         logger.info("Server shutting down")
 
     def stop(self):
@@ -1193,10 +1418,17 @@ def main():
     parser.add_argument("-c","--config",help="Path to configuration file")
     parser.add_argument("--generate-token",action="store_true",help="Generate authentication token and exit")
     parser.add_argument("--version",action="store_true",help="Print version and exit")
+    parser.add_argument("--crypto-benchmark",action="store_true",help="Benchmark AEAD ciphers and exit")
     args=parser.parse_args()
     if args.version:
         print(Updater("server").current_version)
         sys.exit(0)
+    if args.crypto_benchmark:
+        speeds=benchmark_ciphers()
+        for size in (64,1400,16384,65536):
+            print(f"{size:>6}B  "+"  ".join(f"{name} {cipher_speed(name,size):>8,.1f} MB/s" for name in speeds))
+        print(f"Preferred cipher: {pick_cipher('auto',cipher_features())}")
+        sys.exit(0)
     if args.generate_token:
         from auth import generate_token
         print(generate_token())
@@ -1210,11 +1442,24 @@ def main():
         logger.error(f"Failed to load configuration: {e}")
         sys.exit(1)
     setup_logging(config)
-    server=GhostWireServer(config)
-    loop=asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    for sig in (signal.SIGTERM,signal.SIGINT):
-        loop.add_signal_handler(sig,lambda:signal_handler(server,loop))
+    if config.workers>1:
+        reason=sharding_unsupported(config)
+        if not reason:
+            threads=config.worker_mode=="thread"
+            if threads and gil_enabled():
+                logger.warning("worker_mode=thread needs a free-threaded Python build (python3.13t), using worker processes")
+                threads=False
+            Coordinator(config,run_server,threads).run()
+            return
+        logger.warning(f"workers={config.workers} ignored: {reason}")
+    run_server(config)
+
+def run_server(config,shard=None):
+    server=GhostWireServer(config,shard)
+    loop=new_event_loop(config.event_loop)
+    if not shard or not shard.threaded:
+        for sig in (signal.SIGTERM,signal.SIGINT):
+            loop.add_signal_handler(sig,lambda:signal_handler(server,loop))
     try:
         loop.run_until_complete(server.start())
     except KeyboardInterrupt:
@@ -0,0 +1,140 @@
+import asyncio
+import logging
+from memory import governor,SLAB_CLASSES
+from threadstats import ThreadStats
+
+logger=logging.getLogger(__name__)
+
+WRITE_BUFFER_LIMIT=33554432
+SEND_STALL_TIMEOUT=30
+_protocol_stats=ThreadStats(lambda:{"connections":0,"blocked_reads":0})
+
+class TunnelProtocol(asyncio.BufferedProtocol):
+    def __init__(self,owner,port,conn_id=None,target=None):
+        self.owner=owner
+        self.port=port
+        self.conn_id=conn_id
+        self.target=target
+        self.transport=None
+        self.compressor=None
+        self.blocked=None
+        self.write_paused=False
+        self.unacked=0
+        self.closed=False
+        self.slot=None
+        self.read_hint=SLAB_CLASSES[0]
+
+    def connection_made(self,transport):
+        self.transport=transport
+        if self.conn_id is None:
+            self.owner.accept_local_protocol(self,*self.target)
+        else:
+            self.start(self.conn_id)
+
+    def start(self,conn_id):
+        owner=self.owner
+        self.conn_id=conn_id
+        self.compressor=owner.new_compressor(self.port)
+        owner.conn_windows.open(conn_id)
+        owner.tunnel_manager.add_connection(conn_id,self)
+        _protocol_stats.get()["connections"]+=1
+        for payload in owner.preconnect_buffers.pop(conn_id,[]):
+            self.write(payload)
+
+    def get_buffer(self,sizehint):
+        credit=self.owner.conn_windows.credits.get(self.conn_id)
+        size=self.owner.io_chunk_size if credit is None else max(1,min(self.owner.io_chunk_size,credit))
+        recv_pool=self.owner.recv_pool
+        if recv_pool.max_bytes:
+            self.slot=recv_pool.acquire(min(size,self.read_hint))
+            return memoryview(self.slot)[:size]
+        return self.owner.read_view[:size]
+
+    def buffer_updated(self,nbytes):
+        owner=self.owner
+        if self.conn_id is None:
+            return
+        if self.slot is not None:
+            data=memoryview(self.slot)[:nbytes]
+            self.read_hint=min(owner.io_chunk_size,nbytes*2 if nbytes>=len(self.slot) else max(nbytes,SLAB_CLASSES[0]))
+            self.slot=None
+        else:
+            data=bytes(owner.read_view[:nbytes])
+        owner.conn_windows.spend(self.conn_id,nbytes)
+        message=owner.local_data_frame(self.conn_id,data)
+        send_queue=owner.data_send_queue(self.conn_id)
+        if not send_queue:
+            logger.debug(f"Send queue unavailable, stopping forward for {self.conn_id}")
+            self.transport.close()
+            return
+        if not self.compressor:
+            try:
+                send_queue.put_nowait(message)
+            except asyncio.QueueFull:
+                pass
+            else:
+                if not governor.over_budget() and owner.conn_windows.credits.get(self.conn_id,1)>0:
+                    return
+                message=None
+        _protocol_stats.get()["blocked_reads"]+=1
+        self.transport.pause_reading()
+        self.blocked=asyncio.ensure_future(self.forward_blocked(send_queue,message))
+
+    async def forward_blocked(self,send_queue,message):
+        try:
+            if message is not None:
+                if self.compressor:
+                    message=await self.compressor.compress_frame(message)
+                try:
+                    send_queue.put_nowait(message)
+                except asyncio.QueueFull:
+                    await asyncio.wait_for(send_queue.put(message),timeout=SEND_STALL_TIMEOUT)
+            if governor.over_budget():
+                await governor.wait_for_room()
+            await self.owner.conn_windows.acquire(self.conn_id,1)
+        except asyncio.TimeoutError:
+            logger.warning(f"Send queue stalled for {self.conn_id}, closing connection")
+            self.transport.close()
+            return
+        finally:
+            self.blocked=None
+        if not self.closed:
+            self.transport.resume_reading()
+
+    def write(self,payload):
+        if self.closed:
+            return
+        self.transport.write(payload)
+        if self.write_paused:
+            self.unacked+=len(payload)
+            if not self.owner.conn_windows.enabled and self.transport.get_write_buffer_size()>WRITE_BUFFER_LIMIT:
+                logger.warning(f"Write buffer full for connection {self.conn_id}")
+                self.transport.abort()
+        else:
+            self.owner.grant_window(self.conn_id,len(payload))
+
+    def pause_writing(self):
+        self.write_paused=True
+
+    def resume_writing(self):
+        self.write_paused=False
+        if self.unacked:
+            self.owner.grant_window(self.conn_id,self.unacked)
+            self.unacked=0
+
+    def close(self):
+        if self.transport and not self.closed:
+            self.transport.close()
+
+    def connection_lost(self,exc):
+        self.closed=True
+        if self.conn_id is None:
+            return
+        _protocol_stats.get()["connections"]-=1
+        self.owner.conn_windows.finish(self.conn_id)
+        if self.blocked:
+            self.blocked.cancel()
+        self.owner.finish_local_forward(self.conn_id)
+
+def get_protocol_stats():
+    return _protocol_stats.sum()
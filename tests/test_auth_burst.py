@@ -0,0 +1,98 @@
+#!/usr/bin/env python3.13
+import asyncio
+import logging
+import os
+import sys
+import time
+from concurrent.futures import Executor,Future
+import aiohttp
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from protocol import *
+from config import ServerConfig
+from server import GhostWireServer
+
+CHILDREN=64
+
+class InlineExecutor(Executor):
+    def submit(self,fn,*args,**kwargs):
+        future=Future()
+        future.set_result(fn(*args,**kwargs))
+        return future
+
+async def open_channel(session,url,token,role,child_id="",attach_key=None):
+    ws=await session.ws_connect(url,max_msg_size=0)
+    msg_type,_,payload,_=await unpack_message((await ws.receive()).data,None)
+    server_public_key,auth_salt=unpack_pubkey_payload(payload)
+    if attach_key:
+        auth_msg=pack_attach(attach_key,auth_salt,child_id)
+    else:
+        auth_msg=await asyncio.to_thread(pack_auth_message,token,server_public_key,role,child_id,auth_salt)
+    await ws.send_bytes(auth_msg)
+    if role=="main":
+        client_private_key,client_public_key=await asyncio.to_thread(generate_rsa_keypair)
+        await ws.send_bytes(pack_pubkey(client_public_key))
+        await ws.receive()
+    return ws
+
+async def watch_stalls(stop,stalls):
+    while not stop.is_set():
+        start=time.perf_counter()
+        await asyncio.sleep(0.001)
+        stalls.append(time.perf_counter()-start-0.001)
+
+async def burst(server,url,token,attach):
+    async with aiohttp.ClientSession() as session:
+        main=await open_channel(session,url,token,"main")
+        while server.main_websocket is None:
+            await asyncio.sleep(0.01)
+        stop=asyncio.Event()
+        stalls=[]
+        watcher=asyncio.create_task(watch_stalls(stop,stalls))
+        start=time.perf_counter()
+        children=await asyncio.gather(*[open_channel(session,url,token,"child",f"burst{i}",server.key if attach else None) for i in range(CHILDREN)])
+        while len(server.child_channels)<CHILDREN and time.perf_counter()-start<60:
+            await asyncio.sleep(0.005)
+        elapsed=time.perf_counter()-start
+        stop.set()
+        await watcher
+        accepted=len(server.child_channels)
+        for ws in children+[main]:
+            await ws.close()
+        while server.main_websocket is not None or server.child_channels:
+            await asyncio.sleep(0.01)
+        return accepted,elapsed,max(stalls),sum(stall for stall in stalls if stall>0.01)
+
+async def test():
+    print("🔑 Child Channel Auth Burst Benchmark")
+    print("="*60)
+    logging.disable(logging.CRITICAL)
+    config=ServerConfig(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),"test_server.toml"))
+    server=GhostWireServer(config)
+    server_task=asyncio.create_task(server.start())
+    url=f"ws://{config.listen_host}:{config.listen_port}{config.websocket_path}"
+    await asyncio.sleep(2)
+    results={}
+    try:
+        for label,executor,attach in (("inline (event loop)",InlineExecutor(),False),(f"auth pool ({config.auth_workers} workers)",server.auth_executor,False),("HMAC attach",server.auth_executor,True)):
+            server.auth_executor=executor
+            accepted,elapsed,worst,blocked=await burst(server,url,config.token,attach)
+            results[label]=accepted
+            print(f"🧪 {CHILDREN}-child reconnect burst, {label}")
+            print(f"   accepted: {accepted}/{CHILDREN}, {accepted/elapsed:,.1f} handshakes/s")
+            print(f"   worst loop stall: {worst*1000:.1f}ms, time blocked >10ms: {blocked*1000:.0f}ms\n")
+    finally:
+        server.stop()
+        server_task.cancel()
+        await asyncio.gather(server_task,return_exceptions=True)
+    if any(accepted!=CHILDREN for accepted in results.values()):
+        print("❌ Not every child channel authenticated")
+        return False
+    print("✅ Benchmark complete!")
+    return True
+
+try:
+    result=asyncio.run(test())
+    sys.exit(0 if result else 1)
+except KeyboardInterrupt:
+    print("\nInterrupted")
+    sys.exit(1)
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3.13
+import asyncio
+import os
+import sys
+import time
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import protocol
+from protocol import *
+
+async def per_frame_rate(key,payload,count):
+    start=time.perf_counter()
+    for i in range(count):
+        await pack_data(i,payload,key)
+    return count/(time.perf_counter()-start)
+
+async def batched_rate(key,payload,count,batch_size):
+    start=time.perf_counter()
+    sent=0
+    while sent<count:
+        frames=[data_frame(sent+i,payload) for i in range(min(batch_size,count-sent))]
+        await pack_messages(frames,key)
+        sent+=len(frames)
+    return count/(time.perf_counter()-start)
+
+async def verify_roundtrip(key):
+    frames=[data_frame(1,b"a"*100),close_frame(2,0),data_seq_frame(3,7,b"b"*5000)]
+    packed=await pack_messages(frames,key)
+    for (msg_type,conn_id,payload),message in zip(frames,packed):
+        got_type,got_conn,got_payload,consumed=await unpack_message(message,key)
+        if (got_type,got_conn,got_payload,consumed)!=(msg_type,conn_id,payload,len(message)):
+            return False
+    return True
+
+async def test():
+    print("🔐 Batched AEAD Encryption Benchmark")
+    print("="*60)
+    key=os.urandom(32)
+    protocol._crypto_dispatch["threshold"]=-1
+    if not await verify_roundtrip(key):
+        print("❌ Batched frames failed to decrypt")
+        return False
+    print("✅ Batched frames decrypt correctly\n")
+    for size,count in ((1024,20000),(16384,8000),(65536,3000)):
+        payload=os.urandom(size)
+        before=await per_frame_rate(key,payload,count)
+        after=await batched_rate(key,payload,count,64)
+        print(f"🧪 {size//1024}KB frames x{count}")
+        print(f"   per-frame executor hop: {before:,.0f} frames/s")
+        print(f"   batched (64/submit):    {after:,.0f} frames/s")
+        print(f"   speedup: {after/before:.2f}x\n")
+    print("✅ Benchmark complete!")
+    return True
+
+try:
+    result=asyncio.run(test())
+    sys.exit(0 if result else 1)
+except KeyboardInterrupt:
+    print("\nInterrupted")
+    sys.exit(1)
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3.13
+import asyncio
+import os
+import sys
+import time
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from protocol import *
+from outbound import OutboundQueue,BatchPolicy,get_batch_stats
+
+DURATION=1.0
+
+async def drain(outbound,policy,flushes):
+    while not outbound.stop_event.is_set() or not outbound.empty():
+        if outbound.empty():
+            await outbound.wait()
+            continue
+        batch=await policy.collect(outbound)
+        now=time.perf_counter()
+        flushes.append((now,[now-struct.unpack("!d",bytes(frame[2][:8]))[0] for frame in batch],sum(frame_size(frame) for frame in batch)))
+
+async def produce(outbound,size,interval):
+    filler=b"d"*(size-8)
+    deadline=time.perf_counter()+DURATION
+    while time.perf_counter()<deadline:
+        message=data_frame(1,struct.pack("!d",time.perf_counter())+filler)
+        try:
+            outbound.data.put_nowait(message)
+        except asyncio.QueueFull:
+            await outbound.data.put(message)
+        await asyncio.sleep(interval)
+
+async def run(latency_ms,size,interval):
+    outbound=OutboundQueue()
+    policy=BatchPolicy(65536,latency_ms/1000)
+    flushes=[]
+    sender=asyncio.create_task(drain(outbound,policy,flushes))
+    await produce(outbound,size,interval)
+    outbound.stop_event.set()
+    await asyncio.wait_for(sender,timeout=2)
+    latencies=sorted(latency for _,batch,_ in flushes for latency in batch)
+    return len(flushes),sum(len(batch) for _,batch,_ in flushes),latencies[int(len(latencies)*0.99)],sum(batch_bytes for _,_,batch_bytes in flushes)
+
+async def test():
+    print("📦 Deadline Batching Test")
+    print("="*60)
+    before=get_batch_stats()["flush_reasons"]["interactive"]
+    messages,frames,p99,_=await run(1.0,200,0.002)
+    reasons=get_batch_stats()["flush_reasons"]
+    if reasons["interactive"]-before<frames*0.9 or p99>0.0005:
+        print(f"❌ Interactive frames were delayed (p99 {p99*1000:.2f}ms)")
+        return False
+    print(f"✅ Interactive frames take the no-delay path: {messages} messages for {frames} frames, p99 {p99*1e6:.0f}µs\n")
+    results={}
+    for label,latency_ms in (("no deadline (send immediately)",0),("1ms latency budget",1.0),("5ms latency budget",5.0)):
+        messages,frames,p99,total=await run(latency_ms,8192,0.0002)
+        results[latency_ms]=(messages,p99)
+        print(f"🧪 8KB bulk frames, {label}")
+        print(f"   {frames} frames in {messages} WebSocket messages ({total/max(messages,1)/1024:.1f}KB avg), frame p99 latency {p99*1000:.2f}ms\n")
+        if latency_ms and p99>latency_ms/1000+0.01:
+            print("❌ Batching exceeded its latency budget")
+            return False
+    if results[1.0][0]>=results[0][0]:
+        print("❌ Latency budget did not coalesce bulk frames")
+        return False
+    stats=get_batch_stats()
+    print(f"   batch sizes: {stats['sizes']}")
+    print(f"   flush reasons: {stats['flush_reasons']}")
+    print("✅ Test complete!")
+    return True
+
+try:
+    result=asyncio.run(test())
+    sys.exit(0 if result else 1)
+except KeyboardInterrupt:
+    print("\nInterrupted")
+    sys.exit(1)
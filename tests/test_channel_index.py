@@ -0,0 +1,133 @@
+#!/usr/bin/env python3.13
+import os
+import sys
+import time
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from outbound import OutboundQueue
+from protocol import data_frame
+from tunnel import TunnelManager
+
+CHILDREN=8
+ACCEPTS=10000
+STRIPE_PICKS=200000
+
+class FakeWebSocket:
+    def __init__(self):
+        self.close_code=None
+
+def new_channel():
+    outbound=OutboundQueue()
+    return {"ws":FakeWebSocket(),"send_queue":outbound.data,"control_queue":outbound.control}
+
+class RescanSelector:
+    def __init__(self):
+        self.child_channels={}
+        self.conn_channel_map={}
+        self.data_rr_index=0
+
+    def get_available_child_ids(self):
+        return [child_id for child_id,channel in self.child_channels.items() if channel.get("ws") and getattr(channel.get("ws"),"close_code",None) is None]
+
+    def accept(self,conn_id):
+        best_child=None
+        min_load=float("inf")
+        for child_id in self.get_available_child_ids():
+            send_queue=self.child_channels[child_id].get("send_queue")
+            conn_count=sum(1 for mapped_child in self.conn_channel_map.values() if mapped_child==child_id)
+            load_score=send_queue.qsize()+conn_count*10
+            if load_score<min_load:
+                min_load=load_score
+                best_child=child_id
+        self.conn_channel_map[conn_id]=best_child
+        return best_child
+
+    def stripe(self):
+        if len(self.get_available_child_ids())>1:
+            child_ids=self.get_available_child_ids()
+            child_id=child_ids[self.data_rr_index%len(child_ids)]
+            self.data_rr_index+=1
+            return child_id
+
+class IndexedSelector:
+    def __init__(self):
+        self.tunnel_manager=TunnelManager()
+        self.child_channels=self.tunnel_manager.channels
+
+    def accept(self,conn_id):
+        child_id=self.child_channels.least_loaded()
+        self.tunnel_manager.set_channel(conn_id,child_id)
+        return child_id
+
+    def stripe(self):
+        if self.child_channels.available_count()>1:
+            return self.child_channels.next_available()
+
+def run(selector_cls):
+    selector=selector_cls()
+    for index in range(CHILDREN):
+        selector.child_channels[f"child-{index}"]=new_channel()
+    start=time.perf_counter()
+    for conn_id in range(1,ACCEPTS+1):
+        selector.accept(conn_id)
+    accept_elapsed=time.perf_counter()-start
+    start=time.perf_counter()
+    for _ in range(STRIPE_PICKS):
+        selector.stripe()
+    stripe_elapsed=time.perf_counter()-start
+    return ACCEPTS/accept_elapsed,STRIPE_PICKS/stripe_elapsed
+
+def verify_index():
+    manager=TunnelManager()
+    channels=manager.channels
+    channels["a"]=new_channel()
+    channels["b"]=new_channel()
+    for conn_id in range(1,4):
+        manager.set_channel(conn_id,channels.least_loaded())
+    if sorted((channels.conn_count("a"),channels.conn_count("b")))!=[1,2]:
+        return "connections not spread across children"
+    busy="a" if channels.conn_count("a")==1 else "b"
+    channels[busy]["send_queue"].put_nowait(data_frame(9,b"x"*262144))
+    if channels.least_loaded()==busy:
+        return "queued bytes not counted in child load"
+    manager.set_channel(1,"b")
+    manager.remove_connection(2)
+    manager.pop_channel(3)
+    if channels.conn_count("a")+channels.conn_count("b")!=1 or channels.conn_count("b")!=1:
+        return "connection counts drifted after reassign/remove"
+    channels["a"]["ws"].close_code=1006
+    if channels.least_loaded()!="b" or channels.available_ids()!=["b"] or channels.available_count()!=1:
+        return "closed child still offered"
+    channels.pop("b")
+    if channels.next_available() is not None:
+        return "removed child still offered"
+    return None
+
+def test():
+    print("📇 Channel Load Index Benchmark")
+    print("="*60)
+    error=verify_index()
+    if error:
+        print(f"❌ {error}")
+        return False
+    print("✅ Index tracks connection counts, queued bytes and availability\n")
+    print(f"   {CHILDREN} children, {ACCEPTS:,} accepted connections, {STRIPE_PICKS:,} stripe picks\n")
+    results={}
+    for label,selector_cls in (("rescan per accept (before)",RescanSelector),("incremental index (after)",IndexedSelector)):
+        results[selector_cls]=accept_rate,stripe_rate=run(selector_cls)
+        print(f"🧪 {label}")
+        print(f"   {accept_rate:,.0f} accepts/s, {stripe_rate/1e6:.2f}M stripe picks/s\n")
+    accept_ratio=results[IndexedSelector][0]/results[RescanSelector][0]
+    print(f"   accept rate ratio: {accept_ratio:.1f}x")
+    print(f"   stripe pick ratio: {results[IndexedSelector][1]/results[RescanSelector][1]:.1f}x")
+    if accept_ratio<10:
+        print("❌ Child selection still scales with connection count")
+        return False
+    print("✅ Benchmark complete!")
+    return True
+
+try:
+    result=test()
+    sys.exit(0 if result else 1)
+except KeyboardInterrupt:
+    print("\nInterrupted")
+    sys.exit(1)
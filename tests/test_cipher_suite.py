@@ -0,0 +1,85 @@
+#!/usr/bin/env python3.13
+import asyncio
+import os
+import sys
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import protocol
+from protocol import *
+
+def negotiate(local_speeds,local_mode,peer_speeds,peer_mode):
+    saved=dict(protocol._cipher_speeds)
+    try:
+        protocol._cipher_speeds.clear()
+        protocol._cipher_speeds.update(peer_speeds)
+        peer_features=cipher_features(peer_mode)
+        protocol._cipher_speeds.clear()
+        protocol._cipher_speeds.update(local_speeds)
+        local_choice=pick_cipher(local_mode,peer_features)
+        local_features=cipher_features(local_mode)
+        protocol._cipher_speeds.clear()
+        protocol._cipher_speeds.update(peer_speeds)
+        peer_choice=pick_cipher(peer_mode,local_features)
+    finally:
+        protocol._cipher_speeds.clear()
+        protocol._cipher_speeds.update(saved)
+    return local_choice if local_choice==peer_choice else None
+
+def verify_negotiation():
+    x86={CIPHER_AESGCM:4000.0,CIPHER_CHACHA:1500.0}
+    arm={CIPHER_AESGCM:180.0,CIPHER_CHACHA:900.0}
+    cases=(
+        (x86,"auto",arm,"auto",CIPHER_CHACHA),
+        (x86,"auto",x86,"auto",CIPHER_AESGCM),
+        (x86,CIPHER_AESGCM,arm,"auto",CIPHER_AESGCM),
+        (x86,"auto",arm,CIPHER_CHACHA,CIPHER_CHACHA),
+        (x86,CIPHER_AESGCM,arm,CIPHER_CHACHA,CIPHER_AESGCM),
+        ({},"auto",arm,"auto",CIPHER_AESGCM),
+    )
+    return all(negotiate(*case[:4])==case[4] for case in cases)
+
+async def roundtrip(key):
+    auth_salt=os.urandom(AUTH_SALT_SIZE)
+    tx,_=channel_nonce_counters(key,auth_salt,"client")
+    _,rx=channel_nonce_counters(key,auth_salt,"server")
+    frames=[data_frame(1,b"x"*100),close_frame(2,0),data_frame(3,os.urandom(SEAL_INTO_MIN+1000))]
+    stream=b"".join(await pack_messages(frames[:1],key,tx))
+    tx.cipher=CIPHER_CHACHA
+    stream+=b"".join(await pack_messages(frames[1:2],key,tx))
+    pool=BatchBufferPool()
+    buffer,view=await pack_messages_into(frames[2:],key,pool,tx)
+    stream+=bytes(view)
+    view.release()
+    decoder=FrameDecoder()
+    raw=decoder.feed(stream)
+    flagged=[bool(frame[0]&FLAG_CHACHA) for frame in raw]
+    got=[frame async for frame in iter_open_frames(raw,key,rx)]
+    return got==frames and flagged==[False,True,True]
+
+async def test():
+    print("🔐 Cipher Suite Negotiation Test")
+    print("="*60)
+    key=os.urandom(32)
+    await calibrate_crypto_dispatch()
+    if not verify_negotiation():
+        print("❌ Peers disagreed or picked the slower cipher")
+        return False
+    print("✅ Both peers pick the same, faster common cipher")
+    if not await roundtrip(key):
+        print("❌ Mixed AES-GCM/ChaCha20 frames failed to roundtrip")
+        return False
+    print("✅ Cipher switch mid-stream decrypts in order\n")
+    speeds=benchmark_ciphers()
+    for size in (64,1400,65536):
+        print(f"🧪 {size}B payload")
+        for name in speeds:
+            print(f"   {name}: {cipher_speed(name,size):,.1f} MB/s")
+    print(f"\n   preferred on this host: {pick_cipher('auto',cipher_features())}")
+    print("✅ Test complete!")
+    return True
+
+try:
+    result=asyncio.run(test())
+    sys.exit(0 if result else 1)
+except KeyboardInterrupt:
+    print("\nInterrupted")
+    sys.exit(1)
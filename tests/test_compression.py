@@ -0,0 +1,81 @@
+#!/usr/bin/env python3.13
+import asyncio
+import json
+import os
+import sys
+import time
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from protocol import *
+from compression import *
+
+def text_payload(size):
+    rows=[]
+    i=0
+    while sum(len(row) for row in rows)<size:
+        rows.append(json.dumps({"id":i,"user":f"user{i%97}","status":"active" if i%3 else "idle","tags":["proxy","tunnel",str(i%11)]}).encode())
+        i+=1
+    return b"\n".join(rows)[:size]
+
+async def roundtrip(key,codec):
+    compressor=PayloadCompressor(codec,9999)
+    frames=[data_frame(1,text_payload(4096)),data_frame(2,b"tiny"),data_frame(3,text_payload(65536))]
+    sealed=[]
+    for frame in frames:
+        sealed.append(await compressor.compress_frame(frame))
+    if not sealed[0][0]&FLAG_COMPRESSED or sealed[1][0]&FLAG_COMPRESSED:
+        return False
+    decoder=FrameDecoder()
+    got=[frame async for frame in iter_open_frames(decoder.feed(b"".join(await pack_messages(sealed,key))),key)]
+    return got==frames
+
+async def measure(codec,port,payload,chunk):
+    compressor=PayloadCompressor(codec,port)
+    compressed=0
+    for offset in range(0,len(payload),chunk):
+        frame=await compressor.compress_frame(data_frame(1,payload[offset:offset+chunk]))
+        compressed+=frame[0]&FLAG_COMPRESSED!=0
+    return compressor.active,compressed
+
+async def test():
+    print("🗜️  Payload Compression Test")
+    print("="*60)
+    key=os.urandom(32)
+    await calibrate_crypto_dispatch()
+    codecs=[CODEC_ZLIB]+([CODEC_ZSTD] if zstandard else [])
+    print(f"   codecs: {', '.join(codec_name(codec) for codec in codecs)}")
+    for codec in codecs:
+        if not await roundtrip(key,codec):
+            print(f"❌ {codec_name(codec)} frames failed to roundtrip")
+            return False
+    print("✅ Compressed frames roundtrip through seal/open")
+    try:
+        decompress_payload(compress_payload(CODEC_ZLIB,b"\x00"*(MAX_DECOMPRESSED+1)))
+        print("❌ Oversized payload was decompressed")
+        return False
+    except ValueError:
+        print("✅ Oversized payload rejected\n")
+    size=1048576
+    for codec in codecs:
+        for label,port,payload in (("json text",8000+codec,text_payload(size)),("random",9000+codec,os.urandom(size))):
+            start=time.perf_counter()
+            active,compressed=await measure(codec,port,payload,16384)
+            elapsed=time.perf_counter()-start
+            stats=get_compression_stats()[str(port)]
+            print(f"🧪 {codec_name(codec)} {label} ({size//1024}KB in 16KB reads)")
+            print(f"   ratio: {stats['ratio']:.3f}, cpu: {stats['cpu_seconds']*1000:.1f}ms, {size/elapsed/1048576:,.0f} MB/s")
+            print(f"   compressed frames: {compressed}/{size//16384}, still active: {active}\n")
+            if label=="random" and active:
+                print("❌ Compression stayed on for incompressible data")
+                return False
+            if label=="json text" and stats["ratio"]>0.5:
+                print("❌ Text did not compress")
+                return False
+    print("✅ Test complete!")
+    return True
+
+try:
+    result=asyncio.run(test())
+    sys.exit(0 if result else 1)
+except KeyboardInterrupt:
+    print("\nInterrupted")
+    sys.exit(1)
@@ -4,7 +4,12 @@ import subprocess
 import time
 import socket
 import sys
+import os
 from collections import Counter
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from eventloop import available_backends
+
+LOOPS=sys.argv[1:] or available_backends()
 
 def get_free_port():
     s=socket.socket(socket.AF_INET,socket.SOCK_STREAM)
@@ -20,7 +25,7 @@ def percentile(values,p):
     idx=max(0,min(len(values)-1,int((len(values)-1)*p)))
     return values[idx]
 
-def write_test_configs(ws_port,tunnel_port,target_port):
+def write_test_configs(ws_port,tunnel_port,target_port,event_loop):
     server_cfg=f"""[server]
 protocol="grpc"
 listen_host="127.0.0.1"
@@ -28,6 +33,7 @@ listen_port={ws_port}
 websocket_path="/ws"
 auto_update=false
 ping_timeout=30
+event_loop="{event_loop}"
 
 [auth]
 token="test_token_123456"
@@ -43,6 +49,7 @@ file="/tmp/ghostwire-bench-server.log"
 protocol="grpc"
 url="http://127.0.0.1:{ws_port}/ws"
 token="test_token_123456"
+event_loop="{event_loop}"
 auto_update=false
 
 [reconnect]
@@ -153,13 +160,12 @@ async def run_bulk_batch(port,total,concurrency):
     elapsed=time.time()-start
     return total_bytes,elapsed,errors
 
-async def run_benchmark():
-    print("⚡ Concurrent Receive Speed Test")
-    print("="*60)
+async def run_loop(event_loop):
+    print(f"🔁 Event loop: {event_loop}")
     ws_port=get_free_port()
     tunnel_port=get_free_port()
     target_port=get_free_port()
-    server_cfg,client_cfg=write_test_configs(ws_port,tunnel_port,target_port)
+    server_cfg,client_cfg=write_test_configs(ws_port,tunnel_port,target_port,event_loop)
     backend=BackendServer(target_port)
     await backend.start()
     print(f"✅ Backend started on {target_port}")
@@ -168,7 +174,7 @@ async def run_benchmark():
     if server.poll() is not None:
         print("❌ GhostWire server failed to start")
         await backend.stop()
-        return False
+        return None
     client=subprocess.Popen(["python3.13","client.py","-c",client_cfg],stdout=subprocess.DEVNULL,stderr=subprocess.DEVNULL)
     await asyncio.sleep(3)
     print(f"✅ Tunnel active on {tunnel_port}\n")
@@ -199,11 +205,31 @@ async def run_benchmark():
     latency_ok=(base_p95==0 and mix_p95==0) or (base_p95>0 and mix_p95<=base_p95*6.0)
     if mixed_success_rate<0.90:
         print(f"\n❌ FAIL: mixed success rate too low ({mixed_success_rate*100:.1f}%)")
-        return False
+        return None
     if not latency_ok:
         print(f"\n❌ FAIL: mixed p95 too high vs baseline ({mix_p95:.4f}s vs {base_p95:.4f}s)")
-        return False
-    print("\n✅ PASS: concurrent receive path handles mixed slow/fast load")
+        return None
+    print(f"\n✅ PASS ({event_loop}): concurrent receive path handles mixed slow/fast load\n")
+    return {"base_p95":base_p95,"mix_p95":mix_p95,"mbps":mbps}
+
+async def run_benchmark():
+    print("⚡ Concurrent Receive Speed Test")
+    print("="*60)
+    if "uvloop" not in LOOPS:
+        print("ℹ️  uvloop not installed, measuring asyncio only\n")
+    by_loop={}
+    for event_loop in LOOPS:
+        result=await run_loop(event_loop)
+        if result is None:
+            return False
+        by_loop[event_loop]=result
+    if len(by_loop)>1:
+        baseline=by_loop[LOOPS[0]]
+        print(f"📈 Compared with {LOOPS[0]}")
+        for event_loop in LOOPS[1:]:
+            result=by_loop[event_loop]
+            ratio=result["mbps"]/baseline["mbps"] if baseline["mbps"] else 0.0
+            print(f"   {event_loop}: bulk {result['mbps']:.2f} Mbps ({ratio:.2f}x), fast p95 {result['base_p95']:.4f}s vs {baseline['base_p95']:.4f}s, mixed p95 {result['mix_p95']:.4f}s vs {baseline['mix_p95']:.4f}s")
     return True
 
 try:
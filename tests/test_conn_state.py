@@ -0,0 +1,132 @@
+#!/usr/bin/env python3.13
+import os
+import sys
+import time
+import tracemalloc
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from tunnel import TunnelManager
+
+CONNS=20000
+FRAMES=2000000
+
+class ParallelDicts:
+    def __init__(self):
+        self.connections={}
+        self.connection_locks={}
+        self.conn_write_queues={}
+        self.conn_write_tasks={}
+        self.conn_channel_map={}
+        self.conn_data_tx_seq={}
+        self.conn_data_seq_enabled=set()
+        self.conn_data_rx_expected={}
+        self.conn_data_rx_pending={}
+        self.conn_data_rx_wait_start={}
+        self.conn_data_close_seq={}
+
+    def open(self,conn_id):
+        self.connections[conn_id]=(None,None)
+        self.connection_locks[conn_id]=object()
+        self.conn_write_queues[conn_id]=object()
+        self.conn_write_tasks[conn_id]=object()
+        self.conn_channel_map[conn_id]="child"
+        self.conn_data_tx_seq[conn_id]=0
+        self.conn_data_seq_enabled.add(conn_id)
+        self.conn_data_rx_expected[conn_id]=0
+
+    def frame(self,conn_id):
+        connection=self.connections.get(conn_id)
+        queue=self.conn_write_queues.get(conn_id)
+        channel=self.conn_channel_map.get(conn_id,"main")
+        if conn_id in self.conn_data_seq_enabled:
+            seq=self.conn_data_tx_seq.get(conn_id,0)
+            self.conn_data_tx_seq[conn_id]=seq+1
+        return connection,queue,channel
+
+class StateTable:
+    def __init__(self):
+        self.manager=TunnelManager()
+
+    def open(self,conn_id):
+        self.manager.add_connection(conn_id,(None,None))
+        state=self.manager.state(conn_id)
+        state.write_queue=object()
+        state.write_task=object()
+        state.channel="child"
+        state.striped=True
+
+    def frame(self,conn_id):
+        state=self.manager.conns.get(conn_id)
+        if state.striped:
+            state.tx_seq+=1
+        return state.connection,state.write_queue,state.channel or "main"
+
+def measure(table_cls):
+    tracemalloc.start()
+    table=table_cls()
+    base=tracemalloc.get_traced_memory()[0]
+    for conn_id in range(1,CONNS+1):
+        table.open(conn_id)
+    per_conn=(tracemalloc.get_traced_memory()[0]-base)/CONNS
+    tracemalloc.stop()
+    start=time.perf_counter()
+    for i in range(FRAMES):
+        table.frame(i%CONNS+1)
+    return per_conn,FRAMES/(time.perf_counter()-start)
+
+def verify_table():
+    manager=TunnelManager()
+    manager.add_connection(1,(None,None))
+    manager.set_channel(1,"child-1")
+    manager.set_channel(2,"child-1")
+    if manager.channel_conns("child-1")!=[1,2] or manager.active_count()!=1:
+        return "channel index or active count wrong"
+    manager.pop_channel(2)
+    if 2 in manager.conns:
+        return "idle state not pruned"
+    state=manager.state(1)
+    state.striped=True
+    state.rx_pending={3:b"x"}
+    manager.pop_channel(1)
+    manager.remove_connection(1)
+    if 1 in manager.conns:
+        return "removed connection still tracked"
+    state=manager.state(4)
+    state.rx_expected=2
+    state.close_seq=(5,0)
+    manager.pop_channel(4)
+    if manager.conns.get(4) is not state:
+        return "pending sequence state dropped with the channel mapping"
+    manager.clear_data(4)
+    if 4 in manager.conns:
+        return "cleared data state not pruned"
+    return None
+
+def test():
+    print("🗂️  Connection State Table Benchmark")
+    print("="*60)
+    error=verify_table()
+    if error:
+        print(f"❌ {error}")
+        return False
+    print("✅ Table tracks channels and prunes idle connection state\n")
+    print(f"   {CONNS:,} open connections, {FRAMES:,} frame lookups\n")
+    results={}
+    for label,table_cls in (("parallel per-conn dicts (before)",ParallelDicts),("__slots__ ConnState table (after)",StateTable)):
+        results[table_cls]=per_conn,rate=measure(table_cls)
+        print(f"🧪 {label}")
+        print(f"   {per_conn:.0f} bytes/connection, {rate/1e6:.2f}M frame lookups/s\n")
+    before,after=results[ParallelDicts][0],results[StateTable][0]
+    print(f"   memory per connection: {after/before*100:.0f}% of before")
+    print(f"   lookup throughput ratio: {results[StateTable][1]/results[ParallelDicts][1]:.2f}x")
+    if after>=before:
+        print("❌ State table did not reduce memory per connection")
+        return False
+    print("✅ Benchmark complete!")
+    return True
+
+try:
+    result=test()
+    sys.exit(0 if result else 1)
+except KeyboardInterrupt:
+    print("\nInterrupted")
+    sys.exit(1)
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3.13
+import asyncio
+import hashlib
+import os
+import subprocess
+import socket
+import sys
+import time
+
+CONNECTIONS=3000
+BATCH=200
+BULK_BYTES=32*1048576
+
+def get_free_port():
+    s=socket.socket(socket.AF_INET,socket.SOCK_STREAM)
+    s.bind(("127.0.0.1",0))
+    port=s.getsockname()[1]
+    s.close()
+    return port
+
+def write_test_configs(ws_port,tunnel_port,target_port,local_io):
+    server_cfg=f"""[server]
+protocol="websocket"
+listen_host="127.0.0.1"
+listen_port={ws_port}
+websocket_path="/ws"
+auto_update=false
+ping_timeout=60
+local_io="{local_io}"
+
+[auth]
+token="test_token_123456"
+
+[tunnels]
+ports=["{tunnel_port}={target_port}"]
+
+[logging]
+level="warning"
+file="/tmp/ghostwire-density-server.log"
+"""
+    client_cfg=f"""[server]
+protocol="websocket"
+url="ws://127.0.0.1:{ws_port}/ws"
+token="test_token_123456"
+auto_update=false
+local_io="{local_io}"
+
+[reconnect]
+initial_delay=1
+max_delay=10
+multiplier=2
+
+[cloudflare]
+enabled=false
+ips=[]
+host=""
+check_interval=300
+
+[logging]
+level="warning"
+file="/tmp/ghostwire-density-client.log"
+"""
+    server_path=f"/tmp/ghostwire-density-server-{ws_port}.toml"
+    client_path=f"/tmp/ghostwire-density-client-{ws_port}.toml"
+    with open(server_path,"w") as f:
+        f.write(server_cfg)
+    with open(client_path,"w") as f:
+        f.write(client_cfg)
+    return server_path,client_path
+
+BULK=os.urandom(1048576)*(BULK_BYTES//1048576)
+
+async def backend_handler(reader,writer):
+    try:
+        request=await reader.readexactly(4)
+        if request==b"bulk":
+            writer.write(BULK)
+        else:
+            writer.write(request)
+        await writer.drain()
+        await reader.read()
+        writer.close()
+    except:
+        pass
+
+def rss_kb(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+async def open_idle(port):
+    reader,writer=await asyncio.wait_for(asyncio.open_connection("127.0.0.1",port),timeout=20)
+    writer.write(b"ping")
+    if await asyncio.wait_for(reader.readexactly(4),timeout=20)!=b"ping":
+        raise ValueError("echo mismatch")
+    return writer
+
+async def bulk_download(port):
+    reader,writer=await asyncio.wait_for(asyncio.open_connection("127.0.0.1",port),timeout=5)
+    writer.write(b"bulk")
+    data=await asyncio.wait_for(reader.readexactly(BULK_BYTES),timeout=60)
+    writer.close()
+    return hashlib.sha256(data).digest()==hashlib.sha256(BULK).digest()
+
+async def run(local_io):
+    ws_port=get_free_port()
+    tunnel_port=get_free_port()
+    target_port=get_free_port()
+    server_cfg,client_cfg=write_test_configs(ws_port,tunnel_port,target_port,local_io)
+    backend=await asyncio.start_server(backend_handler,"127.0.0.1",target_port,backlog=4096)
+    server=subprocess.Popen(["python3.13","server.py","-c",server_cfg],stdout=subprocess.DEVNULL,stderr=subprocess.DEVNULL)
+    client=subprocess.Popen(["python3.13","client.py","-c",client_cfg],stdout=subprocess.DEVNULL,stderr=subprocess.DEVNULL)
+    writers=[]
+    try:
+        await asyncio.sleep(4)
+        if server.poll() is not None or client.poll() is not None:
+            return None
+        start=time.perf_counter()
+        intact=await bulk_download(tunnel_port)
+        rate=BULK_BYTES/(time.perf_counter()-start)
+        await asyncio.sleep(0.5)
+        base=rss_kb(server.pid)+rss_kb(client.pid)
+        for _ in range(CONNECTIONS//BATCH):
+            writers.extend(await asyncio.gather(*[open_idle(tunnel_port) for _ in range(BATCH)]))
+        await asyncio.sleep(1)
+        loaded=rss_kb(server.pid)+rss_kb(client.pid)
+        return intact,rate,(loaded-base)*1024/CONNECTIONS
+    finally:
+        for writer in writers:
+            writer.close()
+        server.terminate()
+        client.terminate()
+        backend.close()
+        await asyncio.sleep(1)
+
+async def test():
+    print("🔌 Connection Density Benchmark")
+    print("="*60)
+    print(f"   {CONNECTIONS} idle connections after one echo each, plus a {BULK_BYTES//1048576}MB download\n")
+    results={}
+    for label,local_io in (("streams + writer tasks (before)","streams"),("BufferedProtocol (after)","protocol")):
+        result=await run(local_io)
+        if result is None:
+            print("❌ GhostWire failed to start")
+            return False
+        intact,rate,per_conn=result
+        results[local_io]=per_conn
+        print(f"🧪 {label}")
+        print(f"   bulk download: {rate/1048576:.1f} MB/s, {'intact' if intact else 'CORRUPTED'}")
+        print(f"   memory per connection (server+client): {per_conn/1024:.1f} KB, ~{1073741824/max(per_conn,1):,.0f} connections per GB\n")
+        if not intact:
+            print("❌ Bulk download corrupted")
+            return False
+    print(f"   memory reduction: {results['streams']/max(results['protocol'],1):.2f}x")
+    if results["protocol"]>=results["streams"]:
+        print("❌ Protocol path did not reduce per-connection memory")
+        return False
+    print("✅ Benchmark complete!")
+    return True
+
+try:
+    result=asyncio.run(test())
+    sys.exit(0 if result else 1)
+except KeyboardInterrupt:
+    print("\nInterrupted")
+    sys.exit(1)
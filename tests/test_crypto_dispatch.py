@@ -0,0 +1,52 @@
+#!/usr/bin/env python3.13
+import asyncio
+import os
+import sys
+import time
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import protocol
+from protocol import *
+
+async def frame_rate(make_frame,count):
+    start=time.perf_counter()
+    for i in range(count):
+        await make_frame(i)
+    return count/(time.perf_counter()-start)
+
+async def test():
+    print("⚖️  Adaptive Crypto Dispatch Benchmark")
+    print("="*60)
+    dispatch=await calibrate_crypto_dispatch()
+    print(f"✅ Calibrated: inline up to {dispatch['threshold']} bytes")
+    print(f"   executor hop: {dispatch['executor_hop_us']}us, cipher: {dispatch['cipher_us_per_kb']}us/KB\n")
+    key=os.urandom(32)
+    cases=[
+        ("PING (8B)",lambda i:pack_ping(i,key),20000),
+        ("CLOSE (1B)",lambda i:pack_close(i,0,key),20000),
+        ("DATA 16KB",lambda i,payload=os.urandom(16384):pack_data(i,payload,key),5000),
+    ]
+    threshold=dispatch["threshold"]
+    for label,make_frame,count in cases:
+        protocol._crypto_dispatch["threshold"]=-1
+        offload=await frame_rate(make_frame,count)
+        protocol._crypto_dispatch["threshold"]=threshold
+        adaptive=await frame_rate(make_frame,count)
+        print(f"🧪 {label}")
+        print(f"   always offload: {offload:,.0f} frames/s")
+        print(f"   adaptive:       {adaptive:,.0f} frames/s\n")
+    ping=await pack_ping(123,key)
+    msg_type,_,payload,_=await unpack_message(ping,key)
+    if msg_type!=MSG_PING or struct.unpack("!Q",payload)[0]!=123:
+        print("❌ Inline round-trip failed")
+        return False
+    stats=get_crypto_stats()
+    print(f"📊 inline={stats['inline_calls']} ({stats['inline_seconds']:.3f}s) offload={stats['offload_calls']} ({stats['offload_seconds']:.3f}s)")
+    print("\n✅ Benchmark complete!")
+    return True
+
+try:
+    result=asyncio.run(test())
+    sys.exit(0 if result else 1)
+except KeyboardInterrupt:
+    print("\nInterrupted")
+    sys.exit(1)
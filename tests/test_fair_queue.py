@@ -0,0 +1,133 @@
+#!/usr/bin/env python3.13
+import asyncio
+import os
+import sys
+import time
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from protocol import *
+from outbound import OutboundQueue,OutboundLane,get_outbound_stats
+
+LINK_BYTES_PER_SEC=100*1024*1024
+BATCH_BYTES=65536
+DURATION=3.0
+ELEPHANT=1
+MOUSE=2
+
+async def link_sender(outbound,sent):
+    while not outbound.stop_event.is_set() or not outbound.empty():
+        if outbound.empty():
+            await outbound.wait()
+            continue
+        batch=[]
+        batch_bytes=0
+        while batch_bytes<BATCH_BYTES:
+            try:
+                frame=outbound.data.get_nowait()
+            except asyncio.QueueEmpty:
+                break
+            batch.append(frame)
+            batch_bytes+=frame_size(frame)
+        await asyncio.sleep(batch_bytes/LINK_BYTES_PER_SEC)
+        now=time.perf_counter()
+        for frame in batch:
+            sent.append((now,frame[1],frame_size(frame),frame[2]))
+
+async def elephant(outbound,stop):
+    chunk=b"E"*262144
+    while not stop.is_set():
+        await outbound.data.put(data_frame(ELEPHANT,chunk))
+
+async def mouse(outbound,stop,put_times):
+    while not stop.is_set():
+        stamp=struct.pack("!d",time.perf_counter())
+        put_times.append(stamp)
+        message=data_frame(MOUSE,stamp+b"m"*92)
+        try:
+            outbound.data.put_nowait(message)
+        except asyncio.QueueFull:
+            await outbound.data.put(message)
+        await asyncio.sleep(0.02)
+
+async def run(fair):
+    outbound=OutboundQueue()
+    if not fair:
+        outbound.data=OutboundLane(outbound,512)
+    sent=[]
+    put_times=[]
+    stop=asyncio.Event()
+    sender=asyncio.create_task(link_sender(outbound,sent))
+    producers=[asyncio.create_task(elephant(outbound,stop)),asyncio.create_task(mouse(outbound,stop,put_times))]
+    await asyncio.sleep(DURATION/2)
+    stats=get_outbound_stats()["connections"] if fair else {}
+    await asyncio.sleep(DURATION/2)
+    stop.set()
+    for task in producers+[sender]:
+        task.cancel()
+    await asyncio.gather(*producers,sender,return_exceptions=True)
+    latencies=sorted(at-struct.unpack("!d",payload[:8])[0] for at,conn_id,_,payload in sent if conn_id==MOUSE)
+    elephant_bytes=sum(size for _,conn_id,size,_ in sent if conn_id==ELEPHANT)
+    return latencies,len(put_times),elephant_bytes/DURATION,stats
+
+def close_admitted_when_full():
+    outbound=OutboundQueue()
+    for index in range(outbound.data.maxsize):
+        outbound.data.put_nowait(data_frame(1000+index,b"x"))
+    try:
+        outbound.data.put_nowait(close_frame(MOUSE,0))
+        outbound.data.put_nowait(close_seq_frame(ELEPHANT,7,0))
+    except asyncio.QueueFull:
+        return False
+    closed=set()
+    while not outbound.data.empty():
+        frame=outbound.data.get_nowait()
+        if frame[0] in (MSG_CLOSE,MSG_CLOSE_SEQ):
+            closed.add(frame[1])
+    return closed=={MOUSE,ELEPHANT}
+
+def full_read_served_in_one_visit():
+    outbound=OutboundQueue()
+    outbound.data.put_nowait(data_seq_frame(ELEPHANT,0,bytes(IO_CHUNK_SIZE)))
+    outbound.data.put_nowait(data_frame(MOUSE,b"m"))
+    return [outbound.data.get_nowait()[1] for _ in range(2)]==[ELEPHANT,MOUSE]
+
+async def test():
+    print("⚖️  Per-Connection Fair Queueing Benchmark")
+    print("="*60)
+    if not close_admitted_when_full():
+        print("❌ CLOSE frame dropped by a full data lane")
+        return False
+    print("✅ CLOSE frames admitted by a full data lane")
+    if not full_read_served_in_one_visit():
+        print("❌ Full-size read frame needed several DRR rounds")
+        return False
+    print("✅ Full-size read frame served on its flow's first visit\n")
+    print(f"   link: {LINK_BYTES_PER_SEC/1048576:.0f} MB/s, bulk flow 256KB chunks, interactive flow 100B every 20ms\n")
+    results={}
+    for label,fair in (("shared FIFO (before)",False),("deficit round robin (after)",True)):
+        latencies,mice,rate,stats=await run(fair)
+        results[label]=latencies
+        print(f"🧪 {label}")
+        print(f"   interactive delivered: {len(latencies)}/{mice}")
+        if latencies:
+            print(f"   interactive latency p50: {latencies[len(latencies)//2]*1000:.1f}ms, p99: {latencies[int(len(latencies)*0.99)]*1000:.1f}ms")
+        print(f"   bulk throughput: {rate/1048576:.1f} MB/s")
+        if stats:
+            for conn_id,entry in sorted(stats.items()):
+                print(f"   conn {conn_id}: depth={entry['depth']} bytes={entry['bytes']:,} wait={entry['wait_ms']}ms")
+        print()
+    fifo,drr=results.values()
+    if not drr or drr[int(len(drr)*0.99)]>0.05:
+        print("❌ Interactive flow still stuck behind bulk transfer")
+        return False
+    if fifo and drr[len(drr)//2]>=fifo[len(fifo)//2]:
+        print("❌ Fair queueing did not reduce interactive latency")
+        return False
+    print("✅ Benchmark complete!")
+    return True
+
+try:
+    result=asyncio.run(test())
+    sys.exit(0 if result else 1)
+except KeyboardInterrupt:
+    print("\nInterrupted")
+    sys.exit(1)
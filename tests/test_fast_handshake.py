@@ -0,0 +1,111 @@
+#!/usr/bin/env python3.13
+import asyncio
+import logging
+import os
+import sys
+import time
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from protocol import *
+from config import ServerConfig,ClientConfig
+from server import GhostWireServer
+from client import GhostWireClient
+
+ONE_WAY_DELAY=0.075
+PROXY_PORT=9444
+
+async def delayed_pipe(reader,writer,delay):
+    loop=asyncio.get_running_loop()
+    queue=asyncio.Queue()
+    async def deliver():
+        while True:
+            due,data=await queue.get()
+            if data is None:
+                writer.close()
+                return
+            await asyncio.sleep(max(0,due-loop.time()))
+            writer.write(data)
+            await writer.drain()
+    task=asyncio.create_task(deliver())
+    try:
+        while data:=await reader.read(65536):
+            queue.put_nowait((loop.time()+delay,data))
+    except ConnectionError:
+        pass
+    queue.put_nowait((0,None))
+    await task
+
+async def start_delay_proxy(target_host,target_port):
+    async def handle(client_reader,client_writer):
+        server_reader,server_writer=await asyncio.open_connection(target_host,target_port)
+        await asyncio.gather(delayed_pipe(client_reader,server_writer,ONE_WAY_DELAY),delayed_pipe(server_reader,client_writer,ONE_WAY_DELAY),return_exceptions=True)
+    return await asyncio.start_server(handle,"127.0.0.1",PROXY_PORT)
+
+async def timed_connect(server,client):
+    start=time.perf_counter()
+    ok=await client.connect()
+    elapsed=time.perf_counter()-start
+    await client.main_websocket.close()
+    while server.main_websocket is not None:
+        await asyncio.sleep(0.01)
+    return ok,elapsed
+
+async def test():
+    print("⏱️  Handshake Time-to-First-CONNECT Benchmark")
+    print("="*60)
+    logging.disable(logging.CRITICAL)
+    root=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    server_config=ServerConfig(os.path.join(root,"test_server.toml"))
+    client_config=ClientConfig(os.path.join(root,"test_client.toml"))
+    client_config.server_url=f"ws://127.0.0.1:{PROXY_PORT}{server_config.websocket_path}"
+    client_config.cloudflare_enabled=False
+    server=GhostWireServer(server_config)
+    server_task=asyncio.create_task(server.start())
+    await asyncio.sleep(2)
+    proxy=await start_delay_proxy(server_config.listen_host,server_config.listen_port)
+    prefill_rsa_keypairs()
+    await asyncio.sleep(1)
+    print(f"   simulated RTT: {ONE_WAY_DELAY*2000:.0f}ms (TCP setup excluded)\n")
+    results={}
+    try:
+        for label in ("full handshake","1-RTT hello (pinned key)","1-RTT ticket resume","stale pin fallback"):
+            client=GhostWireClient(client_config)
+            if label!="full handshake":
+                client.server_features={FEATURE_X25519,FEATURE_FAST_HANDSHAKE}
+                client.pinned_server_key=server.public_key
+            if label=="1-RTT ticket resume":
+                session_key=os.urandom(32)
+                client.resume_ticket=(issue_ticket(server.ticket_key,session_key),resumption_secret(session_key))
+            if label=="stale pin fallback":
+                client.pinned_server_key=generate_rsa_keypair()[1]
+            timings=[]
+            for _ in range(3):
+                ok,elapsed=await timed_connect(server,client)
+                if not ok:
+                    print(f"❌ {label} failed to connect")
+                    return False
+                timings.append(elapsed)
+                if label=="1-RTT ticket resume":
+                    session_key=os.urandom(32)
+                    client.resume_ticket=(issue_ticket(server.ticket_key,session_key),resumption_secret(session_key))
+                if label=="stale pin fallback":
+                    client.pinned_server_key=generate_rsa_keypair()[1]
+            results[label]=sorted(timings)[1]
+            print(f"🧪 {label}: {results[label]*1000:.0f}ms ({results[label]/(ONE_WAY_DELAY*2):.1f} RTT)")
+    finally:
+        proxy.close()
+        server.stop()
+        server_task.cancel()
+        await asyncio.gather(server_task,return_exceptions=True)
+    if results["1-RTT hello (pinned key)"]>=results["full handshake"] or results["1-RTT ticket resume"]>=results["full handshake"]:
+        print("\n❌ 1-RTT handshakes were not faster")
+        return False
+    print("\n✅ Benchmark complete!")
+    return True
+
+if __name__=="__main__":
+    try:
+        result=asyncio.run(test())
+        sys.exit(0 if result else 1)
+    except KeyboardInterrupt:
+        print("\nInterrupted")
+        sys.exit(1)
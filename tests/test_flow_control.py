@@ -0,0 +1,177 @@
+#!/usr/bin/env python3.13
+import asyncio
+import os
+import subprocess
+import socket
+import sys
+import time
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from flowcontrol import ConnWindows
+
+BODY_BYTES=96*1048576
+STALL_SECONDS=4
+
+def get_free_port():
+    s=socket.socket(socket.AF_INET,socket.SOCK_STREAM)
+    s.bind(("127.0.0.1",0))
+    port=s.getsockname()[1]
+    s.close()
+    return port
+
+def write_test_configs(ws_port,tunnel_port,target_port):
+    server_cfg=f"""[server]
+protocol="websocket"
+listen_host="127.0.0.1"
+listen_port={ws_port}
+websocket_path="/ws"
+auto_update=false
+ping_timeout=60
+
+[auth]
+token="test_token_123456"
+
+[tunnels]
+ports=["{tunnel_port}={target_port}"]
+
+[logging]
+level="info"
+file="/tmp/ghostwire-flow-server.log"
+"""
+    client_cfg=f"""[server]
+protocol="websocket"
+url="ws://127.0.0.1:{ws_port}/ws"
+token="test_token_123456"
+auto_update=false
+
+[reconnect]
+initial_delay=1
+max_delay=10
+multiplier=2
+
+[cloudflare]
+enabled=false
+ips=[]
+host=""
+check_interval=300
+
+[logging]
+level="info"
+file="/tmp/ghostwire-flow-client.log"
+"""
+    server_path=f"/tmp/ghostwire-flow-server-{ws_port}.toml"
+    client_path=f"/tmp/ghostwire-flow-client-{ws_port}.toml"
+    with open(server_path,"w") as f:
+        f.write(server_cfg)
+    with open(client_path,"w") as f:
+        f.write(client_cfg)
+    return server_path,client_path
+
+async def backend_handler(reader,writer):
+    try:
+        await reader.read(2048)
+        chunk=b"B"*262144
+        for _ in range(BODY_BYTES//len(chunk)):
+            writer.write(chunk)
+            await writer.drain()
+        writer.close()
+        await writer.wait_closed()
+    except:
+        pass
+
+async def slow_download(port,stall):
+    reader,writer=await asyncio.wait_for(asyncio.open_connection("127.0.0.1",port),timeout=5)
+    writer.write(b"GET / HTTP/1.1\r\n\r\n")
+    await writer.drain()
+    await asyncio.sleep(stall)
+    total=0
+    start=time.perf_counter()
+    while True:
+        chunk=await asyncio.wait_for(reader.read(1048576),timeout=30)
+        if not chunk:
+            break
+        total+=len(chunk)
+    writer.close()
+    return total,time.perf_counter()-start
+
+def peak_rss_mb(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])/1024
+    except OSError:
+        pass
+    return 0.0
+
+async def verify_windows():
+    windows=ConnWindows(window=1000)
+    windows.enable()
+    windows.open(1)
+    size=await windows.acquire(1,4096)
+    windows.spend(1,size)
+    blocked=asyncio.create_task(windows.acquire(1,4096))
+    await asyncio.sleep(0.01)
+    if size!=1000 or blocked.done():
+        return "sender was not limited to its window"
+    if windows.consume(1,400) or windows.consume(1,200)!=600:
+        return "receiver did not grant credit at half the window"
+    windows.grant(1,600)
+    if await asyncio.wait_for(blocked,timeout=1)!=600:
+        return "grant did not wake the blocked sender"
+    windows.discard(1)
+    if await windows.acquire(1,4096)!=4096:
+        return "discarded connection still limited"
+    return None
+
+async def test():
+    print("🚦 Per-Connection Flow Control Test")
+    print("="*60)
+    error=await verify_windows()
+    if error:
+        print(f"❌ {error}")
+        return False
+    print("✅ Sender blocks at its window, receiver grants credit as it drains\n")
+    ws_port=get_free_port()
+    tunnel_port=get_free_port()
+    target_port=get_free_port()
+    server_cfg,client_cfg=write_test_configs(ws_port,tunnel_port,target_port)
+    backend=await asyncio.start_server(backend_handler,"127.0.0.1",target_port)
+    server=subprocess.Popen(["python3.13","server.py","-c",server_cfg],stdout=subprocess.DEVNULL,stderr=subprocess.DEVNULL)
+    client=None
+    try:
+        await asyncio.sleep(2)
+        if server.poll() is not None:
+            print("❌ GhostWire server failed to start")
+            return False
+        client=subprocess.Popen(["python3.13","client.py","-c",client_cfg],stdout=subprocess.DEVNULL,stderr=subprocess.DEVNULL)
+        await asyncio.sleep(3)
+        print(f"🧪 {BODY_BYTES//1048576}MB download, local reader stalls {STALL_SECONDS}s before reading")
+        total,elapsed=await slow_download(tunnel_port,STALL_SECONDS)
+        rss=peak_rss_mb(server.pid)
+        print(f"   received {total/1048576:.1f}MB in {elapsed:.2f}s after the stall, server peak RSS {rss:.0f}MB")
+        with open("/tmp/ghostwire-flow-server.log") as f:
+            log=f.read()
+        if "Write queue full" in log:
+            print("❌ Slow reader was disconnected with a full write queue")
+            return False
+        if "Client features" not in log or "conn-window" not in log:
+            print("❌ Flow control was not negotiated")
+            return False
+        if total!=BODY_BYTES:
+            print(f"❌ Download truncated at {total} bytes")
+            return False
+        print("✅ Slow consumer throttled the source instead of being disconnected")
+        return True
+    finally:
+        server.terminate()
+        if client:
+            client.terminate()
+        backend.close()
+        await asyncio.sleep(1)
+
+try:
+    result=asyncio.run(test())
+    sys.exit(0 if result else 1)
+except KeyboardInterrupt:
+    print("\nInterrupted")
+    sys.exit(1)
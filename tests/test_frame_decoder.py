@@ -0,0 +1,77 @@
+#!/usr/bin/env python3.13
+import asyncio
+import os
+import sys
+import time
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from protocol import *
+
+async def make_messages(key,payload_size,batch_bytes,count):
+    frames=[data_frame(i,os.urandom(payload_size)) for i in range(max(1,batch_bytes//(payload_size+FRAME_OVERHEAD)))]
+    message=b"".join(await pack_messages(frames,key))
+    return [message]*count,len(frames)*count
+
+async def bytearray_rate(key,messages):
+    buffer=bytearray()
+    frames=0
+    start=time.perf_counter()
+    for message in messages:
+        buffer.extend(message)
+        while len(buffer)>=9:
+            try:
+                msg_type,conn_id,payload,consumed=await unpack_message(buffer,key)
+                del buffer[:consumed]
+            except ValueError:
+                break
+            frames+=1
+    return frames/(time.perf_counter()-start)
+
+async def decoder_rate(key,messages):
+    decoder=FrameDecoder()
+    frames=0
+    start=time.perf_counter()
+    for message in messages:
+        for msg_type,conn_id,payload in decoder.feed(message):
+            await open_frame(msg_type,conn_id,payload,key)
+            frames+=1
+    return frames/(time.perf_counter()-start)
+
+async def verify_split(key):
+    frames=[data_frame(1,b"a"*10),close_frame(2,0),data_frame(3,os.urandom(70000)),data_frame(4,b"")]
+    stream=b"".join(await pack_messages(frames,key))
+    for piece in (1,7,9,4096,len(stream)):
+        decoder=FrameDecoder()
+        got=[]
+        for offset in range(0,len(stream),piece):
+            for msg_type,conn_id,payload in decoder.feed(stream[offset:offset+piece]):
+                got.append(await open_frame(msg_type,conn_id,payload,key))
+        if got!=frames or decoder.pending:
+            return False
+    return True
+
+async def test():
+    print("🧩 Frame Decoder Benchmark")
+    print("="*60)
+    key=os.urandom(32)
+    await calibrate_crypto_dispatch()
+    if not await verify_split(key):
+        print("❌ Decoder failed on split input")
+        return False
+    print("✅ Frames reassemble across arbitrary message splits\n")
+    for payload_size in (64,512,4096):
+        messages,total=await make_messages(key,payload_size,131072,40)
+        before=await bytearray_rate(key,messages)
+        after=await decoder_rate(key,messages)
+        print(f"🧪 {payload_size}B frames in 128KB messages ({total} frames)")
+        print(f"   bytearray slicing: {before:,.0f} frames/s")
+        print(f"   FrameDecoder:      {after:,.0f} frames/s")
+        print(f"   speedup: {after/before:.2f}x\n")
+    print("✅ Benchmark complete!")
+    return True
+
+try:
+    result=asyncio.run(test())
+    sys.exit(0 if result else 1)
+except KeyboardInterrupt:
+    print("\nInterrupted")
+    sys.exit(1)
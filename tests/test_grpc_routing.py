@@ -0,0 +1,98 @@
+#!/usr/bin/env python3.13
+import asyncio
+import os
+import socket
+import sys
+import tempfile
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from grpclib.server import Server
+from protocol import *
+from config import ServerConfig
+from server import GhostWireServer
+from grpc_transport import GrpcTunnelServicer,GrpcClientTransport
+
+CONN_ID=11
+INCREMENT=131072
+
+def get_free_port():
+    s=socket.socket(socket.AF_INET,socket.SOCK_STREAM)
+    s.bind(("127.0.0.1",0))
+    port=s.getsockname()[1]
+    s.close()
+    return port
+
+def make_server(port):
+    with tempfile.NamedTemporaryFile("w",suffix=".toml",delete=False) as f:
+        f.write(f"""[server]
+protocol="grpc"
+listen_host="127.0.0.1"
+listen_port={port}
+auto_update=false
+udp_enabled=false
+
+[auth]
+token="test_token_123456"
+
+[logging]
+level="warning"
+file="/tmp/ghostwire-grpc-routing-test.log"
+""")
+    try:
+        return GhostWireServer(ServerConfig(f.name))
+    finally:
+        os.unlink(f.name)
+
+async def wait_for(predicate,timeout=5):
+    deadline=asyncio.get_running_loop().time()+timeout
+    while not predicate():
+        if asyncio.get_running_loop().time()>deadline:
+            return False
+        await asyncio.sleep(0.02)
+    return True
+
+async def test():
+    print("🧪 gRPC Receive Routing")
+    print("="*60)
+    port=get_free_port()
+    server=make_server(port)
+    grpc_server=Server([GrpcTunnelServicer(server)])
+    await grpc_server.start("127.0.0.1",port)
+    transport=GrpcClientTransport(f"ws://127.0.0.1:{port}/ws","test_token_123456")
+    try:
+        if not await transport.connect():
+            print("❌ gRPC client failed to authenticate")
+            return False
+        if not await wait_for(lambda:server.key is not None):
+            print("❌ Server never registered the gRPC session")
+            return False
+        windows=server.conn_windows
+        windows.enable()
+        windows.open(CONN_ID)
+        windows.spend(CONN_ID,windows.window)
+        print(f"   conn {CONN_ID} send window exhausted ({windows.credits[CONN_ID]} bytes left)")
+        await transport.send(b"".join(await pack_messages([window_update_frame(CONN_ID,INCREMENT)],transport.key)))
+        if not await wait_for(lambda:windows.credits.get(CONN_ID)==INCREMENT):
+            print(f"❌ WINDOW_UPDATE over gRPC was not applied (credit={windows.credits.get(CONN_ID)})")
+            return False
+        print(f"✅ WINDOW_UPDATE over gRPC granted {INCREMENT} bytes")
+        server.tunnel_manager.set_channel(CONN_ID,"main")
+        server.tunnel_manager.state(CONN_ID)
+        await transport.send(b"".join(await pack_messages([close_seq_frame(CONN_ID,0,0)],transport.key)))
+        if not await wait_for(lambda:CONN_ID not in server.tunnel_manager.conns):
+            print("❌ CLOSE_SEQ over gRPC was not routed")
+            return False
+        print("✅ CLOSE_SEQ over gRPC routed to the connection")
+    finally:
+        await transport.close()
+        grpc_server.close()
+        await grpc_server.wait_closed()
+    print("\n✅ Test complete!")
+    return True
+
+if __name__=="__main__":
+    try:
+        result=asyncio.run(test())
+        sys.exit(0 if result else 1)
+    except KeyboardInterrupt:
+        print("\nInterrupted")
+        sys.exit(1)
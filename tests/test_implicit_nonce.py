@@ -0,0 +1,97 @@
+#!/usr/bin/env python3.13
+import asyncio
+import os
+import sys
+import time
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from protocol import *
+
+TRIALS=5
+NOISE=0.9
+
+async def roundtrip(key,auth_salt):
+    client_tx,client_rx=channel_nonce_counters(key,auth_salt,"client")
+    server_tx,server_rx=channel_nonce_counters(key,auth_salt,"server")
+    frames=[data_frame(1,b"ls -la\n"),await pack_ping(123,key),close_frame(2,0),data_seq_frame(3,9,b"x"*5000)]
+    buffer=bytearray(b"".join(await pack_messages(frames,key,client_tx)))
+    expected=[(MSG_DATA,1,b"ls -la\n"),(MSG_PING,0,struct.pack("!Q",123)),(MSG_CLOSE,2,b"\x00"),(MSG_DATA_SEQ,3,struct.pack("!I",9)+b"x"*5000)]
+    for want in expected:
+        msg_type,conn_id,payload,consumed=await unpack_message(buffer,key,server_rx)
+        del buffer[:consumed]
+        if (msg_type,conn_id,payload)!=want:
+            return False
+    reply=b"".join(await pack_messages([data_frame(1,b"ok")],key,server_tx))
+    msg_type,conn_id,payload,_=await unpack_message(reply,key,client_rx)
+    return (msg_type,conn_id,payload)==(MSG_DATA,1,b"ok") and client_tx.counter==3 and server_rx.counter==3
+
+async def replay_rejected(key,auth_salt):
+    client_tx,_=channel_nonce_counters(key,auth_salt,"client")
+    _,server_rx=channel_nonce_counters(key,auth_salt,"server")
+    message=(await pack_messages([data_frame(1,b"once")],key,client_tx))[0]
+    await unpack_message(message,key,server_rx)
+    try:
+        await unpack_message(message,key,server_rx)
+    except Exception:
+        return True
+    return False
+
+async def channels_independent(key):
+    first,_=channel_nonce_counters(key,os.urandom(AUTH_SALT_SIZE),"client")
+    second,_=channel_nonce_counters(key,os.urandom(AUTH_SALT_SIZE),"client")
+    reverse,_=channel_nonce_counters(key,os.urandom(AUTH_SALT_SIZE),"server")
+    payload=b"same"
+    sealed={(await pack_messages([data_frame(1,payload)],key,tx))[0] for tx in (first,second,reverse)}
+    return len(sealed)==3
+
+async def frame_rate(key,payload,count,tx):
+    start=time.perf_counter()
+    for i in range(count):
+        await pack_messages([data_frame(i,payload)],key,tx)
+    return count/(time.perf_counter()-start)
+
+async def test():
+    print("🔢 Implicit Nonce Test")
+    print("="*60)
+    key=os.urandom(32)
+    auth_salt=os.urandom(AUTH_SALT_SIZE)
+    await calibrate_crypto_dispatch()
+    if not await roundtrip(key,auth_salt):
+        print("❌ Implicit nonce frames failed to roundtrip")
+        return False
+    print("✅ Mixed implicit/explicit frames decrypt in order")
+    if not await replay_rejected(key,auth_salt):
+        print("❌ Replayed frame was accepted")
+        return False
+    print("✅ Replayed frame rejected")
+    if not await channels_independent(key):
+        print("❌ Channels share keystream")
+        return False
+    print("✅ Channels and directions use independent subkeys\n")
+    tx,_=channel_nonce_counters(key,auth_salt,"client")
+    for size in (1,64,1400):
+        payload=os.urandom(size)
+        explicit=(await pack_messages([data_frame(1,payload)],key))[0]
+        implicit=(await pack_messages([data_frame(1,payload)],key,tx))[0]
+        before=after=0
+        for _ in range(TRIALS):
+            before=max(before,await frame_rate(key,payload,20000,None))
+            after=max(after,await frame_rate(key,payload,20000,tx))
+        print(f"🧪 {size}B payload")
+        print(f"   wire bytes: {len(explicit)} -> {len(implicit)}")
+        print(f"   random nonce:  {before:,.0f} frames/s")
+        print(f"   counter nonce: {after:,.0f} frames/s\n")
+        if len(explicit)-len(implicit)!=12:
+            print("❌ Implicit frame did not drop the nonce")
+            return False
+        if after<before*NOISE:
+            print("❌ Counter nonces sealed slower than random nonces")
+            return False
+    print("✅ Test complete!")
+    return True
+
+try:
+    result=asyncio.run(test())
+    sys.exit(0 if result else 1)
+except KeyboardInterrupt:
+    print("\nInterrupted")
+    sys.exit(1)
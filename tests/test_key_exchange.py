@@ -0,0 +1,68 @@
+#!/usr/bin/env python3.13
+import asyncio
+import os
+import sys
+import time
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from protocol import *
+
+async def watch_stalls(stop,stalls):
+    while not stop.is_set():
+        start=time.perf_counter()
+        await asyncio.sleep(0.001)
+        stalls.append(time.perf_counter()-start-0.001)
+
+async def measure(acquire,rounds):
+    stop=asyncio.Event()
+    stalls=[]
+    watcher=asyncio.create_task(watch_stalls(stop,stalls))
+    waits=[]
+    for _ in range(rounds):
+        start=time.perf_counter()
+        await acquire()
+        waits.append(time.perf_counter()-start)
+        await asyncio.sleep(0.6)
+    stop.set()
+    await watcher
+    return sorted(waits)[rounds//2],max(stalls)
+
+async def inline_rsa():
+    return generate_rsa_keypair()
+
+async def x25519():
+    return generate_x25519_keypair()
+
+def verify_x25519():
+    auth_salt=os.urandom(AUTH_SALT_SIZE)
+    client_private_key,client_public_bytes=generate_x25519_keypair()
+    server_private_key,server_public_bytes=generate_x25519_keypair()
+    pubkey_msg=pack_pubkey(client_public_bytes)
+    session_msg=pack_x25519_session(server_public_bytes)
+    server_key=x25519_session_key(server_private_key,pubkey_msg[9:],auth_salt)
+    client_key=unpack_session_key(session_msg[9:],client_private_key,auth_salt)
+    other_salt=x25519_session_key(server_private_key,pubkey_msg[9:],os.urandom(AUTH_SALT_SIZE))
+    return len(pubkey_msg)==9+X25519_KEY_SIZE and server_key==client_key and other_salt!=client_key
+
+async def test():
+    print("🔐 Client Key Exchange Benchmark")
+    print("="*60)
+    if not verify_x25519():
+        print("❌ X25519 session keys do not match")
+        return False
+    print("✅ X25519 session keys agree and are bound to the handshake salt\n")
+    prefill_rsa_keypairs()
+    await asyncio.sleep(2)
+    for label,acquire in (("inline RSA-2048 keygen",inline_rsa),("pooled RSA-2048",acquire_rsa_keypair),("X25519 ephemeral",x25519)):
+        wait,stall=await measure(acquire,5)
+        print(f"🧪 {label}")
+        print(f"   connect waits: {wait*1000:.2f}ms (median), worst loop stall: {stall*1000:.1f}ms\n")
+    print("✅ Benchmark complete!")
+    return True
+
+if __name__=="__main__":
+    try:
+        result=asyncio.run(test())
+        sys.exit(0 if result else 1)
+    except KeyboardInterrupt:
+        print("\nInterrupted")
+        sys.exit(1)
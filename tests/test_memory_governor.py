@@ -0,0 +1,123 @@
+#!/usr/bin/env python3.13
+import asyncio
+import gc
+import os
+import sys
+import time
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from protocol import *
+from memory import governor,BudgetedQueue,BudgetedBuffers,get_memory_stats
+from outbound import OutboundQueue
+
+READERS=200
+CHUNK=65536
+BUDGET=8*1048576
+DURATION=1.5
+DRAIN_BYTES_PER_SEC=20*1024*1024
+
+async def fast_reader(queue,stop):
+    chunk=b"r"*CHUNK
+    while not stop.is_set():
+        if governor.over_budget():
+            await governor.wait_for_room()
+        await asyncio.sleep(0)
+        await queue.put(chunk)
+
+async def slow_writer(queues,stop,drained):
+    while not stop.is_set():
+        batch=0
+        for queue in queues:
+            try:
+                batch+=len(queue.get_nowait())
+            except asyncio.QueueEmpty:
+                pass
+        drained[0]+=batch
+        await asyncio.sleep(max(batch/DRAIN_BYTES_PER_SEC,0.001))
+
+async def run(budget):
+    governor.configure(budget)
+    queues=[BudgetedQueue("write_queue",32) for _ in range(READERS)]
+    stop=asyncio.Event()
+    drained=[0]
+    tasks=[asyncio.create_task(fast_reader(queue,stop)) for queue in queues]
+    tasks.append(asyncio.create_task(slow_writer(queues,stop,drained)))
+    peak=0
+    shed=0
+    deadline=time.perf_counter()+DURATION
+    while time.perf_counter()<deadline:
+        await asyncio.sleep(0.01)
+        peak=max(peak,governor.total)
+        if not governor.admit_connection():
+            shed+=1
+    stop.set()
+    governor.configure(budget)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks,return_exceptions=True)
+    return peak,shed,drained[0]/DURATION
+
+def verify_accounting():
+    governor.configure(BUDGET)
+    outbound=OutboundQueue()
+    outbound.data.put_nowait(data_frame(1,b"x"*1000))
+    outbound.control.put_nowait(close_frame(1,0))
+    queue=BudgetedQueue("write_queue",8)
+    queue.put_nowait(b"y"*500)
+    queue.put_nowait(None)
+    buffers=BudgetedBuffers("preconnect",2)
+    for _ in range(3):
+        buffers.append(7,b"z"*100)
+    used=get_memory_stats()["subsystems"]
+    if used["send_queue"]!=frame_size(data_frame(1,b"x"*1000))+frame_size(close_frame(1,0)) or used["write_queue"]!=500 or used["preconnect"]!=200:
+        return f"unexpected accounting {used}"
+    outbound.data.get_nowait()
+    queue.get_nowait()
+    buffers.pop(7)
+    if get_memory_stats()["subsystems"]["write_queue"] or get_memory_stats()["subsystems"]["preconnect"]:
+        return "dequeue did not release bytes"
+    del outbound,queue,buffers
+    gc.collect()
+    if governor.total:
+        return f"{governor.total} bytes still charged after buffers were discarded"
+    return None
+
+async def test():
+    print("🧠 Global Memory Governor Test")
+    print("="*60)
+    error=verify_accounting()
+    if error:
+        print(f"❌ {error}")
+        return False
+    print("✅ Send, write and pre-connect buffers charged and released, including on discard\n")
+    print(f"   {READERS} fast readers, 64KB chunks, writers drain {DRAIN_BYTES_PER_SEC/1048576:.0f} MB/s\n")
+    results={}
+    for label,budget in (("no effective budget (before)",1<<40),(f"{BUDGET//1048576}MB budget (after)",BUDGET)):
+        paused=get_memory_stats()["paused_reads"]
+        peak,shed,rate=await run(budget)
+        await asyncio.sleep(0)
+        gc.collect()
+        leftover=governor.total
+        results[budget]=(peak,shed)
+        print(f"🧪 {label}")
+        print(f"   peak buffered: {peak/1048576:.1f} MB, drain rate: {rate/1048576:.1f} MB/s")
+        print(f"   paused reads: {get_memory_stats()['paused_reads']-paused}, shed connections: {shed}\n")
+        if leftover:
+            print(f"❌ {leftover} bytes still charged after shutdown")
+            return False
+    unbounded,bounded=results[1<<40],results[BUDGET]
+    if bounded[0]>BUDGET+READERS*CHUNK:
+        print("❌ Buffered bytes exceeded the budget by more than one chunk per reader")
+        return False
+    if bounded[0]>=unbounded[0] or not bounded[1]:
+        print("❌ Budget did not bound memory or shed new connections")
+        return False
+    print(f"   peak reduction: {unbounded[0]/bounded[0]:.1f}x")
+    print("✅ Test complete!")
+    return True
+
+try:
+    result=asyncio.run(test())
+    sys.exit(0 if result else 1)
+except KeyboardInterrupt:
+    print("\nInterrupted")
+    sys.exit(1)
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3.13
+import asyncio
+import os
+import sys
+import time
+from types import SimpleNamespace
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from protocol import *
+from outbound import OutboundQueue
+from server import GhostWireServer
+
+ROUNDS=20000
+
+class EchoSocket:
+    def __init__(self):
+        self.reply=None
+        self.sent=[]
+    async def send(self,data):
+        self.sent.append(len(data))
+        if self.reply and not self.reply.done():
+            self.reply.set_result(None)
+
+async def legacy_sender(websocket,send_queue,control_queue,stop_event,key):
+    pool=BatchBufferPool()
+    while not stop_event.is_set() or not send_queue.empty() or not control_queue.empty():
+        batch=[]
+        for _ in range(64):
+            try:
+                batch.append(control_queue.get_nowait())
+            except asyncio.QueueEmpty:
+                break
+        while True:
+            try:
+                batch.append(send_queue.get_nowait())
+            except asyncio.QueueEmpty:
+                break
+        if not batch:
+            control_get=asyncio.create_task(control_queue.get())
+            data_get=asyncio.create_task(send_queue.get())
+            stop_get=asyncio.create_task(stop_event.wait())
+            done,pending=await asyncio.wait({control_get,data_get,stop_get},return_when=asyncio.FIRST_COMPLETED)
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending,return_exceptions=True)
+            if stop_get in done and control_get not in done and data_get not in done:
+                break
+            if control_get in done:
+                batch.append(control_get.result())
+            if data_get in done:
+                batch.append(data_get.result())
+        buffer,view=await pack_messages_into(batch,key,pool)
+        try:
+            await websocket.send(view)
+        finally:
+            view.release()
+            pool.release(buffer)
+
+async def ping_pong(websocket,send_queue,frame):
+    loop=asyncio.get_running_loop()
+    latencies=[]
+    start=time.perf_counter()
+    for _ in range(ROUNDS):
+        websocket.reply=loop.create_future()
+        sent=time.perf_counter()
+        send_queue.put_nowait(frame)
+        await websocket.reply
+        latencies.append(time.perf_counter()-sent)
+    elapsed=time.perf_counter()-start
+    latencies.sort()
+    return ROUNDS/elapsed,latencies[int(ROUNDS*0.99)]
+
+async def run_legacy(key,frame):
+    websocket=EchoSocket()
+    send_queue=asyncio.Queue(maxsize=512)
+    control_queue=asyncio.Queue(maxsize=256)
+    stop_event=asyncio.Event()
+    sender=asyncio.create_task(legacy_sender(websocket,send_queue,control_queue,stop_event,key))
+    result=await ping_pong(websocket,send_queue,frame)
+    stop_event.set()
+    await asyncio.wait_for(sender,timeout=2)
+    return result
+
+def sender_host(key):
+    return SimpleNamespace(key=key,cipher=CIPHER_AESGCM,implicit_nonces=False,ws_send_batch_bytes=65536,config=SimpleNamespace(batch_latency_ms=1.0))
+
+async def run_outbound(key,frame):
+    websocket=EchoSocket()
+    outbound=OutboundQueue()
+    sender=asyncio.create_task(GhostWireServer.sender_task(sender_host(key),websocket,outbound))
+    result=await ping_pong(websocket,outbound.data,frame)
+    outbound.stop_event.set()
+    await asyncio.wait_for(sender,timeout=2)
+    return result
+
+async def verify_semantics(key):
+    websocket=EchoSocket()
+    outbound=OutboundQueue(data_maxsize=4)
+    for i in range(4):
+        outbound.data.put_nowait(data_frame(i,b"x"))
+    blocked=asyncio.create_task(outbound.data.put(data_frame(9,b"x")))
+    await asyncio.sleep(0)
+    if blocked.done():
+        return "put() did not wait for space"
+    outbound.control.put_nowait(close_frame(7,0))
+    first=outbound.control.get_nowait()
+    outbound.data.get_nowait()
+    await asyncio.wait_for(blocked,timeout=1)
+    if first[1]!=7 or outbound.qsize()!=4:
+        return "lanes returned frames out of order"
+    while not outbound.empty():
+        outbound.data.get_nowait()
+    sender=asyncio.create_task(GhostWireServer.sender_task(sender_host(key),websocket,outbound))
+    await asyncio.sleep(0.01)
+    outbound.stop_event.set()
+    try:
+        await asyncio.wait_for(sender,timeout=1)
+    except asyncio.TimeoutError:
+        return "stop did not wake an idle sender"
+    return None
+
+async def test():
+    print("📤 Outbound Queue Ping-Pong Benchmark")
+    print("="*60)
+    key=os.urandom(32)
+    await calibrate_crypto_dispatch()
+    error=await verify_semantics(key)
+    if error:
+        print(f"❌ {error}")
+        return False
+    print("✅ Control lane first, data lane backpressure, stop wakes idle sender\n")
+    frame=data_frame(1,b"x"*64)
+    results={}
+    for label,run in (("three-task asyncio.wait (before)",run_legacy),("OutboundQueue single waiter (after)",run_outbound)):
+        await run(key,frame)
+        results[label]=await run(key,frame)
+        rate,p99=results[label]
+        print(f"🧪 {label}")
+        print(f"   {rate:,.0f} frames/s, p99 latency: {p99*1e6:.1f}µs\n")
+    before,after=results.values()
+    print(f"   speedup: {after[0]/before[0]:.2f}x frames/s")
+    print("✅ Benchmark complete!")
+    return True
+
+try:
+    result=asyncio.run(test())
+    sys.exit(0 if result else 1)
+except KeyboardInterrupt:
+    print("\nInterrupted")
+    sys.exit(1)
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3.13
+import asyncio
+import os
+import sys
+import time
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from protocol import *
+
+TRIALS=5
+NOISE=0.9
+
+async def serial_rate(key,message,rounds):
+    decoder=FrameDecoder()
+    count=0
+    start=time.perf_counter()
+    for _ in range(rounds):
+        for frame in decoder.feed(message):
+            msg_type,conn_id,payload=await open_frame(*frame,key)
+            count+=1
+    return count/(time.perf_counter()-start)
+
+async def pipelined_rate(key,message,rounds):
+    decoder=FrameDecoder()
+    count=0
+    start=time.perf_counter()
+    for _ in range(rounds):
+        async for frame in iter_open_frames(decoder.feed(message),key):
+            count+=1
+    return count/(time.perf_counter()-start)
+
+async def verify_order(key):
+    auth_salt=os.urandom(AUTH_SALT_SIZE)
+    tx,_=channel_nonce_counters(key,auth_salt,"client")
+    _,rx=channel_nonce_counters(key,auth_salt,"server")
+    frames=[data_frame(i,os.urandom(1000+i*37)) for i in range(400)]
+    stream=b"".join(await pack_messages(frames[:200],key))+b"".join(await pack_messages(frames[200:],key,tx))
+    decoder=FrameDecoder()
+    got=[frame async for frame in iter_open_frames(decoder.feed(stream),key,rx,window_bytes=65536)]
+    return got==frames and rx.counter==200
+
+async def test():
+    print("⚡ Parallel Receive Decryption Benchmark")
+    print("="*60)
+    key=os.urandom(32)
+    await calibrate_crypto_dispatch()
+    print(f"   executor workers: {os.cpu_count()}, inline threshold: {get_crypto_stats()['threshold']} bytes")
+    if not await verify_order(key):
+        print("❌ Frames routed out of order")
+        return False
+    print("✅ Frames delivered in order across windows and nonce modes\n")
+    slower=[]
+    for size,count,rounds in ((1024,128,400),(16384,32,200),(65536,8,200),(262144,2,200),(262144,8,50)):
+        message=b"".join(await pack_messages([data_frame(i,os.urandom(size)) for i in range(count)],key))
+        before=after=0
+        for _ in range(TRIALS):
+            before=max(before,await serial_rate(key,message,rounds))
+            after=max(after,await pipelined_rate(key,message,rounds))
+        label=f"{count} x {size//1024}KB"
+        print(f"🧪 {label} per message")
+        print(f"   serial open_frame: {before*size/1048576:,.0f} MB/s")
+        print(f"   iter_open_frames:  {after*size/1048576:,.0f} MB/s")
+        print(f"   speedup: {after/before:.2f}x\n")
+        if after<before*NOISE:
+            slower.append(label)
+    if slower:
+        print(f"❌ iter_open_frames slower than serial decryption for {', '.join(slower)}")
+        return False
+    print("✅ Benchmark complete!")
+    return True
+
+try:
+    result=asyncio.run(test())
+    sys.exit(0 if result else 1)
+except KeyboardInterrupt:
+    print("\nInterrupted")
+    sys.exit(1)
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3.13
+import asyncio
+import os
+import sys
+import tempfile
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from protocol import *
+from outbound import OutboundQueue
+from config import ServerConfig
+from server import GhostWireServer
+
+CONN_ID=7
+CHUNKS=20
+
+def make_server():
+    with tempfile.NamedTemporaryFile("w",suffix=".toml",delete=False) as f:
+        f.write("""[server]
+mode="direct"
+auto_update=false
+
+[auth]
+token="test_token_123456"
+
+[logging]
+level="warning"
+file="/tmp/ghostwire-preconnect-test.log"
+""")
+    try:
+        return GhostWireServer(ServerConfig(f.name))
+    finally:
+        os.unlink(f.name)
+
+async def test():
+    print("🧪 Preconnect Buffer Overflow")
+    print("="*60)
+    server=make_server()
+    outbound=OutboundQueue()
+    server.main_send_queue=outbound.data
+    server.main_control_queue=outbound.control
+    accepted=[]
+    async def on_accept(reader,writer):
+        accepted.append(writer)
+        await reader.read()
+        writer.close()
+    upstream=await asyncio.start_server(on_accept,"127.0.0.1",0)
+    port=upstream.sockets[0].getsockname()[1]
+    server.tunnel_manager.set_channel(CONN_ID,"main")
+    connect=asyncio.create_task(server.handle_direct_connect(CONN_ID,"127.0.0.1",port))
+    limit=server.preconnect_buffers.max_items
+    for index in range(limit+1):
+        await server.handle_data(CONN_ID,b"chunk%d"%index)
+    print(f"   {limit+1} chunks arrived before the upstream connect finished (buffer holds {limit})")
+    closes=[frame for frame in outbound.control.items if frame[0]==MSG_CLOSE and frame[1]==CONN_ID]
+    if not closes:
+        print("❌ Overflowing connection was not closed toward the peer")
+        return False
+    if CONN_ID in server.preconnect_buffers or CONN_ID in server.tunnel_manager.conns:
+        print("❌ Overflowing connection left buffered state behind")
+        return False
+    print("✅ CLOSE sent and buffered chunks released on overflow")
+    for index in range(limit+1,CHUNKS):
+        await server.handle_data(CONN_ID,b"chunk%d"%index)
+    await server.handle_close(CONN_ID)
+    if CONN_ID in server.preconnect_buffers:
+        print("❌ Chunks still in flight after the overflow were kept past the peer's CLOSE")
+        return False
+    await connect
+    await asyncio.sleep(0.1)
+    upstream.close()
+    if server.tunnel_manager.get_connection(CONN_ID) is not None:
+        print("❌ Upstream connection was attached after the tunnel side closed")
+        return False
+    if accepted and not accepted[0].is_closing():
+        print("❌ Upstream socket left open")
+        return False
+    print("✅ Late upstream connect is discarded instead of forwarding a truncated stream")
+    print("\n✅ Test complete!")
+    return True
+
+try:
+    result=asyncio.run(test())
+    sys.exit(0 if result else 1)
+except KeyboardInterrupt:
+    print("\nInterrupted")
+    sys.exit(1)
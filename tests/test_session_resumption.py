@@ -0,0 +1,99 @@
+#!/usr/bin/env python3.13
+import asyncio
+import os
+import sys
+import time
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from protocol import *
+from auth import validate_token
+
+TOKEN="test_token_123456"
+
+def full_handshake(server_private_key,server_public_key):
+    auth_salt=os.urandom(AUTH_SALT_SIZE)
+    client_private_key,client_public_key=generate_rsa_keypair()
+    auth_msg=pack_auth_message(TOKEN,server_public_key,role="main",auth_salt=auth_salt)
+    token,role,_=unpack_auth_payload(rsa_decrypt(server_private_key,auth_msg[9:]))
+    if not validate_token(token,TOKEN,auth_salt):
+        raise ValueError("Invalid token")
+    session_key=os.urandom(32)
+    return unpack_session_key(pack_session_key(session_key,client_public_key)[9:],client_private_key)
+
+def resumed_handshake(ticket_key,ticket,secret):
+    client_salt=os.urandom(AUTH_SALT_SIZE)
+    resume_msg=pack_resume(ticket,secret,client_salt)
+    server_key,_,_=unpack_resume(resume_msg[9:],ticket_key)
+    client_key=resumed_session_key(secret,client_salt)
+    if server_key!=client_key:
+        raise ValueError("Session keys differ")
+    return client_key
+
+def rejected(ticket_key,ticket,secret,client_salt,mutate):
+    payload=mutate(pack_resume(ticket,secret,client_salt)[9:])
+    try:
+        unpack_resume(payload,ticket_key)
+    except Exception:
+        return True
+    return False
+
+async def test():
+    print("🎟️  Session Resumption Test")
+    print("="*60)
+    server_private_key,server_public_key=generate_rsa_keypair()
+    ticket_key=os.urandom(32)
+    session_key=full_handshake(server_private_key,server_public_key)
+    ticket=issue_ticket(ticket_key,session_key)
+    secret=resumption_secret(session_key)
+    resumed=resumed_handshake(ticket_key,ticket,secret)
+    if resumed==session_key or resumed==resumed_handshake(ticket_key,ticket,secret):
+        print("❌ Resumed session reused the old key")
+        return False
+    print("✅ Ticket resumes with a fresh session key")
+    auth_salt=os.urandom(AUTH_SALT_SIZE)
+    checks=(
+        ("tampered ticket",lambda payload:payload[:AUTH_SALT_SIZE]+bytes([payload[AUTH_SALT_SIZE]^1])+payload[AUTH_SALT_SIZE+1:]),
+        ("wrong binder",lambda payload:payload[:-1]+bytes([payload[-1]^1])),
+        ("swapped salt",lambda payload:os.urandom(AUTH_SALT_SIZE)+payload[AUTH_SALT_SIZE:]),
+    )
+    for label,mutate in checks:
+        if not rejected(ticket_key,ticket,secret,auth_salt,mutate):
+            print(f"❌ Accepted {label}")
+            return False
+    if not rejected(ticket_key,issue_ticket(ticket_key,session_key,-1),secret,auth_salt,lambda payload:payload):
+        print("❌ Accepted expired ticket")
+        return False
+    if not rejected(os.urandom(32),ticket,secret,auth_salt,lambda payload:payload):
+        print("❌ Accepted ticket after server restart")
+        return False
+    replay=ReplayCache(TICKET_LIFETIME)
+    _,_,ticket_id=unpack_resume(pack_resume(ticket,secret,auth_salt)[9:],ticket_key)
+    if not replay.check(ticket_id) or replay.check(ticket_id):
+        print("❌ Replayed ticket was accepted twice")
+        return False
+    bounded=ReplayCache(TICKET_LIFETIME,max_entries=64)
+    if not all(bounded.check(os.urandom(16)) for _ in range(64)) or bounded.check(os.urandom(16)) or len(bounded.seen)>64:
+        print("❌ Replay cache grew past its cap")
+        return False
+    print("✅ Tampered, replayed, expired and stale tickets rejected\n")
+    rounds=10
+    start=time.perf_counter()
+    for _ in range(rounds):
+        full_handshake(server_private_key,server_public_key)
+    full=(time.perf_counter()-start)/rounds
+    start=time.perf_counter()
+    for _ in range(rounds*100):
+        resumed_handshake(ticket_key,ticket,secret)
+    fast=(time.perf_counter()-start)/(rounds*100)
+    print("🧪 CPU per main reconnect (client + server)")
+    print(f"   full handshake: {full*1000:.2f}ms")
+    print(f"   ticket resume:  {fast*1000:.3f}ms")
+    print(f"   speedup: {full/fast:,.0f}x\n")
+    print("✅ Test complete!")
+    return True
+
+try:
+    result=asyncio.run(test())
+    sys.exit(0 if result else 1)
+except KeyboardInterrupt:
+    print("\nInterrupted")
+    sys.exit(1)
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3.13
+import hashlib
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from memory import SlabPool,SLAB_CLASSES
+
+READ_BYTES=512*1048576
+IN_FLIGHT=64
+CHUNK=262144
+SEND=os.urandom(1048576)
+
+def rss_kb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    return 0
+
+def feed(sock):
+    sent=0
+    while sent<READ_BYTES:
+        sock.sendall(SEND)
+        sent+=len(SEND)
+    sock.shutdown(socket.SHUT_WR)
+
+def workload(mode):
+    reader,writer=socket.socketpair()
+    writer.setsockopt(socket.SOL_SOCKET,socket.SO_SNDBUF,4194304)
+    reader.setsockopt(socket.SOL_SOCKET,socket.SO_RCVBUF,4194304)
+    read_view=memoryview(bytearray(CHUNK))
+    pool=SlabPool(max_bytes=67108864)
+    in_flight=deque(maxlen=IN_FLIGHT)
+    digest=hashlib.sha256()
+    read_hint=SLAB_CLASSES[0]
+    base=rss_kb()
+    feeder=threading.Thread(target=feed,args=(writer,))
+    start=time.perf_counter()
+    feeder.start()
+    reads=0
+    while True:
+        if mode=="pool":
+            slot=pool.acquire(read_hint)
+            nbytes=reader.recv_into(memoryview(slot)[:CHUNK])
+            payload=memoryview(slot)[:nbytes]
+            read_hint=min(CHUNK,nbytes*2 if nbytes>=len(slot) else max(nbytes,SLAB_CLASSES[0]))
+        else:
+            nbytes=reader.recv_into(read_view)
+            payload=bytes(read_view[:nbytes])
+        if not nbytes:
+            break
+        reads+=1
+        if reads%64==0:
+            digest.update(payload)
+        in_flight.append(payload)
+    elapsed=time.perf_counter()-start
+    feeder.join()
+    peak=rss_kb()-base
+    in_flight.clear()
+    reader.close()
+    writer.close()
+    return {"rate":READ_BYTES/elapsed,"reads":reads,"peak_mb":peak/1024,"stats":pool.stats()}
+
+def verify_recycling():
+    pool=SlabPool(max_bytes=65536)
+    slot=pool.acquire(1000)
+    first=memoryview(slot)[:1000]
+    if pool.acquire(1000) is slot:
+        return "slot reused while its payload was still queued"
+    del first
+    if pool.acquire(1500) is not slot:
+        return "released slot was not recycled"
+    if len(pool.acquire(300000))!=300000:
+        return "oversized read not served"
+    stats=pool.stats()
+    if stats["hits"]!=1 or stats["peak_arena_bytes"]!=4096:
+        return f"unexpected pool stats {stats}"
+    if SlabPool().acquire(1000) is SlabPool().acquire(1000):
+        return "disabled pool shared a slot"
+    return None
+
+def run_worker(mode):
+    result=subprocess.run([sys.executable,os.path.abspath(__file__),mode],capture_output=True,text=True,timeout=300)
+    return json.loads(result.stdout)
+
+def test():
+    print("🧱 Slab Receive Buffer Pool Benchmark")
+    print("="*60)
+    error=verify_recycling()
+    if error:
+        print(f"❌ {error}")
+        return False
+    print("✅ Slots recycle only after the queued payload is released\n")
+    print(f"   {READ_BYTES//1048576}MB through a socketpair, {CHUNK//1024}KB reads, {IN_FLIGHT} payloads held in flight\n")
+    results={}
+    for label,mode in (("shared read buffer + copy (before)","bytes"),("recv_into pooled slabs (after)","pool")):
+        results[mode]=result=run_worker(mode)
+        print(f"🧪 {label}")
+        print(f"   {result['rate']/1048576:,.0f} MB/s over {result['reads']:,} reads, RSS growth {result['peak_mb']:.1f}MB")
+        if mode=="pool":
+            stats=result["stats"]
+            print(f"   hit rate {stats['hit_rate']*100:.1f}%, peak arena {stats['peak_arena_bytes']/1048576:.1f}MB, slots {stats['slots']}")
+        print()
+    stats=results["pool"]["stats"]
+    if stats["hit_rate"]<0.9:
+        print("❌ Pool hit rate too low")
+        return False
+    print(f"   throughput ratio: {results['pool']['rate']/results['bytes']['rate']:.2f}x")
+    print("✅ Benchmark complete!")
+    return True
+
+if len(sys.argv)>1:
+    print(json.dumps(workload(sys.argv[1])))
+    sys.exit(0)
+
+try:
+    result=test()
+    sys.exit(0 if result else 1)
+except KeyboardInterrupt:
+    print("\nInterrupted")
+    sys.exit(1)
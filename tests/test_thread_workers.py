@@ -0,0 +1,153 @@
+#!/usr/bin/env python3.13
+import asyncio
+import os
+import re
+import subprocess
+import threading
+import time
+import sys
+ROOT=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0,ROOT)
+sys.path.insert(0,os.path.dirname(os.path.abspath(__file__)))
+import protocol
+from protocol import BatchBufferPool,FrameDecoder,channel_nonce_counters,data_frame,iter_open_frames,pack_messages_into,get_crypto_stats
+from workers import gil_enabled
+from test_workers import get_free_port,write_test_configs,data_server_main,download,wait_for_tunnel,RESPONSE_SIZE
+
+CHANNELS=4
+ROUNDS=400
+BATCH=16
+FRAME_BYTES=16384
+CONNECTIONS=32
+
+async def channel_work(key,salt):
+    tx,_=channel_nonce_counters(key,salt,"server")
+    _,rx=channel_nonce_counters(key,salt,"client")
+    pool=BatchBufferPool()
+    decoder=FrameDecoder()
+    payload=os.urandom(FRAME_BYTES)
+    received=0
+    for index in range(ROUNDS):
+        buffer,view=await pack_messages_into([data_frame(index,payload)]*BATCH,key,pool,tx)
+        message=bytes(view)
+        view.release()
+        pool.release(buffer)
+        async for _,_,data in iter_open_frames(decoder.feed(message),key,rx):
+            received+=len(data)
+        await asyncio.sleep(0)
+    return received
+
+def single_loop(key,salts):
+    async def run():
+        return await asyncio.gather(*[channel_work(key,salt) for salt in salts])
+    start=time.perf_counter()
+    received=asyncio.run(run())
+    return sum(received),time.perf_counter()-start
+
+def loop_per_thread(key,salts):
+    received=[0]*len(salts)
+    def run(index):
+        received[index]=asyncio.run(channel_work(key,salts[index]))
+    threads=[threading.Thread(target=run,args=(index,)) for index in range(len(salts))]
+    start=time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sum(received),time.perf_counter()-start
+
+def pipeline_benchmark():
+    protocol._crypto_dispatch["threshold"]=1<<30
+    key=os.urandom(32)
+    salts=[os.urandom(32) for _ in range(CHANNELS)]
+    expected=CHANNELS*ROUNDS*BATCH*FRAME_BYTES
+    results={}
+    calls=[]
+    for label,runner in (("one loop, all channels",single_loop),(f"{CHANNELS} loops in {CHANNELS} threads",loop_per_thread)):
+        before=get_crypto_stats()["inline_calls"]
+        received,elapsed=runner(key,salts)
+        calls.append(get_crypto_stats()["inline_calls"]-before)
+        if received!=expected:
+            print(f"❌ {label}: received {received} of {expected} bytes")
+            return None
+        results[label]=mbps=received*8/1000000/elapsed
+        print(f"🧪 {label}: {mbps:,.0f} Mbps framed+sealed+opened")
+    if calls[0]!=calls[1]:
+        print(f"❌ Crypto stats lost updates across loops: {calls[1]} calls counted, expected {calls[0]}")
+        return None
+    print(f"✅ Crypto stats from {CHANNELS} loops add up ({calls[1]} calls)")
+    single,threaded=results.values()
+    return threaded/single
+
+async def run_tunnel(workers):
+    ws_port=get_free_port()
+    tunnel_port=get_free_port()
+    target_port=get_free_port()
+    server_cfg,client_cfg,server_log=write_test_configs(ws_port,tunnel_port,target_port,workers,"thread")
+    target=subprocess.Popen([sys.executable,"-c",f"import sys;sys.path.insert(0,{os.path.dirname(os.path.abspath(__file__))!r});from test_workers import data_server_main;data_server_main({target_port})"],stdout=subprocess.DEVNULL,stderr=subprocess.DEVNULL)
+    if workers>1:
+        launch=f"from config import ServerConfig;from server import setup_logging,run_server;from workers import Coordinator;config=ServerConfig({server_cfg!r});setup_logging(config);Coordinator(config,run_server,threads=True).run()"
+        server=subprocess.Popen([sys.executable,"-c",launch],cwd=ROOT,stdout=subprocess.DEVNULL,stderr=subprocess.DEVNULL)
+    else:
+        server=subprocess.Popen([sys.executable,"server.py","-c",server_cfg],cwd=ROOT,stdout=subprocess.DEVNULL,stderr=subprocess.DEVNULL)
+    await asyncio.sleep(2)
+    client=subprocess.Popen([sys.executable,"client.py","-c",client_cfg],cwd=ROOT,stdout=subprocess.DEVNULL,stderr=subprocess.DEVNULL)
+    try:
+        label="single loop" if workers==1 else f"{workers} loop threads"
+        if server.poll() is not None or not await wait_for_tunnel(tunnel_port):
+            print(f"   ❌ {label}: tunnel did not come up")
+            return None
+        await asyncio.sleep(2)
+        start=time.time()
+        sizes=await asyncio.gather(*[download(tunnel_port) for _ in range(CONNECTIONS)])
+        elapsed=time.time()-start
+        complete=sum(1 for size in sizes if size>=RESPONSE_SIZE)
+        mbps=sum(sizes)*8/1000000/elapsed
+        with open(server_log) as f:
+            loops=len(set(re.findall(r"Worker (\d+) joined main session",f.read())))+1 if workers>1 else 1
+        print(f"🧪 {label}: {complete}/{CONNECTIONS} downloads, {mbps:.1f} Mbps, {loops} loop(s) serving children")
+        return mbps if complete==CONNECTIONS else None
+    finally:
+        for process in (client,server,target):
+            process.terminate()
+        for process in (client,server,target):
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+async def tunnel_benchmark():
+    single=await run_tunnel(1)
+    if single is None:
+        return None
+    threaded=await run_tunnel(CHANNELS)
+    if threaded is None:
+        return None
+    return threaded/single
+
+def test():
+    print("🧵 Multi-loop Thread Worker Benchmark")
+    print("="*60)
+    free_threaded=not gil_enabled()
+    print(f"   Python {sys.version.split()[0]}, GIL {'disabled (free-threaded build)' if free_threaded else 'enabled'}, {os.cpu_count()} CPUs\n")
+    ratio=pipeline_benchmark()
+    if ratio is None:
+        return False
+    print(f"   loop-per-thread speedup: {ratio:.2f}x\n")
+    ratio=asyncio.run(tunnel_benchmark())
+    if ratio is None:
+        print("❌ Thread workers dropped connections")
+        return False
+    print(f"   tunnel speedup: {ratio:.2f}x\n")
+    if not free_threaded:
+        print("ℹ️  Threads share the GIL on this build, so server.py falls back to worker processes for worker_mode=\"thread\"")
+        print("   Run this script with python3.13t to measure the free-threaded speedup")
+    print("\n✅ Benchmark complete!")
+    return True
+
+try:
+    result=test()
+    sys.exit(0 if result else 1)
+except KeyboardInterrupt:
+    print("\nInterrupted")
+    sys.exit(1)
@@ -1,8 +1,71 @@
 #!/usr/bin/env python3.13
 import asyncio
+import os
+import socket
 import subprocess
 import time
 import sys
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from eventloop import available_backends
+
+LOOPS=sys.argv[1:] or available_backends()
+
+def get_free_port():
+    s=socket.socket(socket.AF_INET,socket.SOCK_STREAM)
+    s.bind(("127.0.0.1",0))
+    port=s.getsockname()[1]
+    s.close()
+    return port
+
+def write_test_configs(ws_port,tunnel_port,target_port,event_loop):
+    server_cfg=f"""[server]
+listen_host="127.0.0.1"
+listen_port={ws_port}
+websocket_path="/ws"
+ping_timeout=10
+ws_pool_enabled=true
+ws_pool_children=2
+event_loop="{event_loop}"
+auto_update=false
+
+[auth]
+token="test_token_123456"
+
+[tunnels]
+ports=["{tunnel_port}={target_port}"]
+
+[logging]
+level="info"
+file="/tmp/ghostwire-throughput-server.log"
+"""
+    client_cfg=f"""[server]
+url="ws://127.0.0.1:{ws_port}/ws"
+token="test_token_123456"
+event_loop="{event_loop}"
+auto_update=false
+
+[reconnect]
+initial_delay=1
+max_delay=10
+multiplier=2
+
+[cloudflare]
+enabled=false
+ips=[]
+host=""
+check_interval=300
+
+[logging]
+level="info"
+file="/tmp/ghostwire-throughput-client.log"
+"""
+    server_path=f"/tmp/ghostwire-throughput-server-{ws_port}.toml"
+    client_path=f"/tmp/ghostwire-throughput-client-{ws_port}.toml"
+    with open(server_path,"w") as f:
+        f.write(server_cfg)
+    with open(client_path,"w") as f:
+        f.write(client_cfg)
+    return server_path,client_path
 
 class DataServer:
     def __init__(self,port,response_size=10000):
@@ -47,48 +110,88 @@ async def download_data(port,size=10000):
     except Exception as e:
         return 0,time.time()-start
 
-async def test():
-    print("⚡ Concurrent Throughput Benchmark")
-    print("="*60)
-    print("Measuring: Performance with many concurrent connections\n")
-    data_server=DataServer(8888,response_size=50000)
+async def wait_for_tunnel(port,timeout=20):
+    deadline=time.time()+timeout
+    while time.time()<deadline:
+        size,_=await download_data(port)
+        if size>0:
+            return True
+        await asyncio.sleep(0.5)
+    return False
+
+async def run_loop(event_loop):
+    ws_port=get_free_port()
+    tunnel_port=get_free_port()
+    target_port=get_free_port()
+    server_cfg,client_cfg=write_test_configs(ws_port,tunnel_port,target_port,event_loop)
+    data_server=DataServer(target_port,response_size=50000)
     await data_server.start()
+    print(f"🔁 Event loop: {event_loop}")
     print("✅ Data server started (50KB responses)\n")
-    server=subprocess.Popen(["python3.13","server.py","-c","test_server.toml"],stdout=subprocess.DEVNULL,stderr=subprocess.DEVNULL)
+    server=subprocess.Popen(["python3.13","server.py","-c",server_cfg],stdout=subprocess.DEVNULL,stderr=subprocess.DEVNULL)
     await asyncio.sleep(2)
     if server.poll() is not None:
         print("❌ Server failed to start")
         await data_server.stop()
-        return False
-    client=subprocess.Popen(["python3.13","client.py","-c","test_client.toml"],stdout=subprocess.DEVNULL,stderr=subprocess.DEVNULL)
-    await asyncio.sleep(2)
-    print("✅ GhostWire started\n")
-    test_cases=[
-        (10,"10 connections"),
-        (25,"25 connections"),
-        (50,"50 connections"),
-    ]
-    for num_conn,label in test_cases:
-        print(f"🧪 Test: {label}")
-        start=time.time()
-        tasks=[download_data(9080) for _ in range(num_conn)]
-        results=await asyncio.gather(*tasks)
-        elapsed=time.time()-start
-        total_bytes=sum(size for size,_ in results)
-        successful=sum(1 for size,_ in results if size>0)
-        throughput_mbps=(total_bytes*8/1000000)/elapsed
-        avg_latency=sum(t for _,t in results)/len(results)
-        print(f"   ✓ Successful: {successful}/{num_conn}")
-        print(f"   ✓ Total time: {elapsed:.2f}s")
-        print(f"   ✓ Throughput: {throughput_mbps:.2f} Mbps")
-        print(f"   ✓ Avg latency: {avg_latency:.2f}s")
-        print()
+        return None
+    client=subprocess.Popen(["python3.13","client.py","-c",client_cfg],stdout=subprocess.DEVNULL,stderr=subprocess.DEVNULL)
+    try:
+        if not await wait_for_tunnel(tunnel_port):
+            print("❌ Tunnel did not come up")
+            return None
+        print("✅ GhostWire started\n")
+        test_cases=[
+            (10,"10 connections"),
+            (25,"25 connections"),
+            (50,"50 connections"),
+        ]
+        results={}
+        for num_conn,label in test_cases:
+            print(f"🧪 Test: {label}")
+            start=time.time()
+            tasks=[download_data(tunnel_port) for _ in range(num_conn)]
+            downloads=await asyncio.gather(*tasks)
+            elapsed=time.time()-start
+            total_bytes=sum(size for size,_ in downloads)
+            successful=sum(1 for size,_ in downloads if size>0)
+            if not successful:
+                print("   ❌ No downloads completed through the tunnel")
+                return None
+            throughput_mbps=(total_bytes*8/1000000)/elapsed
+            avg_latency=sum(t for _,t in downloads)/len(downloads)
+            results[label]=throughput_mbps
+            print(f"   ✓ Successful: {successful}/{num_conn}")
+            print(f"   ✓ Total time: {elapsed:.2f}s")
+            print(f"   ✓ Throughput: {throughput_mbps:.2f} Mbps")
+            print(f"   ✓ Avg latency: {avg_latency:.2f}s")
+            print()
+            await asyncio.sleep(1)
+        print(f"📊 Server processed {data_server.request_count} total requests\n")
+        return results
+    finally:
+        server.terminate()
+        client.terminate()
+        await data_server.stop()
         await asyncio.sleep(1)
-    print(f"📊 Server processed {data_server.request_count} total requests")
-    server.terminate()
-    client.terminate()
-    await data_server.stop()
-    await asyncio.sleep(1)
+
+async def test():
+    print("⚡ Concurrent Throughput Benchmark")
+    print("="*60)
+    print("Measuring: Performance with many concurrent connections\n")
+    if "uvloop" not in LOOPS:
+        print("ℹ️  uvloop not installed, measuring asyncio only\n")
+    by_loop={}
+    for event_loop in LOOPS:
+        results=await run_loop(event_loop)
+        if results is None:
+            return False
+        by_loop[event_loop]=results
+    if len(by_loop)>1:
+        baseline=by_loop[LOOPS[0]]
+        print(f"📈 Throughput vs {LOOPS[0]}")
+        for event_loop in LOOPS[1:]:
+            for label,mbps in by_loop[event_loop].items():
+                print(f"   {event_loop} {label}: {mbps:.2f} Mbps ({mbps/baseline[label]:.2f}x)")
     print("\n✅ Benchmark complete!")
     return True
 
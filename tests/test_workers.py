@@ -0,0 +1,178 @@
+#!/usr/bin/env python3.13
+import asyncio
+import os
+import re
+import socket
+import subprocess
+import time
+import sys
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+CPUS=os.cpu_count() or 1
+WORKERS=int(sys.argv[1]) if len(sys.argv)>1 else max(2,min(4,CPUS))
+CONNECTIONS=32
+RESPONSE_SIZE=4*1048576
+
+def get_free_port():
+    s=socket.socket(socket.AF_INET,socket.SOCK_STREAM)
+    s.bind(("127.0.0.1",0))
+    port=s.getsockname()[1]
+    s.close()
+    return port
+
+def write_test_configs(ws_port,tunnel_port,target_port,workers,worker_mode="process"):
+    server_log=f"/tmp/ghostwire-workers-server-{ws_port}.log"
+    server_cfg=f"""[server]
+listen_host="127.0.0.1"
+listen_port={ws_port}
+websocket_path="/ws"
+ping_timeout=10
+ws_pool_enabled=true
+ws_pool_children={max(4,workers*2)}
+ws_pool_min={max(2,workers*2)}
+workers={workers}
+worker_mode="{worker_mode}"
+udp_enabled=false
+auto_update=false
+
+[auth]
+token="test_token_123456"
+
+[tunnels]
+ports=["{tunnel_port}={target_port}"]
+
+[logging]
+level="info"
+file="{server_log}"
+"""
+    client_cfg=f"""[server]
+url="ws://127.0.0.1:{ws_port}/ws"
+token="test_token_123456"
+auto_update=false
+
+[reconnect]
+initial_delay=1
+max_delay=10
+multiplier=2
+
+[cloudflare]
+enabled=false
+ips=[]
+host=""
+check_interval=300
+
+[logging]
+level="info"
+file="/tmp/ghostwire-workers-client-{ws_port}.log"
+"""
+    server_path=f"/tmp/ghostwire-workers-server-{ws_port}.toml"
+    client_path=f"/tmp/ghostwire-workers-client-{ws_port}.toml"
+    with open(server_path,"w") as f:
+        f.write(server_cfg)
+    with open(client_path,"w") as f:
+        f.write(client_cfg)
+    return server_path,client_path,server_log
+
+def data_server_main(port):
+    payload=b"X"*RESPONSE_SIZE
+    async def handle(reader,writer):
+        try:
+            await reader.read(1024)
+            writer.write(b"HTTP/1.0 200 OK\r\nContent-Length: %d\r\n\r\n"%len(payload))
+            writer.write(payload)
+            await writer.drain()
+            writer.close()
+        except:
+            pass
+    async def serve():
+        server=await asyncio.start_server(handle,"127.0.0.1",port)
+        async with server:
+            await server.serve_forever()
+    asyncio.run(serve())
+
+async def download(port):
+    try:
+        reader,writer=await asyncio.wait_for(asyncio.open_connection("127.0.0.1",port),timeout=10)
+        writer.write(b"GET / HTTP/1.0\r\n\r\n")
+        await writer.drain()
+        total=0
+        while True:
+            chunk=await asyncio.wait_for(reader.read(262144),timeout=30)
+            if not chunk:
+                break
+            total+=len(chunk)
+        writer.close()
+        return total
+    except Exception:
+        return 0
+
+async def wait_for_tunnel(port,timeout=20):
+    deadline=time.time()+timeout
+    while time.time()<deadline:
+        if await download(port)>=RESPONSE_SIZE:
+            return True
+        await asyncio.sleep(0.5)
+    return False
+
+async def run_workers(workers):
+    ws_port=get_free_port()
+    tunnel_port=get_free_port()
+    target_port=get_free_port()
+    server_cfg,client_cfg,server_log=write_test_configs(ws_port,tunnel_port,target_port,workers)
+    target=subprocess.Popen([sys.executable,"-c",f"import sys;sys.path.insert(0,{os.path.dirname(os.path.abspath(__file__))!r});from test_workers import data_server_main;data_server_main({target_port})"],stdout=subprocess.DEVNULL,stderr=subprocess.DEVNULL)
+    server=subprocess.Popen([sys.executable,"server.py","-c",server_cfg],stdout=subprocess.DEVNULL,stderr=subprocess.DEVNULL)
+    await asyncio.sleep(2)
+    client=subprocess.Popen([sys.executable,"client.py","-c",client_cfg],stdout=subprocess.DEVNULL,stderr=subprocess.DEVNULL)
+    try:
+        print(f"🧪 workers={workers}")
+        if server.poll() is not None or not await wait_for_tunnel(tunnel_port):
+            print("   ❌ Tunnel did not come up")
+            return None
+        await asyncio.sleep(2)
+        start=time.time()
+        sizes=await asyncio.gather(*[download(tunnel_port) for _ in range(CONNECTIONS)])
+        elapsed=time.time()-start
+        complete=sum(1 for size in sizes if size>=RESPONSE_SIZE)
+        mbps=sum(sizes)*8/1000000/elapsed
+        with open(server_log) as f:
+            log=f.read()
+        joined=len(set(re.findall(r"Worker (\d+) joined main session",log)))
+        print(f"   ✓ Complete: {complete}/{CONNECTIONS} ({RESPONSE_SIZE//1048576}MB each)")
+        print(f"   ✓ Throughput: {mbps:.1f} Mbps in {elapsed:.2f}s")
+        if workers>1:
+            print(f"   ✓ Workers serving child channels besides the session owner: {joined}")
+        return mbps if complete==CONNECTIONS else None
+    finally:
+        client.terminate()
+        server.terminate()
+        target.terminate()
+        for process in (client,server,target):
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+async def test():
+    print("🧵 Multi-worker Server Benchmark")
+    print("="*60)
+    print(f"   {CPUS} CPUs, {CONNECTIONS} concurrent {RESPONSE_SIZE//1048576}MB downloads\n")
+    single=await run_workers(1)
+    if single is None:
+        return False
+    sharded=await run_workers(WORKERS)
+    if sharded is None:
+        print("❌ Sharded server dropped connections")
+        return False
+    print(f"\n📈 workers={WORKERS} vs workers=1: {sharded/single:.2f}x")
+    if CPUS<WORKERS:
+        print(f"ℹ️  Only {CPUS} CPU(s) available, workers share cores so no speedup is expected")
+    print("\n✅ Benchmark complete!")
+    return True
+
+if __name__=="__main__":
+    try:
+        result=asyncio.run(test())
+        sys.exit(0 if result else 1)
+    except KeyboardInterrupt:
+        print("\nInterrupted")
+        sys.exit(1)
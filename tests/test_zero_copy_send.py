@@ -0,0 +1,141 @@
+#!/usr/bin/env python3.13
+import asyncio
+import os
+import sys
+import time
+import tracemalloc
+from types import SimpleNamespace
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import aiohttp
+from aiohttp import web
+from protocol import *
+from outbound import OutboundQueue
+from aiohttp_ws_transport import AiohttpWebSocketAdapter
+from server import GhostWireServer
+
+STALLED_FRAMES=200
+STALLED_FRAME_BYTES=40000
+
+class SinkTransport:
+    def __init__(self):
+        self.sent=0
+    async def send(self,data):
+        self.sent+=len(data)
+
+async def send_joined(sink,batch,key,pool):
+    frames=await pack_messages(batch,key)
+    await sink.send(frames[0] if len(frames)==1 else b"".join(frames))
+
+async def send_into(sink,batch,key,pool):
+    buffer,view=await pack_messages_into(batch,key,pool)
+    try:
+        await sink.send(view)
+    finally:
+        del view
+        pool.release(buffer)
+
+async def measure(send,key,batch,rounds):
+    sink=SinkTransport()
+    pool=BatchBufferPool()
+    await send(sink,batch,key,pool)
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    baseline=tracemalloc.get_traced_memory()[0]
+    await send(sink,batch,key,pool)
+    peak=tracemalloc.get_traced_memory()[1]-baseline
+    tracemalloc.stop()
+    payload_bytes=sum(len(frame[2]) for frame in batch)
+    sink.sent=0
+    start=time.perf_counter()
+    for _ in range(rounds):
+        await send(sink,batch,key,pool)
+    elapsed=time.perf_counter()-start
+    return peak/payload_bytes,sink.sent/elapsed/1048576
+
+async def verify(key):
+    pool=BatchBufferPool()
+    batch=[data_frame(1,b"a"*100),await pack_ping(5,key),close_frame(2,0),data_frame(3,os.urandom(SEAL_INTO_MIN+1000))]
+    buffer,view=await pack_messages_into(batch,key,pool)
+    decoder=FrameDecoder()
+    got=[await open_frame(*frame,key) for frame in decoder.feed(bytes(view))]
+    view.release()
+    pool.release(buffer)
+    reused,reused_view=await pack_messages_into(batch[:1],key,pool)
+    reused_view.release()
+    expected=[batch[0],(MSG_PING,0,struct.pack("!Q",5)),batch[2],batch[3]]
+    return got==expected and reused is buffer
+
+async def stalled_peer(key):
+    owner=SimpleNamespace(ws_send_batch_bytes=16384,config=SimpleNamespace(batch_latency_ms=0),key=key,implicit_nonces=False,cipher=None)
+    outbound=OutboundQueue()
+    sender=None
+    async def handler(request):
+        nonlocal sender
+        ws=web.WebSocketResponse(max_msg_size=0,compress=False)
+        await ws.prepare(request)
+        sender=asyncio.create_task(GhostWireServer.sender_task(owner,AiohttpWebSocketAdapter(ws,request),outbound))
+        await sender
+        return ws
+    app=web.Application()
+    app.router.add_get("/ws",handler)
+    runner=web.AppRunner(app)
+    await runner.setup()
+    site=web.TCPSite(runner,"127.0.0.1",0)
+    await site.start()
+    port=site._server.sockets[0].getsockname()[1]
+    payloads=[os.urandom(STALLED_FRAME_BYTES) for _ in range(8)]
+    received=0
+    try:
+        async with aiohttp.ClientSession() as session:
+            async with session.ws_connect(f"http://127.0.0.1:{port}/ws",max_msg_size=0) as ws:
+                for index in range(STALLED_FRAMES):
+                    await outbound.data.put(data_frame(index,payloads[index%len(payloads)]))
+                await asyncio.sleep(1)
+                decoder=FrameDecoder()
+                expected=0
+                while expected<STALLED_FRAMES and not sender.done():
+                    msg=await asyncio.wait_for(ws.receive(),timeout=10)
+                    if msg.type!=aiohttp.WSMsgType.BINARY:
+                        break
+                    for frame in decoder.feed(msg.data):
+                        _,conn_id,data=await open_frame(*frame,key)
+                        if conn_id!=expected or data!=payloads[expected%len(payloads)]:
+                            return 0
+                        expected+=1
+                        received+=len(data)
+    except asyncio.TimeoutError:
+        pass
+    finally:
+        outbound.stop_event.set()
+        await runner.cleanup()
+    return received
+
+async def test():
+    print("📦 In-place Frame Assembly Benchmark")
+    print("="*60)
+    key=os.urandom(32)
+    await calibrate_crypto_dispatch()
+    if not await verify(key):
+        print("❌ In-place batch failed to decode or buffer was not recycled")
+        return False
+    print("✅ In-place batches decode and buffers are recycled\n")
+    received=await stalled_peer(key)
+    if received!=STALLED_FRAMES*STALLED_FRAME_BYTES:
+        print(f"❌ Batches to a stalled peer were lost: {received:,} of {STALLED_FRAMES*STALLED_FRAME_BYTES:,} bytes delivered")
+        return False
+    print(f"✅ {STALLED_FRAME_BYTES//1000}KB batches queued behind a stalled peer arrive intact\n")
+    for label,batch,rounds in (("64 x 1KB",[data_frame(i,os.urandom(1024)) for i in range(64)],3000),("8 x 16KB",[data_frame(i,os.urandom(16384)) for i in range(8)],3000),("1 x 256KB",[data_frame(1,os.urandom(262144))],800)):
+        joined_copies,joined_rate=await measure(send_joined,key,batch,rounds)
+        into_copies,into_rate=await measure(send_into,key,batch,rounds)
+        print(f"🧪 {label}")
+        print(f"   join per batch:   {joined_copies:.2f} bytes allocated per byte sent, {joined_rate:,.0f} MB/s")
+        print(f"   in-place pooled:  {into_copies:.2f} bytes allocated per byte sent, {into_rate:,.0f} MB/s\n")
+    print("✅ Benchmark complete!")
+    return True
+
+try:
+    result=asyncio.run(test())
+    sys.exit(0 if result else 1)
+except KeyboardInterrupt:
+    print("\nInterrupted")
+    sys.exit(1)
@@ -0,0 +1,32 @@
+import threading
+
+class ThreadStats:
+    def __init__(self,factory):
+        self.factory=factory
+        self.local=threading.local()
+        self.lock=threading.Lock()
+        self.shards=[]
+
+    def get(self):
+        try:
+            return self.local.stats
+        except AttributeError:
+            stats=self.local.stats=self.factory()
+            with self.lock:
+                self.shards.append(stats)
+            return stats
+
+    def sum(self):
+        with self.lock:
+            shards=list(self.shards)
+        total=self.factory()
+        for stats in shards:
+            _merge(total,stats)
+        return total
+
+def _merge(total,stats):
+    for key,value in list(stats.items()):
+        if isinstance(value,dict):
+            _merge(total.setdefault(key,{}),value)
+        else:
+            total[key]=total.get(key,0)+value
@@ -64,49 +64,270 @@ class TunnelConnection:
         except:
             pass
 
-class TunnelManager:
+class ConnState:
+    __slots__=("connection","channel","write_queue","write_task","tx_seq","striped","rx_expected","rx_pending","rx_wait_start","close_seq")
+
+    def __init__(self):
+        self.connection=None
+        self.channel=None
+        self.write_queue=None
+        self.write_task=None
+        self.reset()
+
+    def reset(self):
+        self.tx_seq=0
+        self.striped=False
+        self.rx_expected=0
+        self.rx_pending=None
+        self.rx_wait_start=None
+        self.close_seq=None
+
+    def idle(self):
+        return self.connection is None and self.channel is None and self.write_task is None and not self.striped and not self.rx_expected and self.rx_pending is None and self.close_seq is None
+
+def _close_connection(conn):
+    try:
+        if isinstance(conn,tuple):
+            _,writer=conn
+            writer.close()
+        else:
+            conn.close()
+    except:
+        pass
+
+def channel_open(channel):
+    ws=channel.get("ws")
+    return ws is not None and getattr(ws,"close_code",None) is None
+
+def queued_bytes(queue):
+    held=getattr(queue,"held",None)
+    return held[0] if held else 0
+
+class ChannelRegistry(dict):
     def __init__(self):
-        self.connections={}
-        self.connection_locks={}
-        self.next_conn_id=1
+        super().__init__()
+        self.members={}
+        self.available=[]
+        self.positions={}
+        self.rr_index=0
+
+    def __setitem__(self,channel_id,channel):
+        super().__setitem__(channel_id,channel)
+        if channel_open(channel):
+            self.mark_available(channel_id)
+        else:
+            self.mark_unavailable(channel_id)
+
+    def __delitem__(self,channel_id):
+        super().__delitem__(channel_id)
+        self.mark_unavailable(channel_id)
+
+    def pop(self,channel_id,*default):
+        self.mark_unavailable(channel_id)
+        return super().pop(channel_id,*default)
+
+    def clear(self):
+        super().clear()
+        self.available.clear()
+        self.positions.clear()
+
+    def mark_available(self,channel_id):
+        if channel_id not in self.positions:
+            self.positions[channel_id]=len(self.available)
+            self.available.append(channel_id)
+
+    def mark_unavailable(self,channel_id):
+        position=self.positions.pop(channel_id,None)
+        if position is None:
+            return
+        last=self.available.pop()
+        if last!=channel_id:
+            self.available[position]=last
+            self.positions[last]=position
+
+    def live(self,channel_id):
+        channel=self.get(channel_id)
+        if channel is not None and channel_open(channel):
+            return True
+        self.mark_unavailable(channel_id)
+        return False
+
+    def available_ids(self):
+        for channel_id in list(self.available):
+            self.live(channel_id)
+        return list(self.available)
+
+    def available_count(self):
+        return len(self.available)
+
+    def conn_count(self,channel_id):
+        members=self.members.get(channel_id)
+        return len(members) if members else 0
+
+    def next_available(self):
+        while self.available:
+            channel_id=self.available[self.rr_index%len(self.available)]
+            self.rr_index+=1
+            if self.live(channel_id):
+                return channel_id
+        return None
+
+    def least_loaded(self,conn_weight=10,byte_unit=16384):
+        best_child=None
+        min_load=float("inf")
+        for channel_id in list(self.available):
+            if not self.live(channel_id):
+                continue
+            load_score=queued_bytes(self[channel_id].get("send_queue"))//byte_unit+self.conn_count(channel_id)*conn_weight
+            if load_score<min_load:
+                min_load=load_score
+                best_child=channel_id
+        return best_child
+
+    def least_queued(self,lane):
+        best_child=None
+        min_depth=float("inf")
+        for channel_id in list(self.available):
+            if not self.live(channel_id):
+                continue
+            queue=self[channel_id].get(lane)
+            if queue is None:
+                continue
+            depth=queue.qsize()
+            if depth<min_depth:
+                min_depth=depth
+                best_child=channel_id
+        return best_child
+
+    def assign(self,conn_id,old,new):
+        if old==new:
+            return
+        if old is not None:
+            members=self.members.get(old)
+            if members:
+                members.discard(conn_id)
+                if not members:
+                    del self.members[old]
+        if new is not None:
+            self.members.setdefault(new,set()).add(conn_id)
+
+class TunnelManager:
+    def __init__(self,first_conn_id=1,conn_id_stride=1):
+        self.conns={}
+        self.channels=ChannelRegistry()
+        self.active=0
+        self.striped=0
+        self.first_conn_id=first_conn_id
+        self.conn_id_stride=conn_id_stride
+        self.next_conn_id=first_conn_id
 
     def generate_conn_id(self):
         conn_id=self.next_conn_id
-        self.next_conn_id=(self.next_conn_id+1)%0xFFFFFFFF
+        self.next_conn_id+=self.conn_id_stride
+        if self.next_conn_id>=0xFFFFFFFF:
+            self.next_conn_id=self.first_conn_id
         return conn_id
 
+    def state(self,conn_id):
+        state=self.conns.get(conn_id)
+        if state is None:
+            state=self.conns[conn_id]=ConnState()
+        return state
+
+    def prune(self,conn_id,state):
+        if state.idle() and self.conns.get(conn_id) is state:
+            del self.conns[conn_id]
+
+    def reset_data(self,state):
+        if state.striped:
+            self.striped-=1
+        state.reset()
+
+    def mark_striped(self,state):
+        if not state.striped:
+            state.striped=True
+            self.striped+=1
+
     def add_connection(self,conn_id,connection):
-        self.connections[conn_id]=connection
-        self.connection_locks[conn_id]=asyncio.Lock()
+        state=self.state(conn_id)
+        if state.connection is None:
+            self.active+=1
+        state.connection=connection
 
     def get_connection(self,conn_id):
-        return self.connections.get(conn_id)
+        state=self.conns.get(conn_id)
+        return state.connection if state else None
+
+    def active_count(self):
+        return self.active
+
+    def set_channel(self,conn_id,channel):
+        state=self.state(conn_id)
+        self.channels.assign(conn_id,state.channel,channel)
+        state.channel=channel
+
+    def get_channel(self,conn_id,default=None):
+        state=self.conns.get(conn_id)
+        return state.channel or default if state else default
+
+    def pop_channel(self,conn_id):
+        state=self.conns.get(conn_id)
+        if state:
+            self.channels.assign(conn_id,state.channel,None)
+            state.channel=None
+            self.prune(conn_id,state)
+
+    def clear_channels(self):
+        for conn_id,state in list(self.conns.items()):
+            state.channel=None
+            self.prune(conn_id,state)
+        self.channels.members.clear()
+
+    def channel_conns(self,channel):
+        return list(self.channels.members.get(channel,()))
+
+    def clear_data(self,conn_id):
+        state=self.conns.get(conn_id)
+        if state:
+            self.reset_data(state)
+            self.prune(conn_id,state)
+
+    def clear_writers(self):
+        for conn_id,state in list(self.conns.items()):
+            task=state.write_task
+            if task and not task.done():
+                task.cancel()
+            state.write_queue=None
+            state.write_task=None
+            self.reset_data(state)
+            self.prune(conn_id,state)
+
+    def pop_writer(self,conn_id):
+        state=self.conns.get(conn_id)
+        if state:
+            state.write_queue=None
+            state.write_task=None
+            self.prune(conn_id,state)
 
-    def get_connection_lock(self,conn_id):
-        return self.connection_locks.get(conn_id)
+    def striped_count(self):
+        return self.striped
 
     def remove_connection(self,conn_id):
-        conn=self.connections.pop(conn_id,None)
-        self.connection_locks.pop(conn_id,None)
-        if conn:
-            try:
-                if isinstance(conn,tuple):
-                    _,writer=conn
-                    writer.close()
-                else:
-                    conn.close()
-            except:
-                pass
+        state=self.conns.pop(conn_id,None)
+        if not state:
+            return
+        self.channels.assign(conn_id,state.channel,None)
+        if state.striped:
+            self.striped-=1
+        if state.connection:
+            self.active-=1
+            _close_connection(state.connection)
 
     def close_all(self):
-        for conn in list(self.connections.values()):
-            try:
-                if isinstance(conn,tuple):
-                    _,writer=conn
-                    writer.close()
-                else:
-                    conn.close()
-            except:
-                pass
-        self.connections.clear()
-        self.connection_locks.clear()
+        for state in list(self.conns.values()):
+            if state.connection:
+                _close_connection(state.connection)
+        self.conns.clear()
+        self.channels.members.clear()
+        self.active=0
+        self.striped=0
@@ -10,7 +10,7 @@ logger=logging.getLogger(__name__)
 HELLO=b'\xff'
 
 def _split_send(data,send_fn):
-    buf=data if isinstance(data,(bytes,bytearray)) else bytes(data)
+    buf=data if isinstance(data,(bytes,bytearray,memoryview)) else bytes(data)
     offset=0
     while offset+9<=len(buf):
         payload_len=struct.unpack_from("!I",buf,offset+5)[0]
@@ -95,7 +95,7 @@ class UDPClientTransport:
                 if msg_type!=MSG_PUBKEY:
                     continue
                 server_public_key,auth_salt=unpack_pubkey_payload(pubkey_bytes)
-                client_private_key,client_public_key=generate_rsa_keypair()
+                client_private_key,client_public_key=await acquire_rsa_keypair()
                 self._transport.sendto(pack_auth_message(self.token,server_public_key,role="main",auth_salt=auth_salt))
                 self._transport.sendto(pack_pubkey(client_public_key))
                 session_data=await asyncio.wait_for(self._recv_queue.get(),timeout=5)
@@ -278,7 +278,8 @@ async def start_udp_local_listeners(ghost_server):
     for local_ip,local_port,remote_ip,remote_port in ghost_server.config.port_mappings:
         transport,_=await loop.create_datagram_endpoint(
             lambda rip=remote_ip,rport=remote_port: _UDPLocalListener(ghost_server,rip,rport),
-            local_addr=(local_ip,local_port)
+            local_addr=(local_ip,local_port),
+            reuse_port=True if ghost_server.shard else None
         )
         transports.append(transport)
         logger.info(f"UDP listening on {local_ip}:{local_port} -> {remote_ip}:{remote_port}")
@@ -0,0 +1,234 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import sys
+import threading
+import time
+from multiprocessing.connection import wait
+from memory import governor
+from protocol import ReplayCache,HELLO_MAX_SKEW,generate_rsa_keypair
+
+logger=logging.getLogger(__name__)
+
+SHARDED_PROTOCOLS=("websocket","aiohttp-ws")
+RESPAWN_DELAY=1
+
+def sharding_unsupported(config):
+    if config.protocol not in SHARDED_PROTOCOLS:
+        return f"protocol {config.protocol} is not supported"
+    if not config.ws_pool_enabled:
+        return "ws_pool_enabled is off"
+    return None
+
+def gil_enabled():
+    return getattr(sys,"_is_gil_enabled",lambda:True)()
+
+class ShardLink:
+    def __init__(self,index,count,conn,secrets,threaded=False):
+        self.index=index
+        self.count=count
+        self.conn=conn
+        self.secrets=secrets
+        self.threaded=threaded
+        self.active=False
+        self.child_count=0
+        self.loads={}
+        self.pending={}
+        self.next_request=0
+        self.server=None
+
+    def attach(self,server):
+        self.server=server
+        asyncio.get_running_loop().add_reader(self.conn.fileno(),self.on_readable)
+
+    def send(self,*message):
+        try:
+            self.conn.send(message)
+        except (OSError,ValueError) as e:
+            logger.warning(f"Worker {self.index} lost coordinator: {e}")
+
+    async def request(self,*message):
+        request_id=self.next_request
+        self.next_request+=1
+        future=asyncio.get_running_loop().create_future()
+        self.pending[request_id]=future
+        self.send("request",request_id,*message)
+        try:
+            return await asyncio.wait_for(future,timeout=5)
+        finally:
+            self.pending.pop(request_id,None)
+
+    def on_readable(self):
+        try:
+            message=self.conn.recv()
+        except (EOFError,OSError):
+            asyncio.get_running_loop().remove_reader(self.conn.fileno())
+            logger.error(f"Worker {self.index} lost coordinator, shutting down")
+            self.server.stop()
+            return
+        if message[0]=="reply":
+            future=self.pending.get(message[1])
+            if future and not future.done():
+                future.set_result(message[2])
+            return
+        if message[0]=="stop":
+            self.server.stop()
+            return
+        self.server.on_shard_message(message)
+
+    def child_quota(self):
+        return max(1,-(-self.child_count//self.count))
+
+    def remote_load(self):
+        active=sum(load[0] for load in self.loads.values())
+        queued=sum(load[1] for load in self.loads.values())
+        return active,queued
+
+def _worker_main(target,config,shard,inherited):
+    for conn in inherited:
+        conn.close()
+    signal.signal(signal.SIGTERM,signal.SIG_DFL)
+    signal.signal(signal.SIGINT,signal.SIG_DFL)
+    target(config,shard)
+
+def _thread_main(target,config,shard):
+    try:
+        target(config,shard)
+    finally:
+        shard.conn.close()
+
+class Coordinator:
+    def __init__(self,config,target,threads=False):
+        self.config=config
+        self.target=target
+        self.count=config.workers
+        self.threads=threads
+        self.context=multiprocessing.get_context("fork")
+        logger.info("Generating RSA key pair for secure authentication...")
+        private_key,public_key=generate_rsa_keypair()
+        self.secrets={"private_key":private_key,"public_key":public_key,"ticket_key":os.urandom(32)}
+        self.replay={"ticket":ReplayCache(config.session_ticket_lifetime),"hello":ReplayCache(HELLO_MAX_SKEW*2)}
+        self.workers={}
+        self.owner=None
+        self.session=None
+        self.child_count=0
+        self.running=True
+        config.ws_pool_min=max(config.ws_pool_min,self.count)
+        config.ws_pool_children=max(config.ws_pool_children,config.ws_pool_min)
+        if threads:
+            governor.share_between_threads()
+
+    def spawn(self,index):
+        parent_conn,child_conn=self.context.Pipe()
+        shard=ShardLink(index,self.count,child_conn,self.secrets,self.threads)
+        if self.threads:
+            worker=threading.Thread(target=_thread_main,args=(self.target,self.config,shard),name=f"ghostwire-loop-{index}",daemon=True)
+            worker.start()
+        else:
+            inherited=[conn for _,conn in self.workers.values()]+[parent_conn]
+            worker=self.context.Process(target=_worker_main,args=(self.target,self.config,shard,inherited),name=f"ghostwire-worker-{index}")
+            worker.start()
+            child_conn.close()
+        self.workers[index]=(worker,parent_conn)
+        if self.child_count:
+            self.send(index,("pool",self.child_count))
+        if self.session:
+            self.send(index,("session",*self.session))
+        logger.info(f"Worker {index} started ({f'thread {worker.native_id}' if self.threads else f'pid {worker.pid}'})")
+
+    def send(self,index,message):
+        worker=self.workers.get(index)
+        if not worker:
+            return
+        try:
+            worker[1].send(message)
+        except (OSError,ValueError) as e:
+            logger.warning(f"Failed to reach worker {index}: {e}")
+
+    def broadcast(self,message,skip=None):
+        for index in list(self.workers):
+            if index!=skip:
+                self.send(index,message)
+
+    def end_session(self):
+        self.owner=None
+        self.session=None
+        self.broadcast(("closed",))
+
+    def handle_request(self,index,name,*args):
+        if name=="claim":
+            if self.owner is None:
+                self.owner=index
+                return True
+            return self.owner==index
+        if name=="replay":
+            kind,token=args
+            return self.replay[kind].check(token)
+        return None
+
+    def dispatch(self,index,message):
+        kind=message[0]
+        if kind=="request":
+            self.send(index,("reply",message[1],self.handle_request(index,*message[2:])))
+        elif kind=="session" and self.owner==index:
+            self.session=message[1:]
+            self.broadcast(message,skip=index)
+        elif kind=="closed" and self.owner==index:
+            logger.info(f"Main session on worker {index} ended")
+            self.session=None
+            self.owner=None
+            self.broadcast(message,skip=index)
+        elif kind=="pool":
+            self.child_count=message[1]
+            self.broadcast(message,skip=index)
+        elif kind=="load" and self.owner is not None and self.owner!=index:
+            self.send(self.owner,("load",index,*message[1:]))
+
+    def reap(self,index):
+        worker,conn=self.workers.pop(index)
+        conn.close()
+        worker.join(1)
+        if not self.running:
+            return
+        logger.warning(f"Worker {index} exited with code {getattr(worker,'exitcode',None)}, restarting")
+        if self.owner==index:
+            self.end_session()
+        time.sleep(RESPAWN_DELAY)
+        self.spawn(index)
+
+    def stop(self,*_):
+        self.running=False
+
+    def run(self):
+        signal.signal(signal.SIGTERM,self.stop)
+        signal.signal(signal.SIGINT,self.stop)
+        logger.info(f"Starting {self.count} server {'event loop threads' if self.threads else 'workers'} sharing {self.config.listen_host}:{self.config.listen_port}")
+        for index in range(self.count):
+            self.spawn(index)
+        while self.running:
+            conns={conn:index for index,(_,conn) in self.workers.items()}
+            for ready in wait(list(conns),timeout=1):
+                if conns[ready] not in self.workers:
+                    continue
+                try:
+                    message=ready.recv()
+                except (EOFError,OSError):
+                    continue
+                self.dispatch(conns[ready],message)
+            for index,(worker,_) in list(self.workers.items()):
+                if not worker.is_alive():
+                    self.reap(index)
+        logger.info("Stopping server workers")
+        for index,(worker,_) in self.workers.items():
+            if self.threads:
+                self.send(index,("stop",))
+            else:
+                worker.terminate()
+        deadline=time.time()+5
+        for worker,conn in self.workers.values():
+            worker.join(max(0,deadline-time.time()))
+            if not self.threads and worker.is_alive():
+                worker.kill()
+            conn.close()